@@ -0,0 +1,313 @@
+"""Clearance rules engine throughput on synthetic ACORD submissions.
+
+Generates a producer list and a mix of submissions (every supported state,
+umbrella/towing/garage/trucking/logging descriptions, unknown agencies,
+missing fields, past and far-out effective dates), then measures:
+
+  inline   RULES.evaluate one submission at a time in this process
+  batch    BatchEvaluator.stream at each --workers count (0 = inline)
+  http     POST /clearance/batch through the Quart app, NDJSON in and out
+  evaluate POST /clearance/evaluate one at a time through the served app
+           (analyzer attached), every description new; fails if a
+           non-blocking backend's evaluations wait out the batch window
+  describe the submissions' descriptions through DescriptionAnalyzer against
+           a stub model with --model-latency-ms per call, concurrently, once
+           uncached (one model call each) and once cached and batched
+
+and reports submissions per second, time to the first streamed decision and
+the decision mix, so a change to the rules or the pool can be compared run
+to run.
+
+Usage:
+  python benchmarks/bench_clearance.py --submissions 5000 --workers 0 1 2 4 8
+  python benchmarks/bench_clearance.py --chunk 8 64 --scenarios batch
+  python benchmarks/bench_clearance.py --scenarios describe --model-latency-ms 300
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import copy
+import json
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+
+# No producer source: the benchmark loads its own synthetic list.
+os.environ["PRODUCER_LIST"] = ""
+os.environ["PRODUCER_WORKBOOK"] = ""
+
+import clearance_api  # noqa: E402
+from clearance_batch import BatchEvaluator  # noqa: E402
+from clearance_services import SUPPORTED_STATES  # noqa: E402
+from description_analysis import AnalysisCache, DescriptionAnalyzer, StubBackend  # noqa: E402
+from quart import Quart  # noqa: E402
+
+SCENARIOS = ("inline", "batch", "http", "describe", "evaluate")
+
+WORDS = ["Gulf", "Coast", "Bayou", "Pelican", "Lone", "Star", "Delta", "Magnolia", "Red", "River", "Pine", "Summit"]
+DESCRIPTIONS = [
+    "Restaurant and bar serving lunch and dinner",
+    "Towing and wrecker service with roadside assistance",
+    "Marine towing and salvage of pleasure boats",
+    "Used car dealer lot with 40 vehicles",
+    "Auto repair shop, brakes and tire installation",
+    "For hire trucking, hauls sand, dirt and gravel",
+    "Hauls logs from the woods to the mill, mechanized logger",
+    "Lumber yard selling treated wood and finished products",
+    "Roofing contractor, residential and commercial",
+    "Lessors risk only office building",
+    "Trash and roll-off container hauling",
+]
+LOBS = [
+    {"business_auto": {"value": True}},
+    {"business_auto": {"value": True}, "general_liability": {"value": True}},
+    {"general_liability": {"value": True}, "commercial_umbrella": {"value": True}},
+    {"commercial_property": {"value": True}, "inland_marine": {"value": True}, "general_liability": {"value": True}},
+    {"garage": {"value": True}},
+]
+
+
+def synthetic_producers(n: int, rng: random.Random) -> list[dict]:
+    return [
+        {
+            "Agency Name": f"{rng.choice(WORDS)} {rng.choice(WORDS)} {i} Insurance Agency, LLC",
+            "Location": rng.choice(["Baton Rouge", "Dallas", "Jackson", "Denver"]),
+            "Agent": f"Agent{i}, Pat",
+            "Lead UW": f"Underwriter {i % 9}",
+            "Logging Lead": "Strickland, Angie" if i % 4 == 0 else "",
+        }
+        for i in range(n)
+    ]
+
+
+def synthetic_submission(i: int, producers: list[dict], rng: random.Random, today: date) -> dict:
+    producer = rng.choice(producers)
+    agency = producer["Agency Name"]
+    roll = rng.random()
+    if roll < 0.05:
+        agency = "Unlisted Brokerage Partners"
+    elif roll < 0.10:
+        agency = agency.replace("Insurance", "Insurnace").replace(", LLC", "")
+    state = rng.choice(SUPPORTED_STATES + ("NY",)) if rng.random() < 0.97 else ""
+    days = rng.choice([-30, 0, 10, 45, 90, 200])
+    effective = (today + timedelta(days=days)).strftime("%m/%d/%Y")
+    return {
+        "id": f"sub-{i}",
+        "input_data": {
+            "accord_form_fields": {
+                "address_information": {
+                    "state": {"value": state},
+                    "street_address": {"value": f"{i} Main St"},
+                    "zip_code": {"value": "" if rng.random() < 0.02 else "70801"},
+                    "state_fullname": {"value": ""},
+                },
+                "applicant_insured_information": {
+                    "insured_name": {"value": f"Insured {i} LLC"},
+                    "general_business_description": {"value": rng.choice(DESCRIPTIONS)},
+                },
+                "producer_agent_information": {
+                    "agent_name": {"value": producer["Agent"]},
+                    "agency_name": {"value": agency},
+                    "agency_location": {"value": producer["Location"]},
+                    "underwriter": {"value": ""},
+                    "house_account_flow_indicated": {"value": False},
+                },
+                "lines_of_business_premium": rng.choice(LOBS),
+                "submission_policy_information": {
+                    "proposed_effective_date": {"value": effective},
+                    "processing_status": {"value": ""},
+                },
+                "prior_carrier_information": {"prior_carrier_name": {"value": None}},
+            }
+        },
+    }
+
+
+def inline(items: list, today: str) -> dict:
+    start = time.perf_counter()
+    for item in items:
+        clearance_api.RULES.evaluate(item["input_data"], today=today)
+    elapsed = time.perf_counter() - start
+    return {"elapsed_s": elapsed, "first_ms": None, "mix": None}
+
+
+async def batch(evaluator: BatchEvaluator, items: list, today: str) -> dict:
+    mix: Counter = Counter()
+    first = None
+    start = time.perf_counter()
+    async for result in evaluator.stream(items, {"today": today}):
+        if first is None:
+            first = time.perf_counter() - start
+        mix[result.get("decline_reason") or result.get("assignment_reason") or result.get("error")] += 1
+    return {"elapsed_s": time.perf_counter() - start, "first_ms": round(first * 1000, 1), "mix": mix}
+
+
+async def http(items: list, today: str) -> dict:
+    app = Quart(__name__)
+    app.register_blueprint(clearance_api.clearance)
+    body = "\n".join(json.dumps(item) for item in items)
+    client = app.test_client()
+    start = time.perf_counter()
+    response = await client.post(
+        f"/clearance/batch?today={today}", data=body, headers={"Content-Type": "application/x-ndjson"}
+    )
+    lines = (await response.get_data()).splitlines()
+    elapsed = time.perf_counter() - start
+    trailer = json.loads(lines[-1])
+    if trailer.get("count") != len(items) or len(lines) != len(items) + 1:
+        raise RuntimeError(f"Batch incomplete: {trailer}")
+    return {"elapsed_s": elapsed, "first_ms": None, "mix": None}
+
+
+async def evaluate(items: list, today: str) -> dict:
+    app = Quart(__name__)
+    app.register_blueprint(clearance_api.clearance)
+    analyzer = clearance_api.ANALYZER
+    engine_us = []
+    # Serving runs the blueprint's startup, which attaches the analyzer to the loop.
+    async with app.test_app() as test_app:
+        client = test_app.test_client()
+        start = time.perf_counter()
+        for i, item in enumerate(items):
+            item = copy.deepcopy(item)
+            described = item["input_data"]["accord_form_fields"]["applicant_insured_information"]["general_business_description"]
+            described["value"] = f"{described['value']} #{i}"  # a cache miss every time
+            response = await client.post("/clearance/evaluate", json={**item, "today": today, "trace": False})
+            if response.status_code != 200:
+                raise RuntimeError(f"/clearance/evaluate answered {response.status_code}")
+            engine_us.append((await response.get_json())["elapsed_us"])
+        elapsed = time.perf_counter() - start
+    engine_us.sort()
+    median = engine_us[len(engine_us) // 2]
+    if not analyzer.backend.blocking and median >= analyzer.batch_window * 1e6:
+        raise RuntimeError(
+            f"{analyzer.backend.name} evaluations take {median:.0f} us: waiting on the "
+            f"{analyzer.batch_window * 1000:g} ms batch window"
+        )
+    return {"elapsed_s": elapsed, "first_ms": None, "mix": None, "engine_median_us": median}
+
+
+async def describe(items: list, latency: float, *, cached: bool, concurrency: int = 64) -> dict:
+    texts = [
+        item["input_data"]["accord_form_fields"]["applicant_insured_information"]["general_business_description"]["value"]
+        for item in items
+    ]
+    backend = StubBackend(latency)
+    analyzer = DescriptionAnalyzer(backend, AnalysisCache())
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(concurrency))
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one(text: str) -> None:
+        async with gate:
+            if cached:
+                await analyzer.analyze(text)
+            else:
+                # One model call per submission, as without the analysis layer.
+                await loop.run_in_executor(None, backend.analyze_batch, [text])
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(text) for text in texts))
+    elapsed = time.perf_counter() - start
+    stats = analyzer.stats()
+    return {
+        "elapsed_s": elapsed,
+        "first_ms": None,
+        "mix": None,
+        "model_calls": backend.calls,
+        "coalesced": stats["coalesced"],
+        "hit_rate": stats["cache"]["hit_rate"],
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    p.add_argument("--submissions", type=int, default=2000)
+    p.add_argument("--producers", type=int, default=2000)
+    p.add_argument("--workers", type=int, nargs="+", default=[0, 1, 2, os.cpu_count() or 1])
+    p.add_argument("--chunk", type=int, nargs="+", default=[32])
+    p.add_argument("--model-latency-ms", type=float, default=200)
+    p.add_argument("--seed", type=int, default=7)
+    ns = p.parse_args()
+
+    rng = random.Random(ns.seed)
+    today = date.today()
+    producers = synthetic_producers(ns.producers, rng)
+    clearance_api.PRODUCERS.apply(producers)
+    items = [synthetic_submission(i, producers, rng, today) for i in range(ns.submissions)]
+    today_str = today.strftime("%m/%d/%Y")
+
+    rows = []
+
+    def record(scenario: str, workers, chunk, outcome: dict) -> None:
+        row = {
+            "scenario": scenario,
+            "workers": workers,
+            "chunk": chunk,
+            "submissions": len(items),
+            "per_second": round(len(items) / outcome["elapsed_s"], 1),
+            "us_per_submission": round(outcome["elapsed_s"] / len(items) * 1e6, 1),
+            "first_result_ms": outcome["first_ms"],
+            **{k: outcome[k] for k in ("model_calls", "coalesced", "hit_rate", "engine_median_us") if k in outcome},
+        }
+        print(json.dumps(row), file=sys.stderr, flush=True)
+        rows.append(row)
+        if outcome["mix"]:
+            mix_holder.update(outcome["mix"])
+
+    mix_holder: Counter = Counter()
+    if "inline" in ns.scenarios:
+        inline(items[:200], today_str)  # warm up regex and dict caches
+        record("inline", None, None, inline(items, today_str))
+
+    if "describe" in ns.scenarios:
+        latency = ns.model_latency_ms / 1000
+        record("describe_uncached", None, None, asyncio.run(describe(items, latency, cached=False)))
+        record("describe_cached", None, None, asyncio.run(describe(items, latency, cached=True)))
+
+    pool_scenarios = {"batch", "http"} & set(ns.scenarios)
+    for chunk in ns.chunk if pool_scenarios else ():
+        for workers in ns.workers:
+            evaluator = BatchEvaluator(
+                clearance_api.RULES, clearance_api.PRODUCERS, clearance_api.CLEARANCE_CONFIG["flow_path"],
+                workers=workers, chunk_size=chunk,
+            )  # fmt: skip
+            try:
+                if workers:
+                    # Start the pool outside the timing; its cost is paid once per producer list.
+                    asyncio.run(batch(evaluator, items[: chunk * workers * 2], today_str))
+                if "batch" in ns.scenarios:
+                    record("batch", workers, chunk, asyncio.run(batch(evaluator, items, today_str)))
+                if "http" in ns.scenarios:
+                    clearance_api.BATCH = evaluator
+                    record("http", workers, chunk, asyncio.run(http(items, today_str)))
+            finally:
+                evaluator.shutdown()
+
+    if "evaluate" in ns.scenarios:
+        # Last: leaving the served app shuts down the gateway's pools.
+        record("evaluate", None, None, asyncio.run(evaluate(items, today_str)))
+
+    report = {
+        "submissions": len(items),
+        "producers": len(producers),
+        "cpus": os.cpu_count(),
+        "results": rows,
+        "decision_mix": dict(mix_holder.most_common(12)),
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
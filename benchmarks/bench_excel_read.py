@@ -0,0 +1,127 @@
+"""Compare /excel/read modes (bulk Value2 vs per-cell .Text) on a generated workbook.
+
+Runs against a live gateway (improved_winrm_server.py) whose WinRM target has
+Excel installed:
+
+1. Generates a rows x cols workbook on the Windows host via /execute
+   (mixed numbers, strings and dates, written with one Value2 assignment).
+2. Times /excel/read with mode=value2 and mode=text, `--repeat` times each.
+3. Prints a small JSON report and deletes the workbook.
+
+Usage:
+  python benchmarks/bench_excel_read.py --gateway http://localhost:5001 --rows 20000 --cols 10
+
+The text mode is O(rows x cols) COM calls, so keep --rows modest (or pass
+--skip-text) when benchmarking very large sheets.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import statistics
+import sys
+import time
+
+import requests
+
+
+def generate_workbook_script(path: str, rows: int, cols: int) -> str:
+    return rf"""
+$ErrorActionPreference = 'Stop'
+$path = '{path}'
+$rows = {rows}
+$cols = {cols}
+New-Item -ItemType Directory -Force -Path (Split-Path -Parent $path) | Out-Null
+if (Test-Path $path) {{ Remove-Item -Force $path }}
+
+$excel = New-Object -ComObject Excel.Application
+$excel.Visible = $false
+$excel.DisplayAlerts = $false
+try {{
+    $wb = $excel.Workbooks.Add()
+    $ws = $wb.Worksheets.Item(1)
+    $data = New-Object 'object[,]' $rows, $cols
+    for ($r = 0; $r -lt $rows; $r++) {{
+        for ($c = 0; $c -lt $cols; $c++) {{
+            switch ($c % 3) {{
+                0 {{ $data[$r, $c] = $r * $cols + $c }}
+                1 {{ $data[$r, $c] = "row $r col $c" }}
+                2 {{ $data[$r, $c] = 45000 + ($r % 365) }}
+            }}
+        }}
+    }}
+    $ws.Range($ws.Cells.Item(1, 1), $ws.Cells.Item($rows, $cols)).Value2 = $data
+    $wb.SaveAs($path, 51)
+    $wb.Close($false)
+}} finally {{
+    $excel.Quit()
+    [Runtime.InteropServices.Marshal]::ReleaseComObject($excel) | Out-Null
+}}
+Write-Output $path
+"""
+
+
+def time_read(gateway: str, path: str, mode: str, repeat: int) -> dict:
+    samples = []
+    rows = None
+    size = 0
+    for _ in range(repeat):
+        start = time.perf_counter()
+        r = requests.post(f"{gateway}/excel/read", json={"file_path": path, "mode": mode}, timeout=3600)
+        elapsed = time.perf_counter() - start
+        r.raise_for_status()
+        body = r.json()
+        if not body.get("success"):
+            raise RuntimeError(f"{mode} read failed: {body}")
+        rows = body.get("rows")
+        size = len(r.content)
+        samples.append(elapsed)
+    return {
+        "mode": mode,
+        "rows": rows,
+        "response_bytes": size,
+        "seconds_min": round(min(samples), 3),
+        "seconds_median": round(statistics.median(samples), 3),
+    }
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--gateway", default="http://localhost:5001")
+    p.add_argument("--rows", type=int, default=2000)
+    p.add_argument("--cols", type=int, default=10)
+    p.add_argument("--repeat", type=int, default=3)
+    p.add_argument("--path", default=r"C:\Windows\Temp\excel-bench\bench.xlsx")
+    p.add_argument("--skip-text", action="store_true")
+    ns = p.parse_args()
+
+    print(f"Generating {ns.rows}x{ns.cols} workbook at {ns.path}", file=sys.stderr)
+    r = requests.post(
+        f"{ns.gateway}/execute",
+        json={"script": generate_workbook_script(ns.path, ns.rows, ns.cols)},
+        timeout=3600,
+    )
+    r.raise_for_status()
+    if not r.json().get("success"):
+        raise SystemExit(f"Workbook generation failed: {r.json()}")
+
+    try:
+        results = [time_read(ns.gateway, ns.path, "value2", ns.repeat)]
+        if not ns.skip_text:
+            results.append(time_read(ns.gateway, ns.path, "text", ns.repeat))
+    finally:
+        requests.post(
+            f"{ns.gateway}/execute",
+            json={"script": f"Remove-Item -Force -ErrorAction SilentlyContinue '{ns.path}'"},
+            timeout=60,
+        )
+
+    report = {"rows": ns.rows, "cols": ns.cols, "repeat": ns.repeat, "results": results}
+    if len(results) == 2 and results[0]["seconds_median"]:
+        report["speedup"] = round(results[1]["seconds_median"] / results[0]["seconds_median"], 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
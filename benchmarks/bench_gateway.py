@@ -0,0 +1,240 @@
+"""Gateway and client benchmarks against a local stand-in WinRM endpoint.
+
+Starts `fake_wsman.FakeWSMan` and points the gateway's session pool at it, so
+every scenario runs the real code: Quart routes, host limiter, session pool,
+pywinrm SOAP over HTTP keep-alive. Nothing needs a Windows host.
+
+Scenarios:
+  execute          POST /execute with a small script
+  excel_read       POST /excel/read, cache bypassed (one remote read each)
+  excel_read_hit   POST /excel/read on a warm cache (remote stat + cache hit)
+  excel_open       POST /excel/open via the one-shot scheduled task
+  upload           winrm_client.upload_bytes_b64_chunked of --upload-kb
+  wait_file        remote_wait.wait_for_file for a task finishing after --task-delay-ms
+  wait_output      winrm_client.wait_for_output, same wait from the UIA client
+
+Each scenario runs at every --concurrency level and reports throughput,
+p50/p99 latency, errors, WinRM round trips and wire bytes per operation, and
+the process's peak RSS. --tracemalloc adds the peak Python heap of each run,
+at roughly half the throughput, so compare those numbers only with each other.
+
+Usage:
+  python benchmarks/bench_gateway.py --concurrency 1 4 16 --requests 64 --latency-ms 5
+  python benchmarks/bench_gateway.py --scenarios execute excel_read --output-kb 64
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "winrm-dotnet-uia"))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+# The gateway reads its configuration at import time.
+os.environ.setdefault("WINRM_SERVER", "127.0.0.1")
+os.environ.setdefault("WINRM_USERNAME", "bench")
+os.environ.setdefault("WINRM_PASSWORD", "bench")
+os.environ.setdefault("WINRM_TRANSPORT", "plaintext")
+os.environ["WINRM_POOL_PREWARM"] = "0"
+
+import winrm  # noqa: E402  # type: ignore
+
+import improved_winrm_server as gateway  # noqa: E402
+import remote_wait  # noqa: E402
+import winrm_client  # noqa: E402
+from fake_wsman import FakeWSMan  # noqa: E402
+
+SCENARIOS = ("execute", "excel_read", "excel_read_hit", "excel_open", "upload", "wait_file", "wait_output")
+GATEWAY_SCENARIOS = {"execute", "excel_read", "excel_read_hit", "excel_open"}
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[max(0, math.ceil(pct / 100 * len(sorted_values)) - 1)]
+
+
+def gateway_request(scenario: str, i: int) -> tuple[str, dict]:
+    if scenario == "execute":
+        return "/execute", {"script": f"Write-Output 'bench {i}'"}
+    if scenario == "excel_read":
+        return "/excel/read", {"file_path": r"C:\bench\book.xlsx", "limit": 200, "cache": False}
+    if scenario == "excel_read_hit":
+        return "/excel/read", {"file_path": r"C:\bench\book.xlsx", "limit": 200}
+    return "/excel/open", {"file_path": rf"C:\bench\open-{i}.xlsx"}
+
+
+async def run_gateway(scenario: str, concurrency: int, requests: int) -> tuple[list[float], int]:
+    latencies: list[float] = []
+    errors = 0
+    counter = iter(range(requests))
+
+    async with gateway.app.test_app() as test_app:
+        client = test_app.test_client()
+        if scenario == "excel_read_hit":
+            path, body = gateway_request(scenario, -1)
+            await client.post(path, json=body)
+
+        async def worker() -> None:
+            nonlocal errors
+            for i in counter:
+                path, body = gateway_request(scenario, i)
+                start = time.perf_counter()
+                response = await client.post(path, json=body)
+                await response.get_data()
+                latencies.append(time.perf_counter() - start)
+                if response.status_code >= 400:
+                    errors += 1
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+def run_client(scenario: str, concurrency: int, requests: int, server: FakeWSMan, upload: bytes) -> tuple[list[float], int]:
+    sessions = [winrm_client.ReusableShellSession(server.url, auth=("bench", "bench"), transport="plaintext") for _ in range(concurrency)]
+
+    def op(i: int) -> float:
+        session = sessions[i % concurrency]
+        start = time.perf_counter()
+        if scenario == "upload":
+            winrm_client.upload_bytes_b64_chunked(session, rf"C:\bench\upload-{i}.bin", upload, skip_if_same=False)
+        elif scenario == "wait_file":
+            if remote_wait.wait_for_file(gateway.run_ps, rf"C:\bench\out-{i}.json", 30) is None:
+                raise RuntimeError("timed out")
+        else:
+            if not winrm_client.wait_for_output(session, rf"C:\bench\uia-{i}.json", 30):
+                raise RuntimeError("timed out")
+        return time.perf_counter() - start
+
+    latencies: list[float] = []
+    errors = 0
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            # Each session is used by one thread at a time: thread k runs ops k, k+c, k+2c, ...
+            def lane(k: int) -> list[float]:
+                return [op(i) for i in range(k, requests, concurrency)]
+
+            for future in [pool.submit(lane, k) for k in range(concurrency)]:
+                try:
+                    latencies.extend(future.result())
+                except Exception as e:
+                    errors += 1
+                    print(f"{scenario}: {e}", file=sys.stderr)
+    finally:
+        for session in sessions:
+            session.close()
+    return latencies, errors
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # KB on Linux, bytes on macOS.
+    return round(rss / 1e6 if sys.platform == "darwin" else rss / 1e3, 1)
+
+
+def run_case(
+    scenario: str, concurrency: int, requests: int, server: FakeWSMan, upload: bytes, trace_heap: bool = False
+) -> dict:
+    server.reset_counters()
+    if trace_heap:
+        tracemalloc.start()
+    start = time.perf_counter()
+    if scenario in GATEWAY_SCENARIOS:
+        # Each case gets a fresh event loop; the limiter's semaphores belong to the old one.
+        gateway.HOST_LIMITER._hosts.clear()
+        latencies, errors = asyncio.run(run_gateway(scenario, concurrency, requests))
+    else:
+        latencies, errors = run_client(scenario, concurrency, requests, server, upload)
+    wall = time.perf_counter() - start
+    if trace_heap:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    done = len(latencies)
+    row = {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "ops": done,
+        "errors": errors,
+        "ops_per_s": round(done / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "round_trips_per_op": round(server.round_trips / done, 1) if done else 0.0,
+        "wire_kb_per_op": round((server.bytes_in + server.bytes_out) / 1024 / done, 1) if done else 0.0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+    if trace_heap:
+        row["peak_heap_mb"] = round(peak / 1e6, 2)
+    return row
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    p.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    p.add_argument("--requests", type=int, default=32, help="Operations per scenario and concurrency level")
+    p.add_argument("--latency-ms", type=float, default=5.0, help="Added to every WinRM round trip")
+    p.add_argument("--mbit", type=float, default=100.0)
+    p.add_argument("--output-kb", type=float, default=1.0, help="stdout size of an /execute script")
+    p.add_argument("--rows", type=int, default=1000, help="Rows in the fake workbook")
+    p.add_argument("--cols", type=int, default=10)
+    p.add_argument("--task-delay-ms", type=float, default=200.0, help="Time until a scheduled task writes its output")
+    p.add_argument("--upload-kb", type=int, default=256)
+    p.add_argument("--tracemalloc", action="store_true", help="Also report the peak Python heap (slow)")
+    ns = p.parse_args()
+
+    winrm_client.tlog = lambda message: None
+    gateway.logger.setLevel("WARNING")
+
+    server = FakeWSMan(
+        latency=ns.latency_ms / 1000,
+        bandwidth=ns.mbit * 1e6 / 8,
+        output_bytes=int(ns.output_kb * 1024),
+        rows=ns.rows,
+        cols=ns.cols,
+        task_delay=ns.task_delay_ms / 1000,
+    ).start()
+    gateway.WINRM_ENDPOINT = server.url
+    upload = os.urandom(ns.upload_kb * 512) + b"bench row,alpha,beta\r\n" * (ns.upload_kb * 512 // 22)
+
+    rows = []
+    try:
+        for scenario in ns.scenarios:
+            for concurrency in ns.concurrency:
+                row = run_case(scenario, concurrency, ns.requests, server, upload, ns.tracemalloc)
+                print(json.dumps(row), file=sys.stderr, flush=True)
+                rows.append(row)
+    finally:
+        server.stop()
+
+    report = {
+        "latency_ms": ns.latency_ms,
+        "mbit": ns.mbit,
+        "pool_size": gateway.POOL_CONFIG["max_size"],
+        "host_concurrency": gateway.ASYNC_CONFIG["host_concurrency"],
+        "results": rows,
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Throughput of winrm_client's upload engine against a local stand-in endpoint.
+
+No Windows host needed: `StandInProtocol` replaces pywinrm's `Protocol` and
+emulates a WinRM link with a fixed round-trip time and bandwidth (each call
+costs `rtt + envelope_bytes / bandwidth`). It actually executes the uploads,
+decoding chunks, gunzipping and checking the SHA-256 the way the remote
+PowerShell would, so a broken transfer fails the benchmark.
+
+Compares:
+  legacy  one `run_ps` per 2000-character base64 chunk (the old implementation)
+  engine  `upload_bytes_b64_chunked`: gzip, adaptive chunks, stdin streaming
+          into one remote command, SHA-256 verified
+
+Usage:
+  python benchmarks/bench_upload.py --size-kb 64 256 1024 --rtt-ms 20 --mbit 100
+
+Payloads are half compressible text and half random bytes; pass --random for
+incompressible data.
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from pathlib import Path
+
+import winrm  # type: ignore
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "winrm-dotnet-uia"))
+import winrm_client  # noqa: E402
+
+
+class StandInProtocol:
+    """Just enough of `winrm.protocol.Protocol` for run_ps and stdin streaming."""
+
+    def __init__(self, rtt: float, bandwidth: float) -> None:
+        self.rtt = rtt
+        self.bandwidth = bandwidth
+        self.files: dict[str, bytes] = {}
+        self.calls = 0
+        self._commands: dict[str, dict] = {}
+        self._next = 0
+
+    def _link(self, nbytes: int) -> None:
+        self.calls += 1
+        time.sleep(self.rtt + nbytes / self.bandwidth)
+
+    def open_shell(self, *args, **kwargs) -> str:
+        self._link(1024)
+        return "shell"
+
+    def close_shell(self, shell_id, close_session=True) -> None:
+        self._link(1024)
+
+    def run_command(self, shell_id, command, arguments=()) -> str:
+        self._link(1024 + len(command))
+        encoded = command.rsplit(" ", 1)[-1]
+        script = base64.b64decode(encoded).decode("utf_16_le")
+        self._next += 1
+        command_id = f"cmd{self._next}"
+        self._commands[command_id] = {"script": script, "stdin": bytearray(), "out": b"", "err": b"", "status": 0}
+        if "[Console]::In" not in script:
+            self._execute(self._commands[command_id])
+        return command_id
+
+    def send_command_input(self, shell_id, command_id, stdin_input, end=False) -> None:
+        # pywinrm base64-encodes stdin inside the envelope.
+        self._link(1024 + len(stdin_input) * 4 // 3)
+        cmd = self._commands[command_id]
+        cmd["stdin"].extend(stdin_input)
+        if end:
+            self._execute(cmd)
+
+    def get_command_output(self, shell_id, command_id):
+        cmd = self._commands[command_id]
+        self._link(1024 + len(cmd["out"]) * 4 // 3)
+        return cmd["out"], cmd["err"], cmd["status"]
+
+    def cleanup_command(self, shell_id, command_id) -> None:
+        self._link(1024)
+        self._commands.pop(command_id, None)
+
+    def _execute(self, cmd: dict) -> None:
+        script = cmd["script"]
+        path = re.search(r"\$p\s*=\s*'((?:[^']|'')*)'", script).group(1).replace("''", "'")
+
+        if "[Console]::In" in script:
+            raw = b"".join(base64.b64decode(line) for line in bytes(cmd["stdin"]).split(b"\r\n") if line)
+            if "if ($true)" in script:
+                raw = gzip.decompress(raw)
+            expected = re.search(r"\$expected = '([0-9A-F]+)'", script).group(1)
+            digest = hashlib.sha256(raw).hexdigest().upper()
+            if digest != expected:
+                cmd["status"], cmd["err"] = 5, b"SHA-256 mismatch"
+                return
+            self.files[path] = raw
+            cmd["out"] = digest.encode()
+        elif "Get-FileHash" in script:
+            if path in self.files:
+                cmd["out"] = hashlib.sha256(self.files[path]).hexdigest().upper().encode()
+        elif "$c=" in script:
+            chunk = re.search(r"\$c='([^']*)'", script).group(1)
+            self.files[path] = self.files.get(path, b"") + base64.b64decode(chunk)
+        else:
+            self.files.pop(path, None)
+
+
+class StandInSession(winrm.Session):
+    def __init__(self, protocol: StandInProtocol) -> None:
+        self.protocol = protocol
+
+
+def legacy_upload(session: winrm.Session, remote_path: str, data: bytes, chunk_size: int = 2000) -> None:
+    """The pre-engine implementation: one run_ps per 2000-character chunk."""
+    b64 = base64.b64encode(data).decode("ascii")
+    winrm_client.run_ps(
+        session,
+        f"$p={winrm_client.ps_quote(remote_path)}; "
+        "New-Item -ItemType Directory -Force -Path (Split-Path -Parent $p) | Out-Null; "
+        "if (Test-Path -LiteralPath $p) { Remove-Item -Force -LiteralPath $p }",
+    )
+    for i in range(0, len(b64), chunk_size):
+        winrm_client.run_ps(
+            session,
+            f"$p={winrm_client.ps_quote(remote_path)}; $c={winrm_client.ps_quote(b64[i : i + chunk_size])}; "
+            "$b=[Convert]::FromBase64String($c)",
+        )
+
+
+def make_payload(size: int, random_only: bool) -> bytes:
+    if random_only:
+        return os.urandom(size)
+    text = b"".join(b"row %06d,alpha,beta,gamma,%d\r\n" % (i, i * 7) for i in range(size // 30 + 1))
+    return text[: size // 2] + os.urandom(size - size // 2)
+
+
+def run_case(size: int, rtt: float, bandwidth: float, random_only: bool) -> list[dict]:
+    data = make_payload(size, random_only)
+    path = r"C:\Windows\Temp\bench\payload.bin"
+    results = []
+
+    for name in ("legacy", "engine"):
+        proto = StandInProtocol(rtt, bandwidth)
+        session = StandInSession(proto)
+        start = time.perf_counter()
+        if name == "legacy":
+            legacy_upload(session, path, data)
+        else:
+            winrm_client.upload_bytes_b64_chunked(session, path, data, skip_if_same=False)
+        elapsed = time.perf_counter() - start
+        if proto.files.get(path) != data:
+            raise SystemExit(f"{name}: uploaded bytes differ")
+        results.append(
+            {
+                "impl": name,
+                "size_kb": size // 1024,
+                "round_trips": proto.calls,
+                "seconds": round(elapsed, 3),
+                "mb_per_s": round(size / 1e6 / elapsed, 3),
+            }
+        )
+    return results
+
+
+def main() -> None:
+    p = argparse.ArgumentParser()
+    p.add_argument("--size-kb", type=int, nargs="+", default=[16, 64, 256])
+    p.add_argument("--rtt-ms", type=float, default=20.0)
+    p.add_argument("--mbit", type=float, default=100.0)
+    p.add_argument("--random", action="store_true", help="Incompressible payloads")
+    ns = p.parse_args()
+
+    winrm_client.tlog = lambda message: None
+    rtt = ns.rtt_ms / 1000
+    bandwidth = ns.mbit * 1e6 / 8
+
+    rows = []
+    for kb in ns.size_kb:
+        rows.extend(run_case(kb * 1024, rtt, bandwidth, ns.random))
+
+    report = {"rtt_ms": ns.rtt_ms, "mbit": ns.mbit, "random": ns.random, "results": rows}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""Local stand-in WS-Management endpoint for benchmarks.
+
+Speaks enough of the WinRM shell protocol (Create, Command, Send, Receive,
+Signal, Delete over SOAP/HTTP) for pywinrm to talk to it unmodified, so the
+gateway and winrm_client run their real code paths, HTTP keep-alive and XML
+handling included. No Windows host involved.
+
+Each request costs `latency` seconds plus `size / bandwidth`. Scripts are
+recognised by their content and answered with synthetic output:
+
+  stdin bootstrap     the real script is read from stdin and answered below
+  upload receiver     base64 lines from stdin are decoded (and gunzipped) and
+                      the SHA-256 is printed, as the remote receiver would
+  Excel read          `rows` x `cols` of values, as one JSON document or NDJSON,
+                      honouring offset/limit
+  file stat           a fixed "<size>|<ticks>" stamp
+  file wait           the watched file "appears" `task_delay` seconds after its
+                      first wait; the wait blocks like the remote watcher does
+  anything else       `output_bytes` of text on stdout
+
+Usage:
+  with FakeWSMan(latency=0.005) as server:
+      session = winrm.Session(server.url, auth=("u", "p"), transport="plaintext")
+"""
+
+from __future__ import annotations
+
+import base64
+import gzip
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from collections import Counter
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NS = {
+    "s": "http://www.w3.org/2003/05/soap-envelope",
+    "a": "http://schemas.xmlsoap.org/ws/2004/08/addressing",
+    "w": "http://schemas.dmtf.org/wbem/wsman/1/wsman.xsd",
+    "rsp": "http://schemas.microsoft.com/wbem/wsman/1/windows/shell",
+}
+SHELL_URI = "http://schemas.microsoft.com/wbem/wsman/1/windows/shell"
+DONE_STATE = SHELL_URI + "/CommandState/Done"
+RUNNING_STATE = SHELL_URI + "/CommandState/Running"
+
+FILE_STAMP = "245760|638000000000000000"
+
+
+@dataclass
+class _Command:
+    command_line: str
+    stdin: bytearray = field(default_factory=bytearray)
+    stdin_closed: bool = False
+    stdout: bytes | None = None
+    stderr: bytes = b""
+    status: int = 0
+    sent: int = 0
+
+
+def _local(tag: str) -> str:
+    return tag.rsplit("}", 1)[-1]
+
+
+def _find(root: ET.Element, name: str) -> ET.Element | None:
+    for node in root.iter():
+        if _local(node.tag) == name:
+            return node
+    return None
+
+
+def _envelope(relates_to: str, body: str = "") -> bytes:
+    return (
+        f'<s:Envelope xmlns:s="{NS["s"]}" xmlns:a="{NS["a"]}" xmlns:w="{NS["w"]}" xmlns:rsp="{NS["rsp"]}">'
+        f"<s:Header><a:RelatesTo>{relates_to}</a:RelatesTo></s:Header>"
+        f"<s:Body>{body}</s:Body></s:Envelope>"
+    ).encode("utf-8")
+
+
+class FakeWSMan:
+    def __init__(
+        self,
+        *,
+        latency: float = 0.005,
+        bandwidth: float = 100e6 / 8,
+        output_bytes: int = 256,
+        rows: int = 1000,
+        cols: int = 10,
+        task_delay: float = 0.5,
+        receive_chunk: int = 64 * 1024,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.output_bytes = output_bytes
+        self.rows = rows
+        self.cols = cols
+        self.task_delay = task_delay
+        self.receive_chunk = receive_chunk
+
+        self.requests: Counter[str] = Counter()
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.files: dict[str, bytes] = {}
+
+        self._lock = threading.Lock()
+        self._commands: dict[str, _Command] = {}
+        self._ready_at: dict[str, float] = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    # -- lifecycle --------------------------------------------------------------
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/wsman"
+
+    def start(self) -> "FakeWSMan":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-wsman", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeWSMan":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.bytes_in = 0
+            self.bytes_out = 0
+
+    @property
+    def round_trips(self) -> int:
+        return sum(self.requests.values())
+
+    # -- HTTP -------------------------------------------------------------------
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out in separate writes; without this, Nagle
+            # plus delayed ACKs add ~40 ms to every round trip.
+            disable_nagle_algorithm = True
+
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                reply = server._dispatch(body)
+                time.sleep(server.latency + (len(body) + len(reply)) / server.bandwidth)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/soap+xml;charset=UTF-8")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        return Handler
+
+    def _dispatch(self, body: bytes) -> bytes:
+        root = ET.fromstring(body)
+        action = (_find(root, "Action").text or "").rsplit("/", 1)[-1]
+        message_id = _find(root, "MessageID").text
+        with self._lock:
+            self.requests[action] += 1
+            self.bytes_in += len(body)
+
+        if action == "Create":
+            shell_id = str(uuid.uuid4()).upper()
+            reply = _envelope(
+                message_id,
+                f"<rsp:Shell><rsp:ShellId>{shell_id}</rsp:ShellId></rsp:Shell>"
+                f'<w:SelectorSet><w:Selector Name="ShellId">{shell_id}</w:Selector></w:SelectorSet>',
+            )
+        elif action == "Command":
+            command = _find(root, "Command").text or ""
+            arguments = _find(root, "Arguments")
+            if arguments is not None and arguments.text:
+                command += " " + arguments.text
+            command_id = str(uuid.uuid4()).upper()
+            with self._lock:
+                self._commands[command_id] = _Command(command)
+            reply = _envelope(message_id, f"<rsp:CommandResponse><rsp:CommandId>{command_id}</rsp:CommandId></rsp:CommandResponse>")
+        elif action == "Send":
+            stream = _find(root, "Stream")
+            cmd = self._commands[stream.get("CommandId")]
+            cmd.stdin.extend(base64.b64decode(stream.text or ""))
+            cmd.stdin_closed = stream.get("End", "false") == "true"
+            reply = _envelope(message_id, "<rsp:SendResponse/>")
+        elif action == "Receive":
+            command_id = _find(root, "DesiredStream").get("CommandId")
+            reply = _envelope(message_id, self._receive(command_id))
+        elif action == "Signal":
+            with self._lock:
+                self._commands.pop(_find(root, "Signal").get("CommandId"), None)
+            reply = _envelope(message_id, "<rsp:SignalResponse/>")
+        else:  # Delete
+            reply = _envelope(message_id)
+
+        with self._lock:
+            self.bytes_out += len(reply)
+        return reply
+
+    def _receive(self, command_id: str) -> str:
+        cmd = self._commands[command_id]
+        if cmd.stdout is None:
+            if self._reads_stdin(cmd) and not cmd.stdin_closed:
+                # Real WinRM would block until the operation timeout; the
+                # clients here always finish stdin before receiving.
+                return f'<rsp:ReceiveResponse><rsp:CommandState CommandId="{command_id}" State="{RUNNING_STATE}"/></rsp:ReceiveResponse>'
+            cmd.stdout, cmd.stderr, cmd.status = self._run(cmd)
+
+        piece = cmd.stdout[cmd.sent : cmd.sent + self.receive_chunk]
+        cmd.sent += len(piece)
+        done = cmd.sent >= len(cmd.stdout)
+        parts = [f'<rsp:Stream Name="stdout" CommandId="{command_id}">{base64.b64encode(piece).decode()}</rsp:Stream>']
+        if done:
+            if cmd.stderr:
+                parts.append(f'<rsp:Stream Name="stderr" CommandId="{command_id}">{base64.b64encode(cmd.stderr).decode()}</rsp:Stream>')
+            parts.append(
+                f'<rsp:CommandState CommandId="{command_id}" State="{DONE_STATE}"><rsp:ExitCode>{cmd.status}</rsp:ExitCode></rsp:CommandState>'
+            )
+        else:
+            parts.append(f'<rsp:CommandState CommandId="{command_id}" State="{RUNNING_STATE}"/>')
+        return "<rsp:ReceiveResponse>" + "".join(parts) + "</rsp:ReceiveResponse>"
+
+    # -- scripts ----------------------------------------------------------------
+
+    @staticmethod
+    def _script(command_line: str) -> str:
+        match = re.search(r"-encodedcommand\s+(\S+)", command_line, re.IGNORECASE)
+        if not match:
+            return command_line
+        return base64.b64decode(match.group(1)).decode("utf_16_le")
+
+    def _reads_stdin(self, cmd: _Command) -> bool:
+        return "[Console]::In" in self._script(cmd.command_line)
+
+    def _run(self, cmd: _Command) -> tuple[bytes, bytes, int]:
+        script = self._script(cmd.command_line)
+        if "FromBase64String($s.Trim())" in script:
+            # winrm_pool's stdin bootstrap: the real script arrives on stdin.
+            script = base64.b64decode(bytes(cmd.stdin).strip()).decode("utf-8")
+            return self.respond(script)
+        if "[Console]::In" in script and "$expected" in script:
+            return self._upload(script, bytes(cmd.stdin))
+        return self.respond(script)
+
+    def respond(self, script: str) -> tuple[bytes, bytes, int]:
+        """Synthetic (stdout, stderr, exit code) for a PowerShell script."""
+        if "Read-CompleteFile" in script or "Wait-CompleteFile" in script:
+            return self._wait_file(script)
+        if "total_rows" in script:
+            return self._excel_read(script)
+        if "LastWriteTimeUtc.Ticks" in script and "Get-Item" in script:
+            return FILE_STAMP.encode(), b"", 0
+        if "Get-FileHash" in script:
+            path = re.search(r"\$p\s*=\s*'((?:[^']|'')*)'", script).group(1).replace("''", "'")
+            data = self.files.get(path)
+            return (hashlib.sha256(data).hexdigest().upper().encode() if data is not None else b""), b"", 0
+        if "schtasks" in script:
+            return b"Task created and started", b"", 0
+        line = b"x" * 79 + b"\r\n"
+        return (line * (self.output_bytes // len(line) + 1))[: self.output_bytes], b"", 0
+
+    def _upload(self, script: str, stdin: bytes) -> tuple[bytes, bytes, int]:
+        path = re.search(r"\$p\s*=\s*'((?:[^']|'')*)'", script).group(1).replace("''", "'")
+        expected = re.search(r"\$expected\s*=\s*'([0-9A-F]+)'", script).group(1)
+        raw = b"".join(base64.b64decode(line) for line in stdin.split(b"\r\n") if line)
+        if "if ($true)" in script:
+            raw = gzip.decompress(raw)
+        digest = hashlib.sha256(raw).hexdigest().upper()
+        if digest != expected:
+            return b"", f"SHA-256 mismatch for {path}".encode(), 5
+        with self._lock:
+            self.files[path] = raw
+        return digest.encode(), b"", 0
+
+    def _wait_file(self, script: str) -> tuple[bytes, bytes, int]:
+        match = re.search(r"\$path = '((?:[^']|'')*)'", script) or re.search(r"-Path '((?:[^']|'')*)'", script)
+        path = match.group(1).replace("''", "'")
+        match = re.search(r"AddMilliseconds\((\d+)\)", script) or re.search(r"-TimeoutMs (\d+)", script)
+        timeout = int(match.group(1)) / 1000
+
+        now = time.monotonic()
+        with self._lock:
+            ready_at = self._ready_at.setdefault(path, now + self.task_delay)
+        if ready_at - now > timeout:
+            time.sleep(timeout)
+            return b"", b"", 0
+        time.sleep(max(0.0, ready_at - now))
+        with self._lock:
+            self._ready_at.pop(path, None)
+        return json.dumps({"success": True, "message": "Excel opened (fake)", "file": path}).encode(), b"", 0
+
+    def _excel_read(self, script: str) -> tuple[bytes, bytes, int]:
+        start = int(re.search(r"\$start = \[Math\]::Min\((\d+)", script).group(1))
+        limit = int(re.search(r"\$limit = (-?\d+)", script).group(1))
+        start = min(start, self.rows)
+        count = self.rows - start if limit < 0 else min(limit, self.rows - start)
+
+        def row(i: int) -> list:
+            return [f"r{i}c{c}" if c % 2 else i * 1.5 + c for c in range(self.cols)]
+
+        if '"cols":' in script:
+            lines = [json.dumps({"total_rows": self.rows, "offset": start, "cols": self.cols})]
+            lines += [json.dumps({"row": start + i, "values": row(start + i)}) for i in range(count)]
+            return ("\n".join(lines) + "\n").encode(), b"", 0
+        size, ticks = FILE_STAMP.split("|")
+        doc = {
+            "total_rows": self.rows,
+            "offset": start,
+            "file_size": int(size),
+            "file_mtime": int(ticks),
+            "data": [row(start + i) for i in range(count)],
+        }
+        return json.dumps(doc, separators=(",", ":")).encode(), b"", 0
@@ -0,0 +1,290 @@
+"""HTTP routes for the clearance rules engine and the lookups the n8n flow calls.
+
+Registered on the gateway app, and runnable on its own on port 5000, the
+address `n8n_flows/riscom_flow.json` calls:
+
+    python clearance_api.py
+
+POST /clearance/evaluate runs the whole flow in process for one submission,
+POST /clearance/batch for many, across worker processes. The lookup routes
+(/producer/lookup, /lob/map, /date/*, ...) keep the n8n flow working
+unchanged while it is still in use.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+from quart import Blueprint, Quart, Response, jsonify, request
+
+import clearance_services as services
+from clearance_batch import BatchEvaluator
+from clearance_rules import DEFAULT_FLOW, default_services, load_flow, submission_input
+from description_analysis import analyzer_from_env
+from producer_index import LocalFileSource, ProducerIndex, ProducerIndexNotReady, source_from_env
+
+load_dotenv()
+
+logger = logging.getLogger("winrm-gateway.clearance")
+
+CLEARANCE_CONFIG = {
+    "flow_path": os.getenv("CLEARANCE_FLOW", "").strip() or str(DEFAULT_FLOW),
+    "port": int(os.getenv("CLEARANCE_PORT", 5000)),
+    "producer_reload_interval": float(os.getenv("PRODUCER_RELOAD_INTERVAL", 60)),
+    "fuzzy_min_score": float(os.getenv("PRODUCER_FUZZY_MIN_SCORE", 0.6)),
+    "keyword_reload_interval": float(os.getenv("KEYWORDS_RELOAD_INTERVAL", 10)),
+    "evaluate_threads": int(os.getenv("CLEARANCE_EVALUATE_THREADS", 8)),
+}
+
+BATCH_CONFIG = {
+    "workers": int(os.getenv("CLEARANCE_BATCH_WORKERS", os.cpu_count() or 1)),
+    "chunk_size": int(os.getenv("CLEARANCE_BATCH_CHUNK", 32)),
+    "max_items": int(os.getenv("CLEARANCE_BATCH_MAX", 10000)),
+}
+
+PRODUCERS = ProducerIndex(source_from_env(), fuzzy_min_score=CLEARANCE_CONFIG["fuzzy_min_score"])
+# A local list is read before serving; a remote workbook loads in the watcher
+# and lookups answer 503 until it has.
+if isinstance(PRODUCERS.source, LocalFileSource):
+    PRODUCERS.refresh()
+ANALYZER = analyzer_from_env()
+SERVICES = default_services(PRODUCERS, ANALYZER)
+RULES = load_flow(CLEARANCE_CONFIG["flow_path"], SERVICES)
+# In-process evaluations run here, off the event loop. Their own pool: a thread
+# waiting on a description must not hold one the analyzer's backend needs.
+EVALUATE_POOL = ThreadPoolExecutor(
+    max_workers=max(1, CLEARANCE_CONFIG["evaluate_threads"]), thread_name_prefix="clearance-evaluate"
+)
+BATCH = BatchEvaluator(
+    RULES,
+    PRODUCERS,
+    CLEARANCE_CONFIG["flow_path"],
+    workers=BATCH_CONFIG["workers"],
+    chunk_size=BATCH_CONFIG["chunk_size"],
+    inline_executor=EVALUATE_POOL,
+)
+
+clearance = Blueprint("clearance", __name__)
+
+
+@clearance.before_app_serving
+async def _start_watch():
+    ANALYZER.attach(asyncio.get_running_loop())
+    PRODUCERS.start_watch(CLEARANCE_CONFIG["producer_reload_interval"])
+    services.KEYWORDS.start_watch(CLEARANCE_CONFIG["keyword_reload_interval"])
+
+
+@clearance.after_app_serving
+async def _stop_watch():
+    PRODUCERS.stop_watch()
+    services.KEYWORDS.stop_watch()
+    await asyncio.to_thread(BATCH.shutdown)
+    await asyncio.to_thread(EVALUATE_POOL.shutdown)
+    ANALYZER.attach(None)
+    ANALYZER.close()
+
+
+@clearance.app_errorhandler(ProducerIndexNotReady)
+async def handle_producers_not_ready(e: ProducerIndexNotReady):
+    response = jsonify({"success": False, "error": str(e)})
+    response.status_code = 503
+    response.headers["Retry-After"] = "5"
+    return response
+
+
+@clearance.route("/clearance/evaluate", methods=["POST"])
+async def clearance_evaluate():
+    data = await request.get_json()
+    input_data = submission_input(data)
+    if input_data is None:
+        return jsonify({"error": "input_data with accord_form_fields required"}), 400
+
+    decision = await asyncio.get_running_loop().run_in_executor(
+        EVALUATE_POOL, lambda: RULES.evaluate(input_data, today=data.get("today"))
+    )
+    out = decision.to_dict(include_trace=data.get("trace", True) is not False)
+    if data.get("output"):
+        out["result"] = decision.output()
+    return jsonify(out)
+
+
+def _flag(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() in {"1", "true", "yes", "on"}
+    return bool(value)
+
+
+async def _batch_items() -> tuple[list, dict]:
+    """Submissions and options from a JSON array, {"submissions": [...], ...} or NDJSON.
+
+    Options (today, trace, output) come from the JSON object or, for an array
+    or NDJSON body, from the query string.
+    """
+    options = {
+        "today": request.args.get("today"),
+        "trace": _flag(request.args.get("trace")),
+        "output": _flag(request.args.get("output")),
+    }
+    raw = await request.get_data()
+    if request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        lines = raw.decode("utf-8").splitlines()
+        return [json.loads(line) for line in lines if line.strip()], options
+
+    data = json.loads(raw)
+    if isinstance(data, dict):
+        for key in ("today", "trace", "output"):
+            if key in data:
+                options[key] = data[key] if key == "today" else _flag(data[key])
+        data = data.get("submissions")
+    if not isinstance(data, list):
+        raise ValueError("Expected a JSON array of submissions, {\"submissions\": [...]} or NDJSON")
+    return data, options
+
+
+@clearance.route("/clearance/batch", methods=["POST"])
+async def clearance_batch():
+    """Evaluate many submissions in parallel, streaming one NDJSON decision per line as each finishes."""
+    try:
+        items, options = await _batch_items()
+    except (ValueError, UnicodeDecodeError) as e:
+        return jsonify({"error": f"Invalid batch: {e}"}), 400
+    if len(items) > BATCH_CONFIG["max_items"]:
+        return jsonify({"error": f"At most {BATCH_CONFIG['max_items']} submissions per batch"}), 413
+
+    async def generate():
+        started = time.perf_counter()
+        declined = errors = 0
+        try:
+            async for result in BATCH.stream(items, options):
+                declined += bool(result.get("declined"))
+                errors += "error" in result
+                yield (json.dumps(result) + "\n").encode()
+        except Exception as e:
+            logger.exception("Batch clearance failure")
+            yield (json.dumps({"done": True, "success": False, "error": str(e)}) + "\n").encode()
+            return
+        elapsed = time.perf_counter() - started
+        trailer = {
+            "done": True,
+            "success": errors == 0,
+            "count": len(items),
+            "declined": declined,
+            "errors": errors,
+            "elapsed_ms": round(elapsed * 1000, 1),
+            "per_second": round(len(items) / elapsed, 1) if elapsed else None,
+        }
+        yield (json.dumps(trailer) + "\n").encode()
+
+    response = Response(generate(), mimetype="application/x-ndjson")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"
+    response.timeout = None
+    return response
+
+
+@clearance.route("/clearance/batch/stats", methods=["GET"])
+async def clearance_batch_stats():
+    return jsonify(BATCH.stats())
+
+
+@clearance.route("/clearance/rules", methods=["GET"])
+async def clearance_rules():
+    return jsonify(
+        {
+            "flow": CLEARANCE_CONFIG["flow_path"],
+            "producers": PRODUCERS.stats(),
+            "services": sorted(SERVICES),
+            "graph": RULES.describe(),
+        }
+    )
+
+
+@clearance.route("/producer/stats", methods=["GET"])
+async def producer_stats():
+    return jsonify(PRODUCERS.stats())
+
+
+@clearance.route("/producer/reload", methods=["POST"])
+async def producer_reload():
+    """Re-read the producer list now instead of at the next poll."""
+    if PRODUCERS.source is None:
+        return jsonify({"error": "No producer list configured (PRODUCER_LIST or PRODUCER_WORKBOOK)"}), 400
+    force = (await request.get_json(silent=True) or {}).get("force", False)
+    changed = await asyncio.get_running_loop().run_in_executor(None, lambda: PRODUCERS.refresh(force=bool(force)))
+    return jsonify({"changed": changed, **PRODUCERS.stats()}), (200 if PRODUCERS.last_error is None else 502)
+
+
+@clearance.route("/gemini/analyze_description", methods=["POST"])
+async def analyze_description():
+    """Cached; identical concurrent descriptions share one analysis and misses are batched."""
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict):
+        data = dict(await request.form)
+    try:
+        flags = await ANALYZER.analyze(data.get("description"))
+    except Exception as e:
+        return jsonify({"error": f"Description analysis failed: {e}"}), 502
+    return jsonify({"llm_flags": flags})
+
+
+@clearance.route("/gemini/stats", methods=["GET"])
+async def analyze_description_stats():
+    return jsonify(ANALYZER.stats())
+
+
+@clearance.route("/keywords/score", methods=["POST"])
+async def keywords_score():
+    """Flags, and mapped LOB where input_lob is given, for many descriptions in one call."""
+    data = await request.get_json(silent=True)
+    if not isinstance(data, dict) or not isinstance(data.get("items", data.get("descriptions")), list):
+        return jsonify({"error": "descriptions (list of strings) or items (list of objects) required"}), 400
+    return jsonify(services.score_descriptions(data))
+
+
+@clearance.route("/keywords/stats", methods=["GET"])
+async def keywords_stats():
+    return jsonify(services.KEYWORDS.stats())
+
+
+@clearance.route("/keywords/reload", methods=["POST"])
+async def keywords_reload():
+    """Rebuild the matcher from the keyword file now instead of at the next poll."""
+    force = (await request.get_json(silent=True) or {}).get("force", False)
+    changed = await asyncio.get_running_loop().run_in_executor(None, lambda: services.KEYWORDS.refresh(force=bool(force)))
+    stats = services.KEYWORDS.stats()
+    return jsonify({"changed": changed, **stats}), (200 if stats["last_error"] is None else 422)
+
+
+def _service_view(path: str):
+    service = SERVICES[path]
+
+    async def view():
+        data = await request.get_json(silent=True)
+        if not isinstance(data, dict):
+            data = dict(await request.form)
+        return jsonify(service(data))
+
+    view.__name__ = "service_" + path.strip("/").replace("/", "_")
+    return view
+
+
+for _path in SERVICES:
+    if _path == "/gemini/analyze_description":
+        continue
+    clearance.add_url_rule(_path, view_func=_service_view(_path), methods=["POST"])
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    app = Quart(__name__)
+    app.register_blueprint(clearance)
+    print(f"Clearance rules: {RULES.name} ({len(RULES.nodes)} nodes), producers from {PRODUCERS.source}")
+    uvicorn.run(app, host="0.0.0.0", port=CLEARANCE_CONFIG["port"], log_level="info")
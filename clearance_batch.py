@@ -0,0 +1,193 @@
+"""Batch clearance: evaluate many submissions across worker processes.
+
+One evaluation is CPU-bound Python, so a batch is spread over a process pool
+rather than threads. Submissions go out in chunks to amortize the pickling
+round trip, and each chunk's decisions are yielded as soon as it finishes,
+in completion order; every result carries the submission's index (and `id`,
+if it had one).
+
+Each worker compiles the flow once and builds its own producer index from a
+snapshot of the gateway's, and its own description analyzer from the same
+settings (sharing the on-disk cache, if one is configured). The pool is
+replaced when the producer list or the keyword file changes, so workers
+never use outdated rules.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import multiprocessing
+import sys
+import types
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import Any, AsyncIterator
+
+import clearance_services as services
+from clearance_rules import DecisionGraph, default_services, load_flow, submission_input
+from description_analysis import analyzer_from_env
+from producer_index import ProducerIndex
+
+logger = logging.getLogger("winrm-gateway.clearance")
+
+_GRAPH: DecisionGraph | None = None
+
+
+def _init_worker(flow_path: str, producer_records: list[dict], fuzzy_min_score: float) -> None:
+    global _GRAPH
+    # The forkserver imported the keyword file when it started; pick up any reload since.
+    services.KEYWORDS.refresh()
+    producers = ProducerIndex(fuzzy_min_score=fuzzy_min_score)
+    producers.apply(producer_records)
+    # Same backend and on-disk cache as the gateway's analyzer.
+    _GRAPH = load_flow(flow_path, default_services(producers, analyzer_from_env()))
+
+
+def _mp_context():
+    """Not fork: the gateway has executor and watcher threads running."""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload([__name__])
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+@contextmanager
+def _bare_main():
+    """Launch workers without re-running the parent's main script.
+
+    spawn and forkserver children import the parent's `__main__` file as
+    `__mp_main__`; for the gateway that would start a session reaper and
+    pre-warm WinRM sessions in every worker. Processes are started from
+    `submit`, so the real module is swapped out only for that call.
+    """
+    main = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main
+
+
+def evaluate_item(graph: DecisionGraph, index: int, item: Any, options: dict) -> dict:
+    out: dict = {"index": index}
+    if isinstance(item, dict) and item.get("id") is not None:
+        out["id"] = item["id"]
+    input_data = submission_input(item)
+    if input_data is None:
+        out["error"] = "input_data with accord_form_fields required"
+        return out
+    try:
+        decision = graph.evaluate(input_data, today=options.get("today"))
+    except Exception as e:
+        out["error"] = f"{type(e).__name__}: {e}"
+        return out
+    out.update(decision.to_dict(include_trace=options.get("trace", False)))
+    if options.get("output"):
+        out["result"] = decision.output()
+    return out
+
+
+def evaluate_chunk(graph: DecisionGraph, chunk: list[tuple[int, Any]], options: dict) -> list[dict]:
+    return [evaluate_item(graph, index, item, options) for index, item in chunk]
+
+
+def _worker_chunk(chunk: list[tuple[int, Any]], options: dict) -> list[dict]:
+    return evaluate_chunk(_GRAPH, chunk, options)
+
+
+class BatchEvaluator:
+    def __init__(
+        self,
+        graph: DecisionGraph,
+        producers: ProducerIndex,
+        flow_path: str,
+        *,
+        workers: int = 4,
+        chunk_size: int = 32,
+        inline_executor: Executor | None = None,
+    ) -> None:
+        self.graph = graph
+        self.producers = producers
+        self.flow_path = flow_path
+        self.workers = workers
+        self.chunk_size = max(1, chunk_size)
+        # Threads for chunks evaluated in this process; None is the loop's default.
+        self.inline_executor = inline_executor
+        self._pool: ProcessPoolExecutor | None = None
+        self._pool_version: tuple | None = None
+
+        self.batches = 0
+        self.evaluated = 0
+        self.errors = 0
+        self.pool_starts = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        version = (self.producers.version, services.KEYWORDS.digest)
+        if self._pool is None or self._pool_version != version:
+            if self._pool is not None:
+                # Running chunks finish on the old workers; new ones use the new list.
+                self._pool.shutdown(wait=False, cancel_futures=False)
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=_mp_context(),
+                initializer=_init_worker,
+                initargs=(self.flow_path, self.producers.records(), self.producers.fuzzy_min_score),
+            )
+            self._pool_version = version
+            self.pool_starts += 1
+        return self._pool
+
+    async def stream(self, items: list, options: dict) -> AsyncIterator[dict]:
+        """Yield one result per item as its chunk completes."""
+        self.batches += 1
+        indexed = list(enumerate(items))
+        chunks = [indexed[i : i + self.chunk_size] for i in range(0, len(indexed), self.chunk_size)]
+
+        loop = asyncio.get_running_loop()
+        if self.workers <= 0 or len(chunks) == 1:
+            # Not worth a process round trip, but still off the event loop: a
+            # chunk can wait on description analysis.
+            for chunk in chunks:
+                results = await loop.run_in_executor(self.inline_executor, evaluate_chunk, self.graph, chunk, options)
+                for result in results:
+                    self._count(result)
+                    yield result
+            return
+
+        pool = self._executor()
+        with _bare_main():
+            futures = [loop.run_in_executor(pool, _worker_chunk, chunk, options) for chunk in chunks]
+        try:
+            for next_done in asyncio.as_completed(futures):
+                for result in await next_done:
+                    self._count(result)
+                    yield result
+        finally:
+            # The client went away or a worker died: drop chunks not yet started.
+            for future in futures:
+                future.cancel()
+
+    def _count(self, result: dict) -> None:
+        self.evaluated += 1
+        if "error" in result:
+            self.errors += 1
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "chunk_size": self.chunk_size,
+            "pool_running": self._pool is not None,
+            "pool_starts": self.pool_starts,
+            "pool_version": self._pool_version,
+            "batches": self.batches,
+            "evaluated": self.evaluated,
+            "errors": self.errors,
+        }
+
@@ -0,0 +1,501 @@
+"""Clearance rules engine compiled from the n8n flow.
+
+`n8n_flows/riscom_flow.json` holds the clearance rules as IF/Set nodes with
+HTTP calls to localhost:5000 in between. n8n walks them one node at a time;
+here the flow is compiled once into a graph of Python closures:
+
+  - IF conditions become predicates with their expressions and regexes
+    pre-parsed,
+  - Set assignments become field writers,
+  - HTTP nodes are bound to the matching function in `clearance_services`,
+    called in process,
+  - trigger, file and code nodes pass through. "Merge Final Output" is
+    `build_output()` below.
+
+All nodes of one evaluation share one context dict: Set nodes and service
+responses are merged into it, and the flow's `$json.x` and `$('Node').x`
+references both read from it.
+
+Only the expression forms the flow uses are supported (`$json` paths joined
+by `||`, `.toLowerCase()`, string, boolean and `{}` literals). Anything else
+fails at compile time rather than during an evaluation.
+"""
+
+from __future__ import annotations
+
+import copy
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable
+from urllib.parse import urlparse
+
+import clearance_services as services
+from description_analysis import DescriptionAnalyzer
+from producer_index import ProducerIndex
+
+DEFAULT_FLOW = Path(__file__).resolve().parent / "n8n_flows" / "riscom_flow.json"
+
+# Service functions by the URL path the flow's HTTP nodes call.
+Service = Callable[[dict], dict]
+
+PASS_THROUGH_TYPES = frozenset(
+    {
+        "n8n-nodes-base.manualTrigger",
+        "n8n-nodes-base.readBinaryFile",
+        "n8n-nodes-base.writeBinaryFile",
+        "n8n-nodes-base.code",
+        "n8n-nodes-base.noOp",
+    }
+)
+
+
+def default_services(producers: ProducerIndex | None = None, analyzer: DescriptionAnalyzer | None = None) -> dict[str, Service]:
+    producers = producers if producers is not None else ProducerIndex()
+    return {
+        "/producer/lookup": producers.lookup,
+        "/gemini/analyze_description": analyzer.service if analyzer is not None else services.analyze_description,
+        "/lob/map": services.map_lob,
+        "/business/check_logging": services.check_logging,
+        "/issuing_office/determine": services.determine_issuing_office,
+        "/date/adjust_effective": services.adjust_effective_date,
+        "/date/check_120_days": services.check_120_days,
+        "/description/format": services.format_description,
+    }
+
+
+# -----------------------------------------------------------------------------
+# Expressions
+# -----------------------------------------------------------------------------
+_JSON_PATH = re.compile(r"^\$json((?:\.\w+)*)(\.toLowerCase\(\))?$")
+_STRING = re.compile(r"^'([^']*)'$|^\"([^\"]*)\"$")
+
+
+def _getter(path: tuple[str, ...], lower: bool) -> Callable[[dict], Any]:
+    def get(ctx: dict):
+        value = ctx
+        for key in path:
+            try:
+                value = value[key]
+            except (KeyError, TypeError, IndexError):
+                return None
+        if lower:
+            return value.lower() if isinstance(value, str) else ""
+        return value
+
+    return get
+
+
+def _term(text: str) -> Callable[[dict], Any]:
+    m = _JSON_PATH.match(text)
+    if m:
+        return _getter(tuple(k for k in m.group(1).split(".") if k), bool(m.group(2)))
+    m = _STRING.match(text)
+    if m:
+        literal = m.group(1) if m.group(1) is not None else m.group(2)
+        return lambda ctx: literal
+    if text in ("true", "false"):
+        literal = text == "true"
+        return lambda ctx: literal
+    if re.fullmatch(r"\{\s*\}", text):
+        return lambda ctx: {}
+    raise ValueError(f"Unsupported expression term: {text!r}")
+
+
+def compile_expression(value) -> Callable[[dict], Any]:
+    """Compile an n8n parameter value (`={{ ... }}` or a plain literal) into a getter."""
+    if not (isinstance(value, str) and value.startswith("=")):
+        return lambda ctx: value
+    body = value[1:].strip()
+    if not (body.startswith("{{") and body.endswith("}}")):
+        text = body
+        return lambda ctx: text
+    terms = [_term(part.strip()) for part in body[2:-2].split("||")]
+    if len(terms) == 1:
+        return terms[0]
+
+    def first_truthy(ctx: dict):
+        # JavaScript `a || b`: the first truthy operand, else the last one.
+        value = None
+        for term in terms:
+            value = term(ctx)
+            if value:
+                return value
+        return value
+
+    return first_truthy
+
+
+# -----------------------------------------------------------------------------
+# Nodes
+# -----------------------------------------------------------------------------
+def _as_string(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value if isinstance(value, str) else str(value)
+
+
+def _as_bool(value) -> bool:
+    if isinstance(value, str):
+        return value.strip().lower() == "true"
+    return bool(value)
+
+
+def _string_condition(cond: dict) -> Callable[[dict], bool]:
+    left = compile_expression(cond.get("value1", ""))
+    operation = cond.get("operation", "equal")
+    right_value = cond.get("value2", "")
+    if operation in ("regex", "notRegex"):
+        pattern = re.compile(right_value)
+        if operation == "regex":
+            return lambda ctx: pattern.search(_as_string(left(ctx))) is not None
+        return lambda ctx: pattern.search(_as_string(left(ctx))) is None
+    right = compile_expression(right_value)
+    ops = {
+        "isEmpty": lambda a, b: a == "",
+        "isNotEmpty": lambda a, b: a != "",
+        "equal": lambda a, b: a == b,
+        "equals": lambda a, b: a == b,
+        "notEqual": lambda a, b: a != b,
+        "notEquals": lambda a, b: a != b,
+        "contains": lambda a, b: b in a,
+        "notContains": lambda a, b: b not in a,
+        "startsWith": lambda a, b: a.startswith(b),
+        "endsWith": lambda a, b: a.endswith(b),
+    }
+    if operation not in ops:
+        raise ValueError(f"Unsupported string operation: {operation}")
+    op = ops[operation]
+    return lambda ctx: op(_as_string(left(ctx)), _as_string(right(ctx)))
+
+
+def _boolean_condition(cond: dict) -> Callable[[dict], bool]:
+    left = compile_expression(cond.get("value1", False))
+    right = compile_expression(cond.get("value2", False))
+    if cond.get("operation", "equal") == "notEqual":
+        return lambda ctx: _as_bool(left(ctx)) != _as_bool(right(ctx))
+    return lambda ctx: _as_bool(left(ctx)) == _as_bool(right(ctx))
+
+
+def _number_condition(cond: dict) -> Callable[[dict], bool]:
+    left = compile_expression(cond.get("value1", 0))
+    right = compile_expression(cond.get("value2", 0))
+    ops = {
+        "equal": lambda a, b: a == b,
+        "notEqual": lambda a, b: a != b,
+        "smaller": lambda a, b: a < b,
+        "smallerEqual": lambda a, b: a <= b,
+        "larger": lambda a, b: a > b,
+        "largerEqual": lambda a, b: a >= b,
+    }
+    op = ops[cond.get("operation", "equal")]
+
+    def check(ctx: dict) -> bool:
+        try:
+            return op(float(left(ctx)), float(right(ctx)))
+        except (TypeError, ValueError):
+            return False
+
+    return check
+
+
+_CONDITIONS = {"string": _string_condition, "boolean": _boolean_condition, "number": _number_condition}
+
+
+@dataclass
+class Node:
+    name: str
+    kind: str  # "if", "set", "call" or "pass"
+    run: Callable[[dict], int]
+    outputs: list["Node | None"] = field(default_factory=list)
+    detail: Any = None  # set: field names; call: URL path
+
+
+def _compile_if(params: dict) -> Callable[[dict], int]:
+    checks = [
+        _CONDITIONS[kind](cond) for kind, conds in (params.get("conditions") or {}).items() for cond in conds
+    ]
+    # Output 0 is the true branch, output 1 the false branch.
+    if len(checks) == 1:
+        check = checks[0]
+        return lambda ctx: 0 if check(ctx) else 1
+    combine = any if params.get("combineOperation") == "any" else all
+    return lambda ctx: 0 if combine(check(ctx) for check in checks) else 1
+
+
+def _compile_set(params: dict) -> tuple[Callable[[dict], int], list[str]]:
+    assignments = (params.get("assignments") or {}).get("assignments") or []
+    writers: list[tuple[str, Callable[[dict], Any], str]] = [
+        (a["name"], compile_expression(a.get("value")), a.get("type", "string")) for a in assignments
+    ]
+
+    def run(ctx: dict) -> int:
+        # Evaluate every value before writing, as one n8n Set node does.
+        values = [(name, get(ctx), kind) for name, get, kind in writers]
+        for name, value, kind in values:
+            if kind == "string":
+                value = _as_string(value)
+            elif kind == "boolean":
+                value = _as_bool(value)
+            ctx[name] = value
+        return 0
+
+    return run, [name for name, _, _ in writers]
+
+
+def _compile_http(params: dict, service_map: dict[str, Service]) -> tuple[Callable[[dict], int], str]:
+    path = urlparse(params.get("url", "")).path
+    service = service_map.get(path)
+    if service is None:
+        raise ValueError(f"No in-process service for {params.get('url')}")
+    body_params = [
+        (p["name"], compile_expression(p.get("value")))
+        for p in (params.get("bodyParameters") or {}).get("parameters") or []
+    ]
+
+    def run(ctx: dict) -> int:
+        body = {name: get(ctx) for name, get in body_params}
+        if "today" in ctx:
+            body["today"] = ctx["today"]
+        ctx.update(service(body))
+        return 0
+
+    return run, path
+
+
+def _pass(ctx: dict) -> int:
+    return 0
+
+
+# -----------------------------------------------------------------------------
+# Graph
+# -----------------------------------------------------------------------------
+@dataclass
+class Decision:
+    decline_reason: str | None
+    processing_status: str
+    underwriter: str | None
+    assignment_reason: str | None
+    issuing_office: str | None
+    adjusted_date: str | None
+    house_account: bool
+    trace: list[tuple[Node, int]]
+    elapsed_us: float
+    context: dict
+
+    @property
+    def declined(self) -> bool:
+        return self.decline_reason is not None
+
+    def trace_dicts(self) -> list[dict]:
+        out = []
+        for node, branch in self.trace:
+            if node.kind == "if":
+                out.append({"rule": node.name, "result": branch == 0})
+            elif node.kind == "set":
+                out.append({"rule": node.name, "set": node.detail})
+            else:
+                out.append({"rule": node.name, "call": node.detail})
+        return out
+
+    def to_dict(self, *, include_trace: bool = True) -> dict:
+        out = {
+            "status": self.decline_reason or self.processing_status,
+            "declined": self.declined,
+            "decline_reason": self.decline_reason,
+            "processing_status": self.processing_status,
+            "underwriter": self.underwriter,
+            "assignment_reason": self.assignment_reason,
+            "issuing_office": self.issuing_office,
+            "adjusted_date": self.adjusted_date,
+            "house_account": self.house_account,
+            "elapsed_us": round(self.elapsed_us, 1),
+        }
+        if include_trace:
+            out["trace"] = self.trace_dicts()
+        return out
+
+    def output(self) -> dict:
+        """The ACORD document with the decision written back, as the flow's output file."""
+        return build_output(self.context)
+
+
+class DecisionGraph:
+    def __init__(self, name: str, start: Node, nodes: dict[str, Node]) -> None:
+        self.name = name
+        self.start = start
+        self.nodes = nodes
+
+    def describe(self) -> dict:
+        return {
+            "name": self.name,
+            "start": self.start.name,
+            "nodes": {
+                name: {"kind": node.kind, "next": [n.name if n else None for n in node.outputs]}
+                for name, node in self.nodes.items()
+                if node.kind != "pass"
+            },
+        }
+
+    def evaluate(self, input_data: dict, *, today: str | None = None) -> Decision:
+        start = time.perf_counter()
+        ctx: dict = {"input_data": input_data}
+        if today:
+            ctx["today"] = today
+        trace: list[tuple[Node, int]] = []
+        node: Node | None = self.start
+        while node is not None:
+            branch = node.run(ctx)
+            if node.kind != "pass":
+                trace.append((node, branch))
+            node = node.outputs[branch] if branch < len(node.outputs) else None
+
+        decline = ctx.get("decline_reason")
+        fields = _fields(input_data)
+        return Decision(
+            decline_reason=decline,
+            # As build_output writes it: a decline is the processing status.
+            processing_status=decline or ctx.get("processing_status") or "Proceed",
+            underwriter=None if decline else _underwriter(ctx),
+            assignment_reason=None if decline else ctx.get("assignment_reason"),
+            issuing_office=ctx.get("issuing_office") or None,
+            adjusted_date=ctx.get("adjusted_date", _value(fields, "submission_policy_information", "proposed_effective_date")),
+            house_account=bool(ctx.get("house_account_flow", False)),
+            trace=trace,
+            elapsed_us=(time.perf_counter() - start) * 1e6,
+            context=ctx,
+        )
+
+
+def submission_input(item) -> dict | None:
+    """The ACORD document, sent either bare or as {"input_data": ...} like the flow's input file."""
+    if not isinstance(item, dict):
+        return None
+    if isinstance(item.get("input_data"), dict):
+        return item["input_data"]
+    if isinstance(item.get("accord_form_fields"), dict):
+        return item
+    return None
+
+
+def compile_flow(flow: dict, service_map: dict[str, Service] | None = None) -> DecisionGraph:
+    service_map = service_map if service_map is not None else default_services()
+    nodes: dict[str, Node] = {}
+    for spec in flow["nodes"]:
+        kind, params, detail = spec["type"], spec.get("parameters") or {}, None
+        if kind == "n8n-nodes-base.if":
+            node = Node(spec["name"], "if", _compile_if(params))
+        elif kind == "n8n-nodes-base.set":
+            run, detail = _compile_set(params)
+            node = Node(spec["name"], "set", run, detail=detail)
+        elif kind == "n8n-nodes-base.httpRequest":
+            run, detail = _compile_http(params, service_map)
+            node = Node(spec["name"], "call", run, detail=detail)
+        elif kind in PASS_THROUGH_TYPES:
+            node = Node(spec["name"], "pass", _pass)
+        else:
+            raise ValueError(f"Unsupported node type {kind} ({spec['name']})")
+        nodes[node.name] = node
+
+    targets = set()
+    for source, conn in (flow.get("connections") or {}).items():
+        outputs = []
+        for branch in conn.get("main") or []:
+            # n8n can fan one output out to several nodes; the rules never do.
+            outputs.append(nodes[branch[0]["node"]] if branch else None)
+            targets.update(c["node"] for c in branch)
+        nodes[source].outputs = outputs
+
+    roots = [node for name, node in nodes.items() if name not in targets]
+    if len(roots) != 1:
+        raise ValueError(f"Flow must have exactly one start node, found {[n.name for n in roots]}")
+    return DecisionGraph(flow.get("name", "flow"), roots[0], nodes)
+
+
+def load_flow(path: str | Path = DEFAULT_FLOW, service_map: dict[str, Service] | None = None) -> DecisionGraph:
+    with open(path, encoding="utf-8") as f:
+        return compile_flow(json.load(f), service_map)
+
+
+# -----------------------------------------------------------------------------
+# Output ("Merge Final Output")
+# -----------------------------------------------------------------------------
+def _fields(input_data: dict) -> dict:
+    fields = input_data.get("accord_form_fields") if isinstance(input_data, dict) else None
+    return fields if isinstance(fields, dict) else {}
+
+
+def _value(fields: dict, section: str, name: str):
+    entry = (fields.get(section) or {}).get(name)
+    return entry.get("value") if isinstance(entry, dict) else None
+
+
+def _underwriter(ctx: dict) -> str:
+    producer = ctx.get("producer_info") or {}
+    return ctx.get("underwriter") or producer.get("underwriter_name") or "Murphy, Kristin"
+
+
+def _set_if_present(section: dict | None, name: str, value) -> None:
+    entry = section.get(name) if isinstance(section, dict) else None
+    if isinstance(entry, dict) and "value" in entry:
+        entry["value"] = value
+
+
+def build_output(ctx: dict) -> dict:
+    result = copy.deepcopy(ctx["input_data"])
+    fields = result.setdefault("accord_form_fields", {})
+    policy = fields.setdefault("submission_policy_information", {})
+    policy.setdefault("processing_status", {})
+
+    decline = ctx.get("decline_reason")
+    if decline:
+        policy["processing_status"]["value"] = decline
+        return result
+    policy["processing_status"]["value"] = ctx.get("processing_status") or "Proceed"
+
+    producer = ctx.get("producer_info") or {}
+    agent_section = fields.get("producer_agent_information")
+    if producer.get("agency_name"):
+        _set_if_present(agent_section, "producer_name", producer["agency_name"])
+        _set_if_present(
+            agent_section,
+            "agent_agency_name",
+            f"{producer.get('agent_lastname') or ''}, {producer.get('agent_firstname') or ''}/"
+            f"{producer.get('agency_display_name') or producer['agency_name']}",
+        )
+    _set_if_present(agent_section, "house_account_flow_indicated", bool(ctx.get("house_account_flow", False)))
+    _set_if_present(agent_section, "underwriter", _underwriter(ctx))
+
+    if "mapped_lob" in ctx:
+        fields["lines_of_business_premium"] = ctx["mapped_lob"]
+
+    offices = fields.get("issuing_office_selection_status")
+    office = ctx.get("issuing_office")
+    if isinstance(offices, dict) and office:
+        for key, entry in offices.items():
+            if isinstance(entry, dict):
+                entry["value"] = key == office
+
+    if "adjusted_date" in ctx:
+        policy.setdefault("proposed_effective_date", {})["value"] = ctx["adjusted_date"]
+    if "formatted_description" in ctx:
+        insured = fields.setdefault("applicant_insured_information", {})
+        insured.setdefault("general_business_description", {})["value"] = ctx["formatted_description"]
+
+    address = fields.get("address_information") or {}
+    state = _value(fields, "address_information", "state")
+    _set_if_present(address, "state_fullname", services.STATE_NAMES.get(state, state))
+
+    carrier_section = fields.get("prior_carrier_information")
+    if isinstance(carrier_section, dict):
+        carrier = carrier_section.setdefault("prior_carrier_name", {})
+        name = carrier.get("value")
+        if isinstance(name, list):
+            carrier["value"] = name[-1] if name else "Unknown"
+        elif not name:
+            carrier["value"] = "Unknown"
+    return result
@@ -0,0 +1,330 @@
+"""Lookups the clearance flow calls: LOB, issuing office, dates, descriptions.
+
+`n8n_flows/riscom_flow.json` reaches these as HTTP endpoints on
+localhost:5000 (`clearance_api.py` serves them). `clearance_rules` calls
+the same functions in process. Each one takes the flow's request body as a
+dict and returns the response body, and does no I/O per call. The producer
+lookup is `producer_index.ProducerIndex.lookup`; description keywords come
+from `keyword_matcher`.
+
+The rules come from docs/RISCOM_New_Insured_Process_SOP.txt.
+"""
+
+from __future__ import annotations
+
+import re
+from datetime import date, timedelta
+
+from keyword_matcher import keywords_from_env
+
+SUPPORTED_STATES = ("LA", "TX", "AR", "OK", "CA", "MS", "NV", "AZ", "CO")
+
+STATE_NAMES = {
+    "LA": "Louisiana",
+    "TX": "Texas",
+    "AR": "Arkansas",
+    "OK": "Oklahoma",
+    "CA": "California",
+    "MS": "Mississippi",
+    "NV": "Nevada",
+    "AZ": "Arizona",
+    "CO": "Colorado",
+}
+
+
+def normalize_name(text) -> str:
+    """Lowercase, '&' as 'and', punctuation dropped, whitespace collapsed."""
+    if not text:
+        return ""
+    text = str(text).lower().replace("&", " and ")
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+def is_selected(value) -> bool:
+    """Whether an ACORD checkbox/premium field counts as requested."""
+    if isinstance(value, dict):
+        value = value.get("value")
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value > 0
+    if isinstance(value, str):
+        text = value.strip().lower()
+        if text in ("", "false", "no", "n", "0", "none", "off"):
+            return False
+        return True
+    return bool(value)
+
+
+def _header_key(name: str) -> str:
+    return "_".join(re.sub(r"[^\w\s]", " ", str(name).lower()).split())
+
+
+# -----------------------------------------------------------------------------
+# Business description
+# -----------------------------------------------------------------------------
+# Phrase groups and LOB aliases from clearance_keywords.json (CLEARANCE_KEYWORDS);
+# clearance_api watches the file and rebuilds the matcher when it changes.
+KEYWORDS = keywords_from_env()
+
+
+def description_flags(text) -> dict:
+    """All risk flags from one pass of the keyword matcher."""
+    hits = KEYWORDS.matcher.match(text)
+    towing = "towing" in hits
+    logging_ = "logging" in hits and "not_logging" not in hits
+    garage = not towing and "garage" in hits
+    return {
+        "isWreckerTow": towing,
+        "isMarine": "marine" in hits,
+        "isGarage": garage,
+        "isGarageDealer": garage and "dealer" in hits,
+        # Trash and roll-off hauling is a service, not trucking.
+        "isTrucking": not towing and (logging_ or ("trucking" in hits and "not_trucking" not in hits)),
+        "isLogging": logging_,
+    }
+
+
+def check_logging(body: dict) -> dict:
+    """Hauls logs or mechanized logging, but not treated wood, pellets, lumber, paper or finished goods."""
+    hits = KEYWORDS.matcher.match(body.get("description"))
+    return {"is_logging": "logging" in hits and "not_logging" not in hits}
+
+
+def analyze_description(body: dict) -> dict:
+    """Risk flags for a business description (keyword rules)."""
+    return {"llm_flags": description_flags(body.get("description"))}
+
+
+# -----------------------------------------------------------------------------
+# Lines of business
+# -----------------------------------------------------------------------------
+PRIMARY_LINES = ("business_auto", "general_liability", "commercial_property", "inland_marine")
+
+MAPPED_LOB_KEYS = (
+    "business_auto",
+    "general_liability",
+    "commercial_property",
+    "inland_marine",
+    "motor_truck_cargo",
+    "package",
+    "commercial_umbrella",
+    "garage",
+    "garage_package",
+    "trucking_business_auto",
+    "trucking_general_liability",
+    "trucking_package_business_auto",
+    "trucking_package_general_liability",
+)
+
+
+def requested_lines(input_lob) -> set[str]:
+    """Lines selected on the ACORD form, by the field aliases in the keyword file."""
+    if not isinstance(input_lob, dict):
+        return set()
+    line_by_alias = KEYWORDS.line_by_alias
+    lines = set()
+    for key, value in input_lob.items():
+        line = line_by_alias.get(key) or line_by_alias.get(_header_key(key))
+        if line is not None and line not in lines and is_selected(value):
+            lines.add(line)
+    return lines
+
+
+def map_lob(body: dict) -> dict:
+    """Map the requested lines onto the IMS program lines.
+
+    Umbrella is always its own wholesale card. Towing is always a package and
+    supersedes garage; a garage dealer is GARAGE, a garage service a package.
+    For-hire trucking and logging go to the trucking program, monoline or
+    package.
+    """
+    flags = body.get("llm_flags") or {}
+    if "llm_flags" in flags:
+        flags = flags["llm_flags"]
+    if not flags:
+        flags = description_flags(body.get("description"))
+
+    lines = requested_lines(body.get("input_lob"))
+    primary = [line for line in PRIMARY_LINES if line in lines]
+    mapped = dict.fromkeys(MAPPED_LOB_KEYS, False)
+    mapped["commercial_umbrella"] = "commercial_umbrella" in lines
+    mapped["motor_truck_cargo"] = "motor_truck_cargo" in lines
+
+    if flags.get("isWreckerTow"):
+        mapped["package"] = True
+    elif flags.get("isGarage") or "garage" in lines:
+        mapped["garage" if flags.get("isGarageDealer") else "garage_package"] = True
+    elif flags.get("isTrucking") or flags.get("isLogging"):
+        # BAs for logging are always Trucking BA.
+        auto = "business_auto" in lines or flags.get("isLogging")
+        liability = "general_liability" in lines
+        if len(primary) > 1:
+            mapped["trucking_package_business_auto"] = bool(auto)
+            mapped["trucking_package_general_liability"] = liability
+        else:
+            mapped["trucking_business_auto"] = bool(auto)
+            mapped["trucking_general_liability"] = liability
+        mapped["commercial_property"] = "commercial_property" in lines
+        mapped["inland_marine"] = "inland_marine" in lines
+    else:
+        for line in primary:
+            mapped[line] = True
+        mapped["package"] = len(primary) > 1
+
+    return {"mapped_lob": {key: {"value": value} for key, value in mapped.items()}}
+
+
+def score_descriptions(body: dict) -> dict:
+    """Flags for many descriptions, and the mapped LOB for items that carry input_lob.
+
+    Takes {"descriptions": ["...", ...]} or {"items": [{"description", "input_lob"}, ...]}.
+    """
+    items = body.get("items")
+    if items is None:
+        items = [{"description": text} for text in body.get("descriptions") or ()]
+    results = []
+    for item in items:
+        if not isinstance(item, dict):
+            item = {"description": item}
+        flags = description_flags(item.get("description"))
+        result = {"llm_flags": flags, "is_logging": flags["isLogging"]}
+        if item.get("input_lob") is not None:
+            result.update(map_lob({"input_lob": item["input_lob"], "llm_flags": flags}))
+        results.append(result)
+    return {"results": results, "keywords": KEYWORDS.digest}
+
+
+# -----------------------------------------------------------------------------
+# Issuing office
+# -----------------------------------------------------------------------------
+ISSUING_OFFICES = {
+    "riscom_louisiana": "RISCOM- Louisiana",
+    "riscom_mississippi": "RISCOM- Mississippi",
+    "riscom_texas": "RISCOM- Texas",
+    "riscom_colorado": "RISCOM- Colorado",
+    "riscom_wholesale_llc": "RISCOM Wholesale LLC",
+    "riscom_wholesale_mississippi": "RISCOM Wholesale- Mississippi",
+    "riscom_wholesale_texas": "RISCOM Wholesale- Texas",
+    "riscom_wholesale_colorado": "RISCOM Wholesale- Colorado",
+}
+
+# The Louisiana office handles LA, MS and AR agents; Colorado handles CO, TX,
+# OK, AZ and NV. MS and TX have their own offices on the pull-down.
+_RETAIL_OFFICE = {
+    "LA": "riscom_louisiana",
+    "AR": "riscom_louisiana",
+    "MS": "riscom_mississippi",
+    "TX": "riscom_texas",
+    "CO": "riscom_colorado",
+    "OK": "riscom_colorado",
+    "AZ": "riscom_colorado",
+    "NV": "riscom_colorado",
+    "CA": "riscom_colorado",
+}
+_WHOLESALE_OFFICE = {
+    "riscom_louisiana": "riscom_wholesale_llc",
+    "riscom_mississippi": "riscom_wholesale_mississippi",
+    "riscom_texas": "riscom_wholesale_texas",
+    "riscom_colorado": "riscom_wholesale_colorado",
+}
+
+
+def determine_issuing_office(body: dict) -> dict:
+    """Office for the state; umbrella/excess is always wholesale."""
+    state = str(body.get("state_code") or "").strip().upper()
+    office = _RETAIL_OFFICE.get(state)
+    if office is None:
+        return {"issuing_office": "", "issuing_office_name": "", "error": f"No issuing office for state {state!r}"}
+    if is_selected(body.get("is_commercial_umbrella")):
+        office = _WHOLESALE_OFFICE[office]
+    return {"issuing_office": office, "issuing_office_name": ISSUING_OFFICES[office]}
+
+
+# -----------------------------------------------------------------------------
+# Effective date
+# -----------------------------------------------------------------------------
+EFFECTIVE_DATE_LEAD_DAYS = 7
+MAX_DAYS_OUT = 120
+
+# (pattern, field order, strftime format to write the date back in); a regex
+# per format is several times faster than trying datetime.strptime in turn.
+_DATE_FORMATS = (
+    (re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{4})$"), "mdy", "%m/%d/%Y"),
+    (re.compile(r"^(\d{4})-(\d{1,2})-(\d{1,2})$"), "ymd", "%Y-%m-%d"),
+    (re.compile(r"^(\d{1,2})/(\d{1,2})/(\d{2})$"), "mdy", "%m/%d/%y"),
+    (re.compile(r"^(\d{1,2})-(\d{1,2})-(\d{4})$"), "mdy", "%m-%d-%Y"),
+    (re.compile(r"^(\d{4})/(\d{1,2})/(\d{1,2})$"), "ymd", "%Y/%m/%d"),
+)
+
+
+def parse_date(text) -> tuple[date, str] | tuple[None, None]:
+    """The date and the format it was written in, so it can be written back the same way."""
+    text = str(text or "").strip()
+    for pattern, order, fmt in _DATE_FORMATS:
+        m = pattern.match(text)
+        if m is None:
+            continue
+        a, b, c = (int(x) for x in m.groups())
+        year, month, day = (a, b, c) if order == "ymd" else (c, a, b)
+        if year < 100:
+            year += 2000 if year < 69 else 1900  # strptime's %y pivot
+        try:
+            return date(year, month, day), fmt
+        except ValueError:
+            return None, None
+    return None, None
+
+
+def _today(body: dict) -> date:
+    today, _ = parse_date(body.get("today"))
+    return today or date.today()
+
+
+def adjust_effective_date(body: dict) -> dict:
+    """An effective date today or already past moves to 7 days from today."""
+    original = body.get("date_str")
+    parsed, fmt = parse_date(original)
+    if parsed is None:
+        return {"adjusted_date": original, "adjusted": False, "valid": False}
+    today = _today(body)
+    if parsed <= today:
+        return {
+            "adjusted_date": (today + timedelta(days=EFFECTIVE_DATE_LEAD_DAYS)).strftime(fmt),
+            "adjusted": True,
+            "valid": True,
+            "original_date": original,
+        }
+    return {"adjusted_date": original, "adjusted": False, "valid": True}
+
+
+def check_120_days(body: dict) -> dict:
+    parsed, _ = parse_date(body.get("date_str"))
+    if parsed is None:
+        return {"exceeds_120_days": False, "days_out": None}
+    days_out = (parsed - _today(body)).days
+    return {"exceeds_120_days": days_out > MAX_DAYS_OUT, "days_out": days_out}
+
+
+# -----------------------------------------------------------------------------
+# Description format
+# -----------------------------------------------------------------------------
+_MINOR_WORDS = frozenset({"a", "an", "the", "of", "are", "in", "for", "on", "at", "to", "by", "or", "with", "from", "as"})
+_AND = re.compile(r"\band\b", re.I)
+_DROPPED_WORDS = re.compile(r"\b(the )?(insured|applicant)('s)?\b\s*(is )?", re.I)
+
+
+def format_description(body: dict) -> dict:
+    """Capitalize each word except minor ones, '&' for 'and', no 'insured'/'applicant'."""
+    text = _DROPPED_WORDS.sub("", str(body.get("description") or ""))
+    words = _AND.sub("&", text).split()
+    out = []
+    for i, word in enumerate(words):
+        lower = word.lower()
+        if i and lower in _MINOR_WORDS:
+            out.append(lower)
+        elif word.isupper() and len(word) > 1:
+            out.append(word)  # acronyms: LRO, NEMT
+        else:
+            out.append(word[:1].upper() + word[1:])
+    return {"formatted_description": " ".join(out).rstrip(".")}
@@ -0,0 +1,409 @@
+"""Business-description analysis behind /gemini/analyze_description.
+
+Every submission's description is analyzed, and descriptions repeat heavily
+across agencies (the same trucking, towing and garage boilerplate). Results
+are cached on a hash of the normalized text: an in-memory LRU in front of an
+optional SQLite file, so a restarted gateway or a batch worker starts warm.
+
+Concurrent requests for the same text wait on one analysis, and cache misses
+that arrive within `batch_window` seconds of each other go to the backend
+as one call of up to `max_batch` descriptions.
+
+Backends (DESCRIPTION_BACKEND):
+  rules   the keyword rules in `clearance_services` (default; no I/O)
+  stub    the same rules behind a fixed per-call delay, standing in for a
+          model in tests and benchmarks
+  gemini  Gemini generateContent, one prompt per batch (GEMINI_API_KEY)
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import OrderedDict
+
+import clearance_services as services
+
+logger = logging.getLogger("winrm-gateway.clearance")
+
+FLAG_KEYS = ("isWreckerTow", "isMarine", "isGarage", "isGarageDealer", "isTrucking", "isLogging")
+EMPTY_FLAGS = dict.fromkeys(FLAG_KEYS, False)
+
+
+def normalize_description(text) -> str:
+    """Casefolded with whitespace collapsed; the form that is hashed and analyzed."""
+    if not text:
+        return ""
+    return " ".join(str(text).casefold().split())
+
+
+def _coerce_flags(item) -> dict:
+    if not isinstance(item, dict):
+        raise ValueError(f"Expected an object of flags, got {item!r}")
+    return {key: item.get(key) is True for key in FLAG_KEYS}
+
+
+# -----------------------------------------------------------------------------
+# Backends: analyze_batch(texts) -> one flags dict per text, in order
+# -----------------------------------------------------------------------------
+class RulesBackend:
+    # Cheap enough to run on the event loop.
+    blocking = False
+
+    def __init__(self) -> None:
+        self.calls = 0
+
+    @property
+    def name(self) -> str:
+        # Changes with the keyword file, so a reload starts a cold cache.
+        return f"rules:{services.KEYWORDS.digest}"
+
+    def analyze_batch(self, texts: list[str]) -> list[dict]:
+        self.calls += 1
+        return [services.analyze_description({"description": text})["llm_flags"] for text in texts]
+
+
+class StubBackend(RulesBackend):
+    """The keyword rules with a model's round-trip latency, per call rather than per text."""
+
+    blocking = True
+
+    def __init__(self, latency: float = 0.2) -> None:
+        super().__init__()
+        self.latency = latency
+
+    @property
+    def name(self) -> str:
+        return f"stub:{services.KEYWORDS.digest}"
+
+    def analyze_batch(self, texts: list[str]) -> list[dict]:
+        time.sleep(self.latency)
+        return super().analyze_batch(texts)
+
+
+GEMINI_PROMPT = """You classify insurance applicants from their business description.
+For each numbered description return an object with these boolean fields:
+  isWreckerTow   towing, wrecker or roadside recovery services
+  isMarine       marine operations (boats, marinas, marine towing)
+  isGarage       auto service, repair, body shop, tire shop or vehicle dealer (false if towing)
+  isGarageDealer a garage that sells vehicles (car lot, dealership)
+  isTrucking     for-hire trucking or hauling (sand, dirt, gravel, freight); not trash or roll-off hauling
+  isLogging      hauls logs or mechanized logging; not treated wood, pellets, lumber, paper or finished goods
+Answer with a JSON array holding one object per description, in order.
+
+Descriptions:
+"""
+
+
+class GeminiBackend:
+    name_format = "gemini:{model}:1"
+    blocking = True
+    url = "https://generativelanguage.googleapis.com/v1beta/models/{model}:generateContent"
+
+    def __init__(self, api_key: str, model: str = "gemini-1.5-flash", timeout: float = 30.0) -> None:
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.name = self.name_format.format(model=model)
+        self.calls = 0
+
+    def analyze_batch(self, texts: list[str]) -> list[dict]:
+        self.calls += 1
+        prompt = GEMINI_PROMPT + "\n".join(f"{i}. {json.dumps(text)}" for i, text in enumerate(texts, 1))
+        body = {
+            "contents": [{"parts": [{"text": prompt}]}],
+            "generationConfig": {"temperature": 0, "responseMimeType": "application/json"},
+        }
+        req = urllib.request.Request(
+            self.url.format(model=self.model),
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json", "x-goog-api-key": self.api_key},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                doc = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            raise RuntimeError(f"Gemini returned {e.code}: {e.read()[:500]!r}") from e
+        try:
+            items = json.loads(doc["candidates"][0]["content"]["parts"][0]["text"])
+        except (KeyError, IndexError, ValueError) as e:
+            raise RuntimeError(f"Unexpected Gemini response: {str(doc)[:500]}") from e
+        if not isinstance(items, list) or len(items) != len(texts):
+            raise RuntimeError(f"Gemini answered {len(items) if isinstance(items, list) else 'no list'} for {len(texts)} descriptions")
+        return [_coerce_flags(item) for item in items]
+
+
+# -----------------------------------------------------------------------------
+# Cache
+# -----------------------------------------------------------------------------
+class AnalysisCache:
+    """LRU of flags by key, written through to SQLite when a path is given."""
+
+    def __init__(self, path: str | None = None, *, max_entries: int = 50_000) -> None:
+        self.path = path or None
+        self.max_entries = max_entries
+        self._entries: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+        if self.path:
+            # Shared with batch workers: WAL lets them read while one writes.
+            self._db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS description_flags (key TEXT PRIMARY KEY, flags TEXT NOT NULL, stored_at REAL NOT NULL)"
+            )
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.write_errors = 0
+
+    def _remember(self, key: str, flags: dict) -> None:
+        self._entries[key] = flags
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            flags = self._entries.get(key)
+            if flags is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return flags
+            if self._db is not None:
+                row = self._db.execute("SELECT flags FROM description_flags WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    flags = json.loads(row[0])
+                    self._remember(key, flags)
+                    self.disk_hits += 1
+                    return flags
+            self.misses += 1
+            return None
+
+    def put_many(self, items: list[tuple[str, dict]]) -> None:
+        with self._lock:
+            for key, flags in items:
+                self._remember(key, flags)
+            if self._db is None:
+                return
+            now = time.time()
+            try:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO description_flags (key, flags, stored_at) VALUES (?, ?, ?)",
+                    [(key, json.dumps(flags), now) for key, flags in items],
+                )
+            except sqlite3.Error as e:
+                # Still cached in memory; the next miss elsewhere re-analyzes.
+                self.write_errors += 1
+                logger.warning("Description cache write failed: %s", e)
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.disk_hits + self.misses
+        out = {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "path": self.path,
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "write_errors": self.write_errors,
+            "hit_rate": round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+        }
+        if self._db is not None:
+            with self._lock:
+                out["disk_entries"] = self._db.execute("SELECT COUNT(*) FROM description_flags").fetchone()[0]
+        return out
+
+
+# -----------------------------------------------------------------------------
+# Analyzer
+# -----------------------------------------------------------------------------
+class DescriptionAnalyzer:
+    def __init__(self, backend, cache: AnalysisCache | None = None, *, batch_window: float = 0.01, max_batch: int = 32) -> None:
+        self.backend = backend
+        self.cache = cache if cache is not None else AnalysisCache()
+        self.batch_window = batch_window
+        self.max_batch = max(1, max_batch)
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._queue: list[tuple[str, str]] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+        self.requests = 0
+        self.coalesced = 0
+        self.batches = 0
+        self.analyzed = 0
+        self.errors = 0
+
+    def key(self, normalized: str) -> str:
+        # The backend name is part of the key: a new model or rule set starts cold.
+        return hashlib.sha1(f"{self.backend.name}\x00{normalized}".encode("utf-8")).hexdigest()
+
+    def _call_backend(self, texts: list[str]) -> list[dict]:
+        results = self.backend.analyze_batch(texts)
+        if len(results) != len(texts):
+            raise RuntimeError(f"Backend returned {len(results)} results for {len(texts)} descriptions")
+        self.batches += 1
+        self.analyzed += len(texts)
+        return [_coerce_flags(flags) for flags in results]
+
+    async def analyze(self, text) -> dict:
+        """Flags for one description: cache, then a shared in-flight analysis, then the next batch."""
+        self.requests += 1
+        normalized = normalize_description(text)
+        if not normalized:
+            return dict(EMPTY_FLAGS)
+        key = self.key(normalized)
+        flags = self.cache.get(key)
+        if flags is not None:
+            return dict(flags)
+
+        fut = self._inflight.get(key)
+        if fut is not None:
+            self.coalesced += 1
+            return dict(await asyncio.shield(fut))
+
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._inflight[key] = fut
+        self._queue.append((key, normalized))
+        if len(self._queue) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.batch_window, self._flush)
+        return dict(await asyncio.shield(fut))
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        while self._queue:
+            batch, self._queue = self._queue[: self.max_batch], self._queue[self.max_batch :]
+            task = asyncio.get_running_loop().create_task(self._run_batch(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch: list[tuple[str, str]]) -> None:
+        texts = [normalized for _, normalized in batch]
+        try:
+            if self.backend.blocking:
+                results = await asyncio.get_running_loop().run_in_executor(None, self._call_backend, texts)
+            else:
+                results = self._call_backend(texts)
+        except Exception as e:
+            self.errors += 1
+            logger.warning("Description analysis failed for %d description(s): %s", len(batch), e)
+            for key, _ in batch:
+                fut = self._inflight.pop(key)
+                fut.set_exception(e)
+                # Mark retrieved in case every waiter has gone away.
+                fut.exception()
+            return
+        self.cache.put_many([(key, flags) for (key, _), flags in zip(batch, results)])
+        for (key, _), flags in zip(batch, results):
+            self._inflight.pop(key).set_result(flags)
+
+    def attach(self, loop: asyncio.AbstractEventLoop | None) -> None:
+        """Route `service` calls from threads through `analyze` on `loop`; None detaches."""
+        self._loop = loop
+
+    def analyze_sync(self, text) -> dict:
+        """Flags for one description from a process with no event loop; a miss is analyzed on its own."""
+        self.requests += 1
+        normalized = normalize_description(text)
+        if not normalized:
+            return dict(EMPTY_FLAGS)
+        key = self.key(normalized)
+        flags = self.cache.get(key)
+        if flags is None:
+            flags = self._call_backend([normalized])[0]
+            self.cache.put_many([(key, flags)])
+        return dict(flags)
+
+    def service(self, body: dict) -> dict:
+        """The /gemini/analyze_description service for the in-process rules engine.
+
+        Once attached, the engine runs in executor threads and, with a blocking
+        backend, each call waits on `analyze` in the loop, sharing its
+        coalescing and batches. A non-blocking backend answers faster than the
+        batch window, so it is called here, through the same cache. Batch
+        worker processes are never attached and use `analyze_sync`.
+        """
+        text = body.get("description")
+        loop = self._loop
+        if loop is None or loop.is_closed() or not self.backend.blocking:
+            return {"llm_flags": self.analyze_sync(text)}
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            # Waiting here would deadlock the loop the analysis needs.
+            raise RuntimeError("The rules engine must run in an executor thread, not on the event loop")
+        return {"llm_flags": asyncio.run_coroutine_threadsafe(self.analyze(text), loop).result()}
+
+    def close(self) -> None:
+        self.cache.close()
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.backend.name,
+            "batch_window": self.batch_window,
+            "max_batch": self.max_batch,
+            "requests": self.requests,
+            "coalesced": self.coalesced,
+            "batches": self.batches,
+            "analyzed": self.analyzed,
+            "mean_batch": round(self.analyzed / self.batches, 2) if self.batches else 0.0,
+            "errors": self.errors,
+            "in_flight": len(self._inflight),
+            "cache": self.cache.stats(),
+        }
+
+
+def backend_from_env():
+    kind = os.getenv("DESCRIPTION_BACKEND", "rules").strip().lower() or "rules"
+    if kind == "rules":
+        return RulesBackend()
+    if kind == "stub":
+        return StubBackend(latency=float(os.getenv("DESCRIPTION_STUB_LATENCY_MS", 200)) / 1000)
+    if kind == "gemini":
+        api_key = os.getenv("GEMINI_API_KEY", "").strip()
+        if not api_key:
+            raise RuntimeError("DESCRIPTION_BACKEND=gemini requires GEMINI_API_KEY")
+        return GeminiBackend(api_key, model=os.getenv("GEMINI_MODEL", "gemini-1.5-flash").strip())
+    raise RuntimeError(f"Unknown DESCRIPTION_BACKEND {kind!r} (rules, stub or gemini)")
+
+
+def analyzer_from_env() -> DescriptionAnalyzer:
+    cache = AnalysisCache(
+        os.getenv("DESCRIPTION_CACHE_PATH", "").strip() or None,
+        max_entries=int(os.getenv("DESCRIPTION_CACHE_SIZE", 50_000)),
+    )
+    return DescriptionAnalyzer(
+        backend_from_env(),
+        cache,
+        batch_window=float(os.getenv("DESCRIPTION_BATCH_WINDOW_MS", 10)) / 1000,
+        max_batch=int(os.getenv("DESCRIPTION_BATCH_MAX", 32)),
+    )
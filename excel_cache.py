@@ -0,0 +1,177 @@
+"""Freshness-validated response cache for /excel/read.
+
+Entries are keyed on the file path plus the read parameters (sheet, range,
+window, mode) and remember the file's size and LastWriteTime at read time.
+A hit is only served after a cheap remote stat confirms the file is
+unchanged, so a cached workbook can never be stale; the TTL just bounds how
+long an unread entry occupies memory.
+
+The cache stores the serialized response body, so a hit costs no JSON work.
+`SingleFlight` collapses concurrent reads of the same key into one remote
+execution.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable
+
+
+@dataclass(frozen=True)
+class FileStamp:
+    size: int
+    mtime_ticks: int
+
+    @classmethod
+    def parse(cls, text: str) -> "FileStamp | None":
+        """Parse the `<length>|<LastWriteTimeUtc.Ticks>` line of the stat script."""
+        try:
+            size, ticks = text.strip().split("|", 1)
+            return cls(int(size), int(ticks))
+        except ValueError:
+            return None
+
+
+def stat_script(file_path: str) -> str:
+    quoted = "'" + file_path.replace("'", "''") + "'"
+    return (
+        f"$i = Get-Item -LiteralPath {quoted} -ErrorAction SilentlyContinue; "
+        'if ($i) { "$($i.Length)|$($i.LastWriteTimeUtc.Ticks)" }'
+    )
+
+
+def cache_key(file_path: str, params: dict) -> str:
+    return json.dumps([file_path.lower(), params], sort_keys=True, default=str)
+
+
+def make_etag(key: str, stamp: FileStamp) -> str:
+    digest = hashlib.sha1(f"{key}|{stamp.size}|{stamp.mtime_ticks}".encode("utf-8")).hexdigest()[:24]
+    return f'"{digest}"'
+
+
+@dataclass
+class CacheEntry:
+    stamp: FileStamp
+    etag: str
+    body: bytes
+    stored_at: float
+
+
+class ReadCache:
+    """LRU bounded by total body bytes and entry age."""
+
+    def __init__(self, *, max_bytes: int = 256 * 1024 * 1024, ttl: float = 3600.0) -> None:
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: OrderedDict[str, CacheEntry] = OrderedDict()
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry.body)
+
+    def get(self, key: str, stamp: FileStamp | None) -> CacheEntry | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        if time.monotonic() - entry.stored_at > self.ttl or entry.stamp != stamp:
+            self._drop(key)
+            self.stale += 1
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def peek(self, key: str) -> CacheEntry | None:
+        return self._entries.get(key)
+
+    def put(self, key: str, stamp: FileStamp, body: bytes) -> CacheEntry:
+        entry = CacheEntry(stamp, make_etag(key, stamp), body, time.monotonic())
+        if len(body) > self.max_bytes:
+            # Too large to cache; still hand back an entry for the ETag.
+            return entry
+        self._drop(key)
+        self._entries[key] = entry
+        self._bytes += len(body)
+        while self._bytes > self.max_bytes and self._entries:
+            oldest = next(iter(self._entries))
+            self._drop(oldest)
+            self.evictions += 1
+        return entry
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one in-flight coroutine between concurrent callers of the same key.
+
+    The coroutine runs as a task owned by the flight, and every caller awaits
+    it through `asyncio.shield`: a caller that goes away (client disconnect)
+    only stops its own wait. The task is cancelled once no caller is left.
+    """
+
+    def __init__(self) -> None:
+        self._flights: dict[str, _Flight] = {}
+        self.collapsed = 0
+
+    async def run(self, key: str, factory: Callable[[], Awaitable]):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(factory()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda task: self._finished(key, flight, task))
+        else:
+            self.collapsed += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # Nobody wants the result any more; a new caller starts afresh.
+                flight.task.cancel()
+                self._drop(key, flight)
+
+    def _finished(self, key: str, flight: _Flight, task: asyncio.Task) -> None:
+        self._drop(key, flight)
+        if not task.cancelled():
+            # Mark retrieved so an unshared failure doesn't log a warning.
+            task.exception()
+
+    def _drop(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
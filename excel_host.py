@@ -0,0 +1,185 @@
+"""Gateway client for the persistent Excel COM host (functions/excel_host.ps1).
+
+The host runs in the interactive desktop session and listens on a named pipe.
+Each gateway request runs a tiny PowerShell pipe client over WinRM instead of
+launching and quitting Excel. If the pipe is not there (host never started,
+crashed, or was killed) the client uploads the host script, starts it through
+a scheduled task in the interactive session, waits for the pipe and retries.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Callable
+
+logger = logging.getLogger("winrm-gateway.excel-host")
+
+HOST_SCRIPT = Path(__file__).resolve().parent / "functions" / "excel_host.ps1"
+
+# Exit code the pipe client uses when nothing is listening on the pipe.
+EXIT_HOST_UNAVAILABLE = 10
+
+
+def ps_quote(s: str) -> str:
+    # Single-quote and escape single quotes for PowerShell.
+    return "'" + s.replace("'", "''") + "'"
+
+
+class ExcelHostUnavailable(RuntimeError):
+    """Raised when the Excel host could not be started or reached."""
+
+
+class ExcelHostClient:
+    def __init__(
+        self,
+        run_ps: Callable[..., dict],
+        *,
+        pipe_name: str = "gateway-excel-host",
+        base_path: str = r"C:\Windows\Temp\excel-host",
+        task_name: str = "Gateway-Excel-Host",
+        connect_timeout_ms: int = 30000,
+        start_timeout_s: int = 60,
+        max_operations: int = 500,
+        max_memory_mb: int = 1024,
+        max_workbooks: int = 8,
+    ) -> None:
+        self._run_ps = run_ps
+        self.pipe_name = pipe_name
+        self.base_path = base_path
+        self.task_name = task_name
+        self.connect_timeout_ms = connect_timeout_ms
+        self.start_timeout_s = start_timeout_s
+        self.max_operations = max_operations
+        self.max_memory_mb = max_memory_mb
+        self.max_workbooks = max_workbooks
+
+        self._start_lock = threading.Lock()
+        self.starts = 0
+        self.requests = 0
+
+    # -------------------------------------------------------------------------
+    # Pipe client
+    # -------------------------------------------------------------------------
+    def _client_script(self, request: dict) -> str:
+        return f"""
+$ErrorActionPreference = 'Stop'
+$enc = New-Object System.Text.UTF8Encoding($false)
+[Console]::OutputEncoding = $enc
+$client = New-Object System.IO.Pipes.NamedPipeClientStream('.', {ps_quote(self.pipe_name)}, [System.IO.Pipes.PipeDirection]::InOut)
+try {{
+    $client.Connect({int(self.connect_timeout_ms)})
+}} catch {{
+    [Console]::Error.Write('Excel host is not running')
+    exit {EXIT_HOST_UNAVAILABLE}
+}}
+try {{
+    $writer = New-Object System.IO.StreamWriter($client, $enc, 65536, $true)
+    $reader = New-Object System.IO.StreamReader($client, $enc, $false, 65536, $true)
+    $writer.Write({ps_quote(json.dumps(request))} + "`n")
+    $writer.Flush()
+    $header = $reader.ReadLine() | ConvertFrom-Json
+    $payload = $reader.ReadToEnd()
+}} finally {{
+    $client.Dispose()
+}}
+if ($header.ok) {{
+    [Console]::Out.Write($payload)
+    exit 0
+}}
+[Console]::Error.Write([string]$header.error)
+exit 3
+"""
+
+    def _start_script(self) -> str:
+        host_script = HOST_SCRIPT.read_text(encoding="utf-8")
+        script_path = f"{self.base_path}\\excel_host.ps1"
+        args = (
+            f"-PipeName {self.pipe_name} -MaxOperations {int(self.max_operations)} "
+            f"-MaxMemoryMB {int(self.max_memory_mb)} -MaxWorkbooks {int(self.max_workbooks)}"
+        )
+        return f"""
+$ErrorActionPreference = 'Stop'
+$basePath = {ps_quote(self.base_path)}
+$scriptPath = {ps_quote(script_path)}
+$taskName = {ps_quote(self.task_name)}
+$pipeName = {ps_quote(self.pipe_name)}
+
+if (Test-Path ('\\\\.\\pipe\\' + $pipeName)) {{
+    Write-Output 'already running'
+    exit 0
+}}
+
+New-Item -ItemType Directory -Force -Path $basePath | Out-Null
+@'
+{host_script}
+'@ | Set-Content -Path $scriptPath -Encoding UTF8
+
+$currentUser = [System.Security.Principal.WindowsIdentity]::GetCurrent().Name
+$action = "C:\\Windows\\System32\\WindowsPowerShell\\v1.0\\powershell.exe -NoProfile -ExecutionPolicy Bypass -STA -File $scriptPath {args}"
+
+try {{ schtasks /Delete /TN $taskName /F 2>&1 | Out-Null }} catch {{}}
+schtasks /Create /F /TN $taskName /SC ONCE /ST 00:00 /RL HIGHEST /RU $currentUser /IT /TR $action | Out-Null
+schtasks /Run /TN $taskName | Out-Null
+
+# Wait on the remote side for the pipe instead of polling over WinRM.
+$deadline = (Get-Date).AddSeconds({int(self.start_timeout_s)})
+while ((Get-Date) -lt $deadline) {{
+    if (Test-Path ('\\\\.\\pipe\\' + $pipeName)) {{
+        Write-Output 'started'
+        exit 0
+    }}
+    Start-Sleep -Milliseconds 200
+}}
+Write-Error "Excel host did not open pipe $pipeName within {int(self.start_timeout_s)}s"
+exit 4
+"""
+
+    def ensure_started(self) -> None:
+        with self._start_lock:
+            result = self._run_ps(self._start_script(), timeout=self.start_timeout_s + 30)
+            if not result["success"]:
+                raise ExcelHostUnavailable(f"Could not start Excel host: {result['stderr']}")
+            if result["stdout"].strip() == "started":
+                self.starts += 1
+                logger.info("Started Excel host task %s", self.task_name)
+
+    def request(self, request: dict, timeout: int = 90) -> dict:
+        """Send one request; starts (or restarts) the host when it is not running."""
+        self.requests += 1
+        result = self._run_ps(self._client_script(request), timeout=timeout)
+        if result["status"] == EXIT_HOST_UNAVAILABLE:
+            logger.warning("Excel host unavailable; starting it")
+            self.ensure_started()
+            result = self._run_ps(self._client_script(request), timeout=timeout)
+            if result["status"] == EXIT_HOST_UNAVAILABLE:
+                raise ExcelHostUnavailable("Excel host is not reachable after restart")
+        return result
+
+    # -------------------------------------------------------------------------
+    # Operations
+    # -------------------------------------------------------------------------
+    def exec(self, code: str, path: str | None = None, visible: bool = False, timeout: int = 90) -> dict:
+        """Run `code` in the host with $excel (and $workbook for `path`) in scope."""
+        req = {"op": "exec", "code": code, "visible": visible}
+        if path:
+            req["path"] = path
+        return self.request(req, timeout=timeout)
+
+    def close_workbook(self, path: str) -> dict:
+        return self.request({"op": "close", "path": path})
+
+    def stats(self) -> dict:
+        result = self.request({"op": "stats"})
+        host = None
+        if result["success"]:
+            try:
+                host = json.loads(result["stdout"])
+            except ValueError:
+                host = {"raw": result["stdout"]}
+        return {"starts": self.starts, "requests": self.requests, "host": host}
+
+    def shutdown(self) -> dict:
+        return self._run_ps(self._client_script({"op": "shutdown"}))
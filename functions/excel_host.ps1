@@ -0,0 +1,284 @@
+<#
+Long-lived Excel COM host for the WinRM gateway.
+
+Runs in the interactive session (started by the gateway through a scheduled
+task) and keeps one Excel.Application alive across requests, so reads and
+opens do not pay for Excel's cold start every time.
+
+Protocol (named pipe, one request per connection):
+  -> one line of JSON: { "op": "exec"|"ping"|"stats"|"close"|"shutdown", ... }
+     exec: { "code": "<PowerShell>", "path": "<workbook>"?, "visible": bool }
+           The code runs with $excel, $workbook (if path given) and
+           $ExcelFile in scope; whatever it outputs is the payload.
+  <- one line of JSON header: { "ok": true } or { "ok": false, "error": "..." }
+  <- the payload (raw text) until the pipe closes
+
+Workbooks are cached by path and mode. A cached read-only workbook is
+reopened when the file's LastWriteTime changes. Excel itself is recycled
+after -MaxOperations operations or when its working set passes
+-MaxMemoryMB (deferred while user-visible workbooks are open), and restarted
+automatically if the COM server dies.
+#>
+
+[CmdletBinding()]
+param(
+  [string]$PipeName = 'gateway-excel-host',
+  [int]$MaxOperations = 500,
+  [int]$MaxMemoryMB = 1024,
+  [int]$MaxWorkbooks = 8
+)
+
+$ErrorActionPreference = 'Stop'
+
+Add-Type -AssemblyName System.Web | Out-Null
+Add-Type -AssemblyName System.Core | Out-Null
+
+if (-not ("ExcelHostNative" -as [type])) {
+  Add-Type @"
+using System;
+using System.Runtime.InteropServices;
+public class ExcelHostNative {
+    [DllImport("user32.dll")]
+    public static extern uint GetWindowThreadProcessId(IntPtr hWnd, out uint processId);
+}
+"@
+}
+
+$script:excel = $null
+$script:excelPid = $null
+$script:ops = 0
+$script:restarts = 0
+$script:recycles = 0
+$script:started = Get-Date
+# key -> @{ workbook; path; visible; stamp; lastUsed }
+$script:workbooks = @{}
+
+function Release-Com {
+  param($Obj)
+  if ($Obj) {
+    try { [Runtime.InteropServices.Marshal]::ReleaseComObject($Obj) | Out-Null } catch {}
+  }
+}
+
+function Start-Excel {
+  $script:excel = New-Object -ComObject Excel.Application
+  $script:excel.Visible = $false
+  $script:excel.DisplayAlerts = $false
+  $script:excel.ScreenUpdating = $true
+  $procId = [uint32]0
+  [void][ExcelHostNative]::GetWindowThreadProcessId([IntPtr]$script:excel.Hwnd, [ref]$procId)
+  $script:excelPid = [int]$procId
+  $script:ops = 0
+  $script:workbooks = @{}
+}
+
+function Stop-Excel {
+  foreach ($entry in @($script:workbooks.Values)) {
+    try { $entry.workbook.Close($false) } catch {}
+    Release-Com $entry.workbook
+  }
+  $script:workbooks = @{}
+  if ($script:excel) {
+    try { $script:excel.Quit() } catch {}
+    Release-Com $script:excel
+  }
+  $script:excel = $null
+  [GC]::Collect()
+  [GC]::WaitForPendingFinalizers()
+  if ($script:excelPid) {
+    # Quit() can leave a zombie EXCEL.EXE behind when COM references leak.
+    Start-Sleep -Milliseconds 200
+    Stop-Process -Id $script:excelPid -Force -ErrorAction SilentlyContinue
+  }
+  $script:excelPid = $null
+}
+
+function Test-ExcelAlive {
+  if (-not $script:excel) { return $false }
+  try {
+    $null = $script:excel.Version
+    if ($script:excelPid -and -not (Get-Process -Id $script:excelPid -ErrorAction SilentlyContinue)) { return $false }
+    return $true
+  } catch {
+    return $false
+  }
+}
+
+function Get-ExcelMemoryMB {
+  if (-not $script:excelPid) { return 0 }
+  $p = Get-Process -Id $script:excelPid -ErrorAction SilentlyContinue
+  if (-not $p) { return 0 }
+  return [int]($p.WorkingSet64 / 1MB)
+}
+
+function Ensure-Excel {
+  if (-not (Test-ExcelAlive)) {
+    if ($script:excel -or $script:excelPid) {
+      # The COM server died under us: drop stale references and restart.
+      $script:restarts++
+      try { Stop-Excel } catch {}
+    }
+    Start-Excel
+    return
+  }
+
+  # Anything open in a visible Excel that is not one of our hidden read-only
+  # copies belongs to the user (opened or created through /excel/open).
+  $hidden = @($script:workbooks.Values | Where-Object { -not $_.visible }).Count
+  $hasVisible = $false
+  try { $hasVisible = $script:excel.Visible -and $script:excel.Workbooks.Count -gt $hidden } catch {}
+  if (-not $hasVisible -and (($script:ops -ge $MaxOperations) -or ((Get-ExcelMemoryMB) -ge $MaxMemoryMB))) {
+    $script:recycles++
+    Stop-Excel
+    Start-Excel
+  }
+}
+
+function Get-CachedWorkbook {
+  param(
+    [Parameter(Mandatory=$true)][string]$Path,
+    [bool]$Visible
+  )
+
+  $item = Get-Item -LiteralPath $Path
+  $stamp = "$($item.Length)|$($item.LastWriteTimeUtc.Ticks)"
+  $key = "$($Path.ToLowerInvariant())|$Visible"
+
+  $entry = $script:workbooks[$key]
+  if ($entry) {
+    $stillOpen = $true
+    try { $null = $entry.workbook.Name } catch { $stillOpen = $false }
+    # Read-only copies go stale when the file changes; user-visible workbooks
+    # are the user's to manage.
+    if ($stillOpen -and ($Visible -or $entry.stamp -eq $stamp)) {
+      $entry.lastUsed = Get-Date
+      return $entry.workbook
+    }
+    try { $entry.workbook.Close($false) } catch {}
+    Release-Com $entry.workbook
+    $script:workbooks.Remove($key)
+  }
+
+  # Keep the cache bounded: close the least recently used read-only workbook.
+  while ($script:workbooks.Count -ge $MaxWorkbooks) {
+    $oldest = $script:workbooks.GetEnumerator() |
+      Where-Object { -not $_.Value.visible } |
+      Sort-Object { $_.Value.lastUsed } |
+      Select-Object -First 1
+    if (-not $oldest) { break }
+    try { $oldest.Value.workbook.Close($false) } catch {}
+    Release-Com $oldest.Value.workbook
+    $script:workbooks.Remove($oldest.Key)
+  }
+
+  if ($Visible) {
+    $script:excel.Visible = $true
+    $wb = $script:excel.Workbooks.Open($Path)
+  } else {
+    # UpdateLinks=0, ReadOnly=true; hide the window so a visible Excel
+    # (from an earlier open request) doesn't flash read-only workbooks.
+    $wb = $script:excel.Workbooks.Open($Path, 0, $true)
+    try { $wb.Windows.Item(1).Visible = $false } catch {}
+  }
+
+  $script:workbooks[$key] = @{ workbook = $wb; path = $Path; visible = $Visible; stamp = $stamp; lastUsed = Get-Date }
+  return $wb
+}
+
+function Invoke-HostRequest {
+  param([Parameter(Mandatory=$true)]$Request)
+
+  switch ([string]$Request.op) {
+    'ping' { return 'pong' }
+
+    'stats' {
+      $stats = @{
+        pid = $PID
+        excel_pid = $script:excelPid
+        excel_alive = (Test-ExcelAlive)
+        excel_memory_mb = (Get-ExcelMemoryMB)
+        ops_since_start = $script:ops
+        restarts = $script:restarts
+        recycles = $script:recycles
+        started = $script:started.ToString('o')
+        workbooks = @($script:workbooks.Values | ForEach-Object { @{ path = $_.path; visible = $_.visible } })
+      }
+      return ($stats | ConvertTo-Json -Depth 4 -Compress)
+    }
+
+    'close' {
+      $path = [string]$Request.path
+      foreach ($key in @($script:workbooks.Keys)) {
+        $entry = $script:workbooks[$key]
+        if ($entry.path -ieq $path) {
+          try { $entry.workbook.Close($false) } catch {}
+          Release-Com $entry.workbook
+          $script:workbooks.Remove($key)
+        }
+      }
+      return '{"success":true}'
+    }
+
+    'exec' {
+      Ensure-Excel
+      $script:ops++
+
+      $excel = $script:excel
+      $workbook = $null
+      $ExcelFile = $null
+      if ($Request.path) {
+        $ExcelFile = [string]$Request.path
+        if (-not (Test-Path -LiteralPath $ExcelFile)) { throw "File not found: $ExcelFile" }
+        $workbook = Get-CachedWorkbook -Path $ExcelFile -Visible ([bool]$Request.visible)
+      }
+
+      $block = [scriptblock]::Create([string]$Request.code)
+      $out = & $block
+      return (@($out) -join "`n")
+    }
+
+    default { throw "Unsupported op: $($Request.op)" }
+  }
+}
+
+$utf8 = New-Object System.Text.UTF8Encoding($false)
+Start-Excel
+
+while ($true) {
+  $server = New-Object System.IO.Pipes.NamedPipeServerStream(
+    $PipeName,
+    [System.IO.Pipes.PipeDirection]::InOut,
+    1,
+    [System.IO.Pipes.PipeTransmissionMode]::Byte
+  )
+  try {
+    $server.WaitForConnection()
+    $reader = New-Object System.IO.StreamReader($server, $utf8, $false, 65536, $true)
+    $writer = New-Object System.IO.StreamWriter($server, $utf8, 65536, $true)
+    $shutdown = $false
+    try {
+      $line = $reader.ReadLine()
+      $request = $line | ConvertFrom-Json
+      if ($request.op -eq 'shutdown') {
+        $shutdown = $true
+        $payload = ''
+      } else {
+        $payload = Invoke-HostRequest -Request $request
+      }
+      $writer.Write('{"ok":true}' + "`n")
+      $writer.Write([string]$payload)
+    } catch {
+      $err = @{ ok = $false; error = $_.Exception.Message } | ConvertTo-Json -Compress
+      $writer.Write($err + "`n")
+    }
+    $writer.Flush()
+    $server.WaitForPipeDrain()
+    if ($shutdown) { break }
+  } catch {
+    # Client went away mid-request; keep serving.
+  } finally {
+    $server.Dispose()
+  }
+}
+
+Stop-Excel
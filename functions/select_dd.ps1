@@ -2,6 +2,9 @@ Add-Type -AssemblyName UIAutomationClient
 Add-Type -AssemblyName UIAutomationTypes
 Add-Type -AssemblyName System.Windows.Forms
 
+# Cached element lookup (Find-UiaAll, Find-UiaLabeledElement, ...)
+. (Join-Path $PSScriptRoot 'uia_cache.ps1')
+
 # ---------------- Win32 helper (safe add) ----------------
 if (-not ("Win32" -as [type])) {
     Add-Type @"
@@ -15,7 +18,7 @@ public class Win32 {
 }
 
 # Select DropDown---------------- Helper: Select IMS Combo by Value ----------------
-function Select-IMSComboByValue {
+function Find-IMSComboByValue {
     param (
         [Parameter(Mandatory)]
         [System.Windows.Automation.AutomationElement]$container,
@@ -24,17 +27,15 @@ function Select-IMSComboByValue {
         [string]$value
     )
 
-    Write-Host "▶ Selecting IMS Combo value: '$value'" -ForegroundColor Cyan
-
     $initialKey = $value.Substring(0,1)
-    Write-Host "  • Initial key derived: '$initialKey'"
 
-    $comboBoxes = $container.FindAll(
-        [System.Windows.Automation.TreeScope]::Descendants,
-        (New-Object System.Windows.Automation.PropertyCondition(
+    # One call for every ComboBox with its whole subtree; the ListItems below
+    # are read from that cache.
+    $comboBoxes = Find-UiaAll -Element $container -Scope Descendants -CacheScope 'Element, Descendants' -Condition (
+        New-Object System.Windows.Automation.PropertyCondition(
             [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
             [System.Windows.Automation.ControlType]::ComboBox
-        ))
+        )
     )
 
     Write-Host "  • ComboBoxes found in container: $($comboBoxes.Count)"
@@ -44,15 +45,9 @@ function Select-IMSComboByValue {
         $comboIndex++
 
         Write-Host ""
-        Write-Host "  ▶ Inspecting ComboBox #$comboIndex (AutomationId='$($combo.Current.AutomationId)')" -ForegroundColor Yellow
-
-        $items = $combo.FindAll(
-            [System.Windows.Automation.TreeScope]::Descendants,
-            (New-Object System.Windows.Automation.PropertyCondition(
-                [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
-                [System.Windows.Automation.ControlType]::ListItem
-            ))
-        )
+        Write-Host "  ▶ Inspecting ComboBox #$comboIndex (AutomationId='$($combo.Cached.AutomationId)')" -ForegroundColor Yellow
+
+        $items = Get-UiaCachedDescendants -Element $combo -ControlType ([System.Windows.Automation.ControlType]::ListItem)
 
         if ($items.Count -eq 0) {
             Write-Host "    ⛔ No ListItems found — skipping"
@@ -63,9 +58,9 @@ function Select-IMSComboByValue {
 
         $matching = @()
         foreach ($i in $items) {
-            Write-Host "      - Item: '$($i.Current.Name)'"
+            Write-Host "      - Item: '$($i.Cached.Name)'"
 
-            if ($i.Current.Name.StartsWith($initialKey, [StringComparison]::InvariantCultureIgnoreCase)) {
+            if ($i.Cached.Name.StartsWith($initialKey, [StringComparison]::InvariantCultureIgnoreCase)) {
                 $matching += $i
             }
         }
@@ -79,7 +74,7 @@ function Select-IMSComboByValue {
 
         $targetIndex = -1
         for ($i = 0; $i -lt $matching.Count; $i++) {
-            if ($matching[$i].Current.Name -eq $value) {
+            if ($matching[$i].Cached.Name -eq $value) {
                 $targetIndex = $i
                 break
             }
@@ -91,10 +86,38 @@ function Select-IMSComboByValue {
         }
 
         Write-Host "    ✅ Target value '$value' found at index $targetIndex"
+        return @{ element = $combo; index = $targetIndex }
+    }
+
+    throw "❌ No ComboBox found containing value '$value'"
+}
+
+function Select-IMSComboByValue {
+    param (
+        [Parameter(Mandatory)]
+        [System.Windows.Automation.AutomationElement]$container,
+
+        [Parameter(Mandatory)]
+        [string]$value
+    )
+
+    Write-Host "▶ Selecting IMS Combo value: '$value'" -ForegroundColor Cyan
+
+    $initialKey = $value.Substring(0,1)
+    Write-Host "  • Initial key derived: '$initialKey'"
+
+    $comboKey = (Get-UiaElementKey -Element $container) + "|combo:$value"
+    Invoke-UiaCachedAction -Key $comboKey -Resolver {
+        Find-IMSComboByValue -container $container -value $value
+    } -Action {
+        param($target)
 
         try {
-            $combo.SetFocus()
+            $target.element.SetFocus()
             Write-Host "    • ComboBox focused"
+        } catch [System.Windows.Automation.ElementNotAvailableException] {
+            # Cached ComboBox is gone: let the cache look it up again.
+            throw
         } catch {
             Write-Host "    ⚠ ComboBox could not receive focus — continuing anyway"
         }
@@ -105,20 +128,17 @@ function Select-IMSComboByValue {
         [System.Windows.Forms.SendKeys]::SendWait("%{DOWN}")
         Start-Sleep -Milliseconds 300
 
-        Write-Host "    • Sending key '$initialKey' $($targetIndex + 1) time(s)"
-        for ($k = 0; $k -le $targetIndex; $k++) {
+        Write-Host "    • Sending key '$initialKey' $($target.index + 1) time(s)"
+        for ($k = 0; $k -le $target.index; $k++) {
             [System.Windows.Forms.SendKeys]::SendWait($initialKey)
             Start-Sleep -Milliseconds 120
         }
 
         Write-Host "    • Confirming selection (ENTER)"
         [System.Windows.Forms.SendKeys]::SendWait("{ENTER}")
-
-        Write-Host "✔ Successfully selected '$value'" -ForegroundColor Green
-        return
     }
 
-    throw "❌ No ComboBox found containing value '$value'"
+    Write-Host "✔ Successfully selected '$value'" -ForegroundColor Green
 }
 
 function Set-IMSFieldByLabel {
@@ -135,74 +155,41 @@ function Set-IMSFieldByLabel {
 
     Write-Host "▶ Setting '$labelText' → '$value'"
 
-    # 1. Find the label
-    $label = $container.FindAll(
-        [System.Windows.Automation.TreeScope]::Children,
-        [System.Windows.Automation.Condition]::TrueCondition
-    ) | Where-Object {
-        $_.Current.ControlType -eq [System.Windows.Automation.ControlType]::Text -and
-        $_.Current.Name -eq $labelText
-    } | Select-Object -First 1
-
-    if (-not $label) {
-        throw "Label '$labelText' not found"
-    }
+    # 1. Find the Edit after the label (one cached listing of the container)
+    $editWrapper = Find-UiaLabeledElement -Container $container -Label $labelText
 
     Write-Host "  • Label found"
 
-    # 2. Get siblings and locate the Edit after the label
-    $siblings = $container.FindAll(
-        [System.Windows.Automation.TreeScope]::Children,
-        [System.Windows.Automation.Condition]::TrueCondition
-    )
-
-    $found = $false
-    $editWrapper = $null
-
-    foreach ($el in $siblings) {
-        if ($el.Equals($label)) {
-            $found = $true
-            continue
+    # 2. Find inner [Editor] Edit Area, then focus and type
+    $editKey = (Get-UiaElementKey -Element $editWrapper) + "|id:[Editor] Edit Area"
+    Invoke-UiaCachedAction -Key $editKey -Resolver {
+        $editArea = Find-UiaFirst -Element $editWrapper -Scope Descendants -Condition (
+            New-Object System.Windows.Automation.PropertyCondition(
+                [System.Windows.Automation.AutomationElement]::AutomationIdProperty,
+                "[Editor] Edit Area"
+            )
+        )
+        if (-not $editArea) {
+            throw "Inner editor not found for '$labelText'"
         }
+        $editArea
+    } -Action {
+        param($editArea)
 
-        if ($found -and
-            $el.Current.ControlType -eq [System.Windows.Automation.ControlType]::Edit) {
-            $editWrapper = $el
-            break
-        }
-    }
+        Write-Host "  • Edit field located"
 
-    if (-not $editWrapper) {
-        throw "Edit control for '$labelText' not found"
-    }
-
-    # 3. Find inner [Editor] Edit Area
-    $editArea = $editWrapper.FindFirst(
-        [System.Windows.Automation.TreeScope]::Descendants,
-        (New-Object System.Windows.Automation.PropertyCondition(
-            [System.Windows.Automation.AutomationElement]::AutomationIdProperty,
-            "[Editor] Edit Area"
-        ))
-    )
+        try { $editArea.SetFocus() } catch [System.Windows.Automation.ElementNotAvailableException] { throw } catch {}
 
-    if (-not $editArea) {
-        throw "Inner editor not found for '$labelText'"
+        Start-Sleep -Milliseconds 150
+        [System.Windows.Forms.SendKeys]::SendWait("^a")
+        [System.Windows.Forms.SendKeys]::SendWait($value)
+        # [System.Windows.Forms.SendKeys]::SendWait("{TAB}")
     }
 
-    Write-Host "  • Edit field located"
-
-    # 4. Focus and type
-    try { $editArea.SetFocus() } catch {}
-
-    Start-Sleep -Milliseconds 150
-    [System.Windows.Forms.SendKeys]::SendWait("^a")
-    [System.Windows.Forms.SendKeys]::SendWait($value)
-    # [System.Windows.Forms.SendKeys]::SendWait("{TAB}")
-
     Write-Host "✔ '$labelText' set"
 }
 
-function Set-IMSFieldByLabel2 {
+function Find-IMSFieldByLabel2 {
     param (
         [Parameter(Mandatory)]
         [System.Windows.Automation.AutomationElement]$container,
@@ -211,19 +198,15 @@ function Set-IMSFieldByLabel2 {
         [string]$labelText
     )
 
-    Write-Host "▶ Locating field '$labelText'"
-
-    $elements = $container.FindAll(
-        [System.Windows.Automation.TreeScope]::Descendants,
-        [System.Windows.Automation.Condition]::TrueCondition
-    )
+    # Properties of every descendant come back with the listing.
+    $elements = Find-UiaAll -Element $container -Scope Descendants
 
     $labelIndex = -1
     for ($i = 0; $i -lt $elements.Count; $i++) {
         if (
-            $elements[$i].Current.ControlType -eq
+            $elements[$i].Cached.ControlType -eq
                 [System.Windows.Automation.ControlType]::Text -and
-            $elements[$i].Current.Name -eq $labelText
+            $elements[$i].Cached.Name -eq $labelText
         ) {
             $labelIndex = $i
             break
@@ -241,7 +224,7 @@ function Set-IMSFieldByLabel2 {
     for ($d = [Math]::Max(0, $labelIndex - 2); $d -lt [Math]::Min($elements.Count, $labelIndex + 15); $d++) {
         $debugEl = $elements[$d]
         $prefix = if ($d -eq $labelIndex) { ">>>" } else { "   " }
-        Write-Host "    $prefix [$d] Type=$($debugEl.Current.ControlType.ProgrammaticName), Name='$($debugEl.Current.Name)', Enabled=$($debugEl.Current.IsEnabled)" -ForegroundColor Gray
+        Write-Host "    $prefix [$d] Type=$($debugEl.Cached.ControlType.ProgrammaticName), Name='$($debugEl.Cached.Name)', Enabled=$($debugEl.Cached.IsEnabled)" -ForegroundColor Gray
     }
 
     $editWrapper = $null
@@ -253,16 +236,16 @@ function Set-IMSFieldByLabel2 {
 
         # Stop if we hit the next label (but check more elements first)
         if (
-            $el.Current.ControlType -eq
+            $el.Cached.ControlType -eq
                 [System.Windows.Automation.ControlType]::Text -and
-            $el.Current.Name.EndsWith(":") -and
+            $el.Cached.Name.EndsWith(":") -and
             ($i - $labelIndex) > 5  # Allow checking at least 5 elements before stopping
         ) {
             break
         }
 
         # Found direct Edit control
-        if ($el.Current.ControlType -eq
+        if ($el.Cached.ControlType -eq
             [System.Windows.Automation.ControlType]::Edit) {
             $editWrapper = $el
             Write-Host "    ✓ Found Edit control directly" -ForegroundColor Green
@@ -270,22 +253,18 @@ function Set-IMSFieldByLabel2 {
         }
 
         # Found Pane - search inside it for Edit control
-        if ($el.Current.ControlType -eq
+        if ($el.Cached.ControlType -eq
             [System.Windows.Automation.ControlType]::Pane) {
-            Write-Host "    • Found Pane '$($el.Current.Name)' at index $i - searching inside..." -ForegroundColor Yellow
+            Write-Host "    • Found Pane '$($el.Cached.Name)' at index $i - searching inside..." -ForegroundColor Yellow
             
             # Debug: Show all children in the Pane
-            $paneChildren = $el.FindAll(
-                [System.Windows.Automation.TreeScope]::Children,
-                [System.Windows.Automation.Condition]::TrueCondition
-            )
+            $paneChildren = Find-UiaAll -Element $el -Scope Children
             Write-Host "      Pane has $($paneChildren.Count) children:" -ForegroundColor Gray
             foreach ($child in $paneChildren) {
-                Write-Host "        - Type=$($child.Current.ControlType.ProgrammaticName), Name='$($child.Current.Name)', AutomationId='$($child.Current.AutomationId)'" -ForegroundColor Gray
+                Write-Host "        - Type=$($child.Cached.ControlType.ProgrammaticName), Name='$($child.Cached.Name)', AutomationId='$($child.Cached.AutomationId)'" -ForegroundColor Gray
             }
             
-            $editInPane = $el.FindFirst(
-                [System.Windows.Automation.TreeScope]::Descendants,
+            $editInPane = Find-UiaFirst -Element $el -Scope Descendants -Condition (
                 (New-Object System.Windows.Automation.PropertyCondition(
                     [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
                     [System.Windows.Automation.ControlType]::Edit
@@ -300,8 +279,7 @@ function Set-IMSFieldByLabel2 {
                 # Maybe the Pane itself is editable or we need to check for Document control
                 Write-Host "      No Edit control found, checking for Document or other types..." -ForegroundColor Yellow
                 
-                $docInPane = $el.FindFirst(
-                    [System.Windows.Automation.TreeScope]::Descendants,
+                $docInPane = Find-UiaFirst -Element $el -Scope Descendants -Condition (
                     (New-Object System.Windows.Automation.PropertyCondition(
                         [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
                         [System.Windows.Automation.ControlType]::Document
@@ -329,7 +307,7 @@ function Set-IMSFieldByLabel2 {
                 }
                 
                 # If nothing found but has children, try using the Pane itself if enabled
-                if ($el.Current.IsEnabled) {
+                if ($el.Cached.IsEnabled) {
                     Write-Host "      Pane is enabled, will try to use it directly" -ForegroundColor Yellow
                     $editWrapper = $el
                     break
@@ -345,8 +323,7 @@ function Set-IMSFieldByLabel2 {
 
     Write-Host "  • Edit wrapper located"
 
-    $editor = $editWrapper.FindFirst(
-        [System.Windows.Automation.TreeScope]::Descendants,
+    $editor = Find-UiaFirst -Element $editWrapper -Scope Descendants -Condition (
         (New-Object System.Windows.Automation.PropertyCondition(
             [System.Windows.Automation.AutomationElement]::AutomationIdProperty,
             "[Editor] Edit Area"
@@ -355,6 +332,25 @@ function Set-IMSFieldByLabel2 {
 
     if (-not $editor) { $editor = $editWrapper }
 
+    return $editor
+}
+
+function Set-IMSFieldByLabel2 {
+    param (
+        [Parameter(Mandatory)]
+        [System.Windows.Automation.AutomationElement]$container,
+
+        [Parameter(Mandatory)]
+        [string]$labelText
+    )
+
+    Write-Host "▶ Locating field '$labelText'"
+
+    $fieldKey = (Get-UiaElementKey -Element $container) + "|field:$labelText"
+    $editor = Resolve-UiaElement -Key $fieldKey -Resolver {
+        Find-IMSFieldByLabel2 -container $container -labelText $labelText
+    }
+
     # Try to focus the editor
     try {
         $editor.SetFocus()
@@ -405,33 +401,22 @@ function Set-FieldValue {
 }
 
 # ---------------- Find IMS window ----------------
-$root = [System.Windows.Automation.AutomationElement]::RootElement
-
-$windows = $root.FindAll(
-    [System.Windows.Automation.TreeScope]::Children,
-    [System.Windows.Automation.Condition]::TrueCondition
-)
-
-# Debug: List all window names
 Write-Host "▶ Searching for Insurance Management System window..." -ForegroundColor Cyan
-Write-Host "  Available windows:" -ForegroundColor Yellow
-foreach ($w in $windows) {
-    if ($w.Current.Name) {
-        Write-Host "    - '$($w.Current.Name)'" -ForegroundColor Gray
-    }
-}
-
-# Try to find the window with more flexible matching
-$window = $windows | Where-Object {
-    $_.Current.Name -like "*Insurance Management System*"
-} | Select-Object -First 1
+$window = Find-TopLevelWindowByName -Name "Insurance Management System" -TimeoutSeconds 5
 
 if (-not $window) {
+    # Debug: List all window names
     Write-Host "  ✗ No window found matching '*Insurance Management System*'" -ForegroundColor Red
+    Write-Host "  Available windows:" -ForegroundColor Yellow
+    foreach ($w in (Find-UiaAll -Element ([System.Windows.Automation.AutomationElement]::RootElement) -Scope Children)) {
+        if ($w.Cached.Name) {
+            Write-Host "    - '$($w.Cached.Name)'" -ForegroundColor Gray
+        }
+    }
     throw "Insurance Management System window not found. Please ensure the application is running."
 }
 
-[Win32]::SetForegroundWindow($window.Current.NativeWindowHandle)
+[Win32]::SetForegroundWindow($window.Cached.NativeWindowHandle)
 Start-Sleep -Milliseconds 400
 
 # ---------------- Open New Insured ----------------
@@ -439,19 +424,7 @@ Start-Sleep -Milliseconds 400
 # Start-Sleep -Milliseconds 900
 
 # ---------------- Find 'Insured Information' Pane ----------------
-$insuredPane = $window.FindFirst(
-    [System.Windows.Automation.TreeScope]::Descendants,
-    (New-Object System.Windows.Automation.AndCondition(
-        (New-Object System.Windows.Automation.PropertyCondition(
-            [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
-            [System.Windows.Automation.ControlType]::Pane
-        )),
-        (New-Object System.Windows.Automation.PropertyCondition(
-            [System.Windows.Automation.AutomationElement]::NameProperty,
-            "Insured Information"
-        ))
-    ))
-)
+$insuredPane = Find-UiaPane -Scope $window -Name "Insured Information"
 
 if (-not $insuredPane) {
     throw "Insured Information pane not found"
@@ -0,0 +1,514 @@
+<#
+UIA element lookup with CacheRequest prefetch and a resolved-element cache.
+
+Every `.Current.X` read on an AutomationElement is a cross-process call into
+the target application, and IMS forms are deep trees. The helpers here:
+
+- Search under a CacheRequest (`Find-UiaAll`, `Find-UiaFirst`), so Name,
+  AutomationId, ControlType, ClassName, IsEnabled and NativeWindowHandle of
+  every match (and optionally its whole subtree) come back in the same call
+  and are read through `.Cached.X`.
+- Keep the elements they resolve in `$global:UiaElementCache`, keyed by what
+  was looked up:
+    window|<name>                     top-level window whose name matches *name*
+    <scope>|pane:<name>               first Pane with that name under scope
+    <container>|label:<text>          first Edit after the Text label among the container's children
+    <scope>|id:<automationId>         first descendant of scope with that AutomationId
+    <container>|combo:<value>         ComboBox offering value (and its index among the initial-letter matches)
+    <container>|field:<text>          editor found by Set-IMSFieldByLabel2
+    <container>|form                  label -> input control index of a form (Get-UiaFormIndex)
+  where <scope>/<container> is `Get-UiaElementKey` of that element (its
+  window handle, or its runtime id). A cached element is checked with one
+  cheap call before use; a dead one, or one an action failed on
+  (`Invoke-UiaCachedAction`), is dropped and looked up again.
+- `Get-UiaSnapshot` fetches a whole window or pane in one call and primes
+  the label and AutomationId keys, which is what the `warmUp` action of
+  uia_run.ps1 does.
+
+The cache is global because the resident agent (uia_agent.ps1) imports only
+the function definitions of this file and keeps them across jobs; in a
+one-shot uia_run.ps1 it lasts for that run's steps.
+
+Resolver and action scriptblocks run inside Resolve-UiaElement /
+Invoke-UiaCachedAction and see the caller's variables, except those named
+$Key, $Resolver, $Validate or $Action.
+#>
+
+Add-Type -AssemblyName UIAutomationClient | Out-Null
+Add-Type -AssemblyName UIAutomationTypes  | Out-Null
+
+function New-UiaCacheRequest {
+  param(
+    [System.Windows.Automation.TreeScope]$TreeScope = [System.Windows.Automation.TreeScope]::Element
+  )
+  $req = New-Object System.Windows.Automation.CacheRequest
+  foreach ($prop in @(
+    [System.Windows.Automation.AutomationElement]::NameProperty,
+    [System.Windows.Automation.AutomationElement]::AutomationIdProperty,
+    [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
+    [System.Windows.Automation.AutomationElement]::ClassNameProperty,
+    [System.Windows.Automation.AutomationElement]::IsEnabledProperty,
+    [System.Windows.Automation.AutomationElement]::NativeWindowHandleProperty,
+    [System.Windows.Automation.AutomationElement]::RuntimeIdProperty
+  )) {
+    $req.Add($prop)
+  }
+  $req.TreeScope = $TreeScope
+  $req.TreeFilter = [System.Windows.Automation.Automation]::ControlViewCondition
+  # Full: cached elements stay usable for SetFocus, patterns and .Current reads.
+  $req.AutomationElementMode = [System.Windows.Automation.AutomationElementMode]::Full
+  return $req
+}
+
+function Find-UiaAll {
+  param(
+    [Parameter(Mandatory=$true)]$Element,
+    [System.Windows.Automation.TreeScope]$Scope = [System.Windows.Automation.TreeScope]::Children,
+    [System.Windows.Automation.Condition]$Condition = [System.Windows.Automation.Condition]::TrueCondition,
+    # Element: properties of each match; 'Element, Descendants': its subtree too (.CachedChildren).
+    [System.Windows.Automation.TreeScope]$CacheScope = [System.Windows.Automation.TreeScope]::Element
+  )
+  $req = New-UiaCacheRequest -TreeScope $CacheScope
+  $req.Push()
+  try {
+    $found = $Element.FindAll($Scope, $Condition)
+  } finally {
+    $req.Pop()
+  }
+  return ,$found
+}
+
+function Find-UiaFirst {
+  param(
+    [Parameter(Mandatory=$true)]$Element,
+    [System.Windows.Automation.TreeScope]$Scope = [System.Windows.Automation.TreeScope]::Descendants,
+    [Parameter(Mandatory=$true)][System.Windows.Automation.Condition]$Condition,
+    [System.Windows.Automation.TreeScope]$CacheScope = [System.Windows.Automation.TreeScope]::Element
+  )
+  $req = New-UiaCacheRequest -TreeScope $CacheScope
+  $req.Push()
+  try {
+    return $Element.FindFirst($Scope, $Condition)
+  } finally {
+    $req.Pop()
+  }
+}
+
+function Get-UiaCachedDescendants {
+  param(
+    [Parameter(Mandatory=$true)]$Element,
+    $ControlType = $null
+  )
+
+  # Pre-order walk of a subtree fetched with a Descendants/Subtree cache
+  # request; no calls into the application.
+  $out = New-Object System.Collections.Generic.List[object]
+  $stack = New-Object System.Collections.Generic.Stack[object]
+  $stack.Push($Element)
+  while ($stack.Count -gt 0) {
+    $el = $stack.Pop()
+    if (-not [object]::ReferenceEquals($el, $Element)) {
+      if ($null -eq $ControlType -or $el.Cached.ControlType -eq $ControlType) { $out.Add($el) }
+    }
+    $children = $null
+    try { $children = $el.CachedChildren } catch {}
+    if ($null -eq $children) { continue }
+    for ($i = $children.Count - 1; $i -ge 0; $i--) { $stack.Push($children[$i]) }
+  }
+  return ,$out
+}
+
+# ---------------- Resolved-element cache ----------------
+
+function Get-UiaElementCache {
+  if ($null -eq $global:UiaElementCache) {
+    $global:UiaElementCache = @{}
+    $global:UiaElementCacheStats = @{ hits = 0; misses = 0; invalidated = 0 }
+  }
+  return $global:UiaElementCache
+}
+
+function Get-UiaElementKey {
+  param([Parameter(Mandatory=$true)]$Element)
+
+  $hwnd = 0
+  try {
+    $hwnd = [int]$Element.Cached.NativeWindowHandle
+  } catch {
+    try { $hwnd = [int]$Element.Current.NativeWindowHandle } catch {}
+  }
+  if ($hwnd -ne 0) { return "hwnd:$hwnd" }
+
+  $rid = $null
+  try {
+    $rid = $Element.GetCachedPropertyValue([System.Windows.Automation.AutomationElement]::RuntimeIdProperty)
+  } catch {
+    $rid = $Element.GetRuntimeId()
+  }
+  return 'rid:' + ($rid -join '.')
+}
+
+function Get-UiaEntryElement {
+  param($Entry)
+  # Entries are elements, or hashtables whose 'element' is the one to check.
+  if ($Entry -is [hashtable]) { return $Entry.element }
+  return $Entry
+}
+
+function Test-UiaElementAlive {
+  param($Element)
+  if ($null -eq $Element) { return $false }
+  try {
+    # One round trip; throws ElementNotAvailableException once the UI is gone.
+    $null = $Element.Current.IsEnabled
+    return $true
+  } catch {
+    return $false
+  }
+}
+
+function Resolve-UiaElement {
+  param(
+    [Parameter(Mandatory=$true)][string]$Key,
+    # Returns the element (or an @{ element = ... } entry); $null is not cached.
+    [Parameter(Mandatory=$true)][scriptblock]$Resolver,
+    # Extra check of a cached entry; default: the element is still alive.
+    [scriptblock]$Validate
+  )
+
+  $uiaCache = Get-UiaElementCache
+  $uiaStats = $global:UiaElementCacheStats
+  $uiaEntry = $uiaCache[$Key]
+  if ($null -ne $uiaEntry) {
+    $uiaValid = Test-UiaElementAlive -Element (Get-UiaEntryElement $uiaEntry)
+    if ($uiaValid -and $Validate) {
+      try { $uiaValid = [bool](& $Validate $uiaEntry) } catch { $uiaValid = $false }
+    }
+    if ($uiaValid) {
+      $uiaStats.hits++
+      return $uiaEntry
+    }
+    $uiaCache.Remove($Key)
+    $uiaStats.invalidated++
+  }
+
+  $uiaStats.misses++
+  $uiaEntry = & $Resolver
+  if ($null -ne $uiaEntry) { $uiaCache[$Key] = $uiaEntry }
+  return $uiaEntry
+}
+
+function Invoke-UiaCachedAction {
+  param(
+    [Parameter(Mandatory=$true)][string]$Key,
+    [Parameter(Mandatory=$true)][scriptblock]$Resolver,
+    # Called with the resolved entry; should throw if the element turned out to be stale.
+    [Parameter(Mandatory=$true)][scriptblock]$Action
+  )
+
+  $null = Get-UiaElementCache
+  $uiaHitsBefore = $global:UiaElementCacheStats.hits
+  $uiaEntry = Resolve-UiaElement -Key $Key -Resolver $Resolver
+  if ($null -eq $uiaEntry) { throw "Element not found for $Key" }
+  $uiaFromCache = $global:UiaElementCacheStats.hits -gt $uiaHitsBefore
+  try {
+    return & $Action $uiaEntry
+  } catch {
+    if (-not $uiaFromCache) { throw }
+    # The cached element passed the liveness check but the action failed on
+    # it: look it up afresh and try once more.
+    Remove-UiaCachedElement -Key $Key
+    $uiaEntry = Resolve-UiaElement -Key $Key -Resolver $Resolver
+    if ($null -eq $uiaEntry) { throw "Element not found for $Key" }
+    return & $Action $uiaEntry
+  }
+}
+
+function Test-UiaElementGone {
+  param([Parameter(Mandatory=$true)][System.Management.Automation.ErrorRecord]$ErrorRecord)
+  # Method calls wrap the UIA exception (MethodInvocationException).
+  $e = $ErrorRecord.Exception
+  while ($e) {
+    if ($e -is [System.Windows.Automation.ElementNotAvailableException]) { return $true }
+    $e = $e.InnerException
+  }
+  return $false
+}
+
+function Remove-UiaCachedElement {
+  param([Parameter(Mandatory=$true)][string]$Key)
+  $uiaCache = Get-UiaElementCache
+  if ($uiaCache.ContainsKey($Key)) {
+    $uiaCache.Remove($Key)
+    $global:UiaElementCacheStats.invalidated++
+  }
+}
+
+function Clear-UiaElementCache {
+  param([string]$Prefix = '')
+  $uiaCache = Get-UiaElementCache
+  $keys = @($uiaCache.Keys | Where-Object { $_.StartsWith($Prefix, [StringComparison]::Ordinal) })
+  foreach ($k in $keys) { $uiaCache.Remove($k) }
+  return $keys.Count
+}
+
+function Remove-UiaDeadElements {
+  $uiaCache = Get-UiaElementCache
+  $dead = @($uiaCache.Keys | Where-Object { -not (Test-UiaElementAlive -Element (Get-UiaEntryElement $uiaCache[$_])) })
+  foreach ($k in $dead) { $uiaCache.Remove($k) }
+  $global:UiaElementCacheStats.invalidated += $dead.Count
+  return $dead.Count
+}
+
+function Get-UiaElementCacheStats {
+  $uiaCache = Get-UiaElementCache
+  $s = $global:UiaElementCacheStats
+  return @{ entries = $uiaCache.Count; hits = $s.hits; misses = $s.misses; invalidated = $s.invalidated }
+}
+
+# ---------------- Cached lookups ----------------
+
+function Find-TopLevelWindowByName {
+  param(
+    [Parameter(Mandatory=$true)][string]$Name,
+    [int]$TimeoutSeconds = 10
+  )
+
+  $pattern = "*$Name*"
+  return Resolve-UiaElement -Key "window|$Name" -Validate {
+    param($w)
+    $w.Current.Name -like $pattern
+  } -Resolver {
+    $deadline = (Get-Date).AddSeconds($TimeoutSeconds)
+    $root = [System.Windows.Automation.AutomationElement]::RootElement
+    $cond = New-Object System.Windows.Automation.PropertyCondition(
+      [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
+      [System.Windows.Automation.ControlType]::Window
+    )
+    while ($true) {
+      # One call per poll: the names come back with the windows.
+      $windows = @()
+      try { $windows = Find-UiaAll -Element $root -Scope Children -Condition $cond } catch {
+        # Ignore transient UIA exceptions.
+      }
+      foreach ($w in $windows) {
+        $n = $w.Cached.Name
+        if ($n -and $n -like $pattern) { return $w }
+      }
+      if ((Get-Date) -ge $deadline) { return $null }
+      Start-Sleep -Milliseconds 250
+    }
+  }
+}
+
+function Find-UiaPane {
+  param(
+    [Parameter(Mandatory=$true)]$Scope,
+    [Parameter(Mandatory=$true)][string]$Name
+  )
+
+  $key = (Get-UiaElementKey -Element $Scope) + "|pane:$Name"
+  return Resolve-UiaElement -Key $key -Resolver {
+    Find-UiaFirst -Element $Scope -Scope Descendants -Condition (New-Object System.Windows.Automation.AndCondition(
+      (New-Object System.Windows.Automation.PropertyCondition(
+        [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
+        [System.Windows.Automation.ControlType]::Pane
+      )),
+      (New-Object System.Windows.Automation.PropertyCondition(
+        [System.Windows.Automation.AutomationElement]::NameProperty,
+        $Name
+      ))
+    ))
+  }
+}
+
+function Find-UiaByAutomationId {
+  param(
+    [Parameter(Mandatory=$true)]$Scope,
+    [Parameter(Mandatory=$true)][string]$AutomationId
+  )
+
+  $key = (Get-UiaElementKey -Element $Scope) + "|id:$AutomationId"
+  return Resolve-UiaElement -Key $key -Resolver {
+    Find-UiaFirst -Element $Scope -Scope Descendants -Condition (New-Object System.Windows.Automation.PropertyCondition(
+      [System.Windows.Automation.AutomationElement]::AutomationIdProperty,
+      $AutomationId
+    ))
+  }
+}
+
+function Find-UiaLabeledElement {
+  param(
+    [Parameter(Mandatory=$true)]$Container,
+    [Parameter(Mandatory=$true)][string]$Label
+  )
+
+  # The Edit that follows a Text label among the container's children: one
+  # cached listing instead of a property read per child.
+  $key = (Get-UiaElementKey -Element $Container) + "|label:$Label"
+  return Resolve-UiaElement -Key $key -Resolver {
+    $children = Find-UiaAll -Element $Container -Scope Children
+    $afterLabel = $false
+    foreach ($el in $children) {
+      if (-not $afterLabel) {
+        $afterLabel = ($el.Cached.ControlType -eq [System.Windows.Automation.ControlType]::Text -and $el.Cached.Name -eq $Label)
+        continue
+      }
+      if ($el.Cached.ControlType -eq [System.Windows.Automation.ControlType]::Edit) { return $el }
+    }
+    if (-not $afterLabel) { throw "Label '$Label' not found" }
+    throw "Edit control for '$Label' not found"
+  }
+}
+
+function Get-UiaFormLabelKey {
+  param([Parameter(Mandatory=$true)][string]$Label)
+  # "Business Name:", "business name" and "Business Name" are the same field.
+  return $Label.Trim().TrimEnd(':').Trim().ToLowerInvariant()
+}
+
+function Get-UiaFormIndex {
+  param([Parameter(Mandatory=$true)]$Container)
+
+  # Every label of the container mapped to the input control that follows it
+  # in document order (Edit, ComboBox, Document, or an empty Pane right after
+  # the label), from one subtree fetch. Entry: @{ element = container;
+  # labels = @{ <label key> = @{ label; type; element; editor } } }.
+  $key = (Get-UiaElementKey -Element $Container) + '|form'
+  return Resolve-UiaElement -Key $key -Resolver {
+    $tree = $Container.GetUpdatedCache((New-UiaCacheRequest -TreeScope Subtree))
+    $inputTypes = @(
+      [System.Windows.Automation.ControlType]::Edit,
+      [System.Windows.Automation.ControlType]::ComboBox,
+      [System.Windows.Automation.ControlType]::Document
+    )
+    $labels = @{}
+    $pending = New-Object System.Collections.Generic.List[object]
+    $prevWasLabel = $false
+    foreach ($el in (Get-UiaCachedDescendants -Element $tree)) {
+      $type = $el.Cached.ControlType
+      if ($type -eq [System.Windows.Automation.ControlType]::Text) {
+        $name = $el.Cached.Name
+        $prevWasLabel = [bool]$name
+        if ($name -and -not $labels.ContainsKey((Get-UiaFormLabelKey $name))) { $pending.Add($name) }
+        continue
+      }
+
+      $isInput = $inputTypes -contains $type
+      if (-not $isInput -and $prevWasLabel -and $type -eq [System.Windows.Automation.ControlType]::Pane) {
+        $kids = $null
+        try { $kids = $el.CachedChildren } catch {}
+        $isInput = ($null -eq $kids -or $kids.Count -eq 0)
+      }
+      $prevWasLabel = $false
+      if (-not $isInput -or $pending.Count -eq 0) { continue }
+
+      # IMS edits wrap the control that takes input.
+      $editor = $el
+      if ($type -ne [System.Windows.Automation.ControlType]::ComboBox) {
+        foreach ($d in (Get-UiaCachedDescendants -Element $el)) {
+          if ($d.Cached.AutomationId -eq '[Editor] Edit Area') { $editor = $d; break }
+        }
+      }
+      $shortType = $type.ProgrammaticName -replace '^ControlType\.', ''
+      foreach ($name in $pending) {
+        $labelKey = Get-UiaFormLabelKey $name
+        if ($labels.ContainsKey($labelKey)) { continue }
+        $labels[$labelKey] = @{ label = $name; type = $shortType; element = $el; editor = $editor }
+      }
+      $pending.Clear()
+    }
+    @{ element = $Container; labels = $labels }
+  }
+}
+
+# ---------------- Warm-up ----------------
+
+function Add-UiaIdEntries {
+  param(
+    [Parameter(Mandatory=$true)]$Scope,
+    [Parameter(Mandatory=$true)][string]$ScopeKey
+  )
+  # First descendant per AutomationId, as Find-UiaByAutomationId would find it.
+  $uiaCache = Get-UiaElementCache
+  $seen = @{}
+  foreach ($el in (Get-UiaCachedDescendants -Element $Scope)) {
+    $id = $el.Cached.AutomationId
+    if (-not $id -or $seen.ContainsKey($id)) { continue }
+    $seen[$id] = $true
+    $uiaCache["$ScopeKey|id:$id"] = $el
+  }
+  return $seen.Count
+}
+
+function Get-UiaSnapshot {
+  param(
+    [Parameter(Mandatory=$true)]$Element,
+    [int]$MaxDepth = 12,
+    [int]$MaxNodes = 2000
+  )
+
+  # The whole subtree in one call; everything below reads the cache.
+  $root = $Element.GetUpdatedCache((New-UiaCacheRequest -TreeScope Subtree))
+  $uiaCache = Get-UiaElementCache
+  $rootKey = Get-UiaElementKey -Element $root
+  $primed = Add-UiaIdEntries -Scope $root -ScopeKey $rootKey
+
+  $nodes = New-Object System.Collections.Generic.List[object]
+  $truncated = $false
+  $stack = New-Object System.Collections.Generic.Stack[object]
+  $stack.Push(@{ el = $root; path = '0'; depth = 0 })
+  while ($stack.Count -gt 0) {
+    $item = $stack.Pop()
+    $el = $item.el
+    if ($nodes.Count -ge $MaxNodes) {
+      $truncated = $true
+      break
+    }
+    $nodes.Add(@{
+      path = $item.path
+      depth = $item.depth
+      controlType = ($el.Cached.ControlType.ProgrammaticName -replace '^ControlType\.', '')
+      name = $el.Cached.Name
+      automationId = $el.Cached.AutomationId
+      className = $el.Cached.ClassName
+      enabled = $el.Cached.IsEnabled
+    })
+
+    $children = @()
+    $cached = $null
+    try { $cached = $el.CachedChildren } catch {}
+    if ($null -ne $cached) { $children = @($cached) }
+    if ($children.Count -eq 0) { continue }
+    if ($item.depth -ge $MaxDepth) {
+      $truncated = $true
+      continue
+    }
+
+    # Right to left: each Text label maps to the first Edit after it, the
+    # same element Find-UiaLabeledElement would return.
+    $elKey = $null
+    $nextEdit = $null
+    for ($i = $children.Count - 1; $i -ge 0; $i--) {
+      $child = $children[$i]
+      $type = $child.Cached.ControlType
+      if ($type -eq [System.Windows.Automation.ControlType]::Edit) {
+        $nextEdit = $child
+      } elseif ($type -eq [System.Windows.Automation.ControlType]::Text -and $child.Cached.Name -and $nextEdit) {
+        if (-not $elKey) { $elKey = Get-UiaElementKey -Element $el }
+        $uiaCache["$elKey|label:$($child.Cached.Name)"] = $nextEdit
+        $primed++
+        $primed += Add-UiaIdEntries -Scope $nextEdit -ScopeKey (Get-UiaElementKey -Element $nextEdit)
+      }
+      $stack.Push(@{ el = $child; path = "$($item.path)/$i"; depth = $item.depth + 1 })
+    }
+  }
+
+  return @{
+    root = $rootKey
+    count = $nodes.Count
+    truncated = $truncated
+    primed = $primed
+    nodes = $nodes.ToArray()
+  }
+}
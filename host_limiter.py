@@ -0,0 +1,101 @@
+"""Per-host concurrency limits with fast-fail backpressure for the async gateway.
+
+Each target host gets a semaphore sized to how many WinRM calls it should run
+at once. Callers beyond that wait in a bounded queue; when the queue is full
+the gateway answers 429 straight away, and a caller that waited longer than
+`queue_timeout` gets 503, instead of piling up executor threads.
+"""
+
+from __future__ import annotations
+
+import asyncio
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import AsyncIterator
+
+
+class BackpressureError(RuntimeError):
+    """Raised when a host is saturated; `status` is the HTTP code to return."""
+
+    def __init__(self, message: str, status: int, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.status = status
+        self.retry_after = retry_after
+
+
+@dataclass
+class _HostState:
+    semaphore: asyncio.Semaphore
+    in_flight: int = 0
+    waiting: int = 0
+    rejected_queue_full: int = 0
+    rejected_timeout: int = 0
+    completed: int = 0
+
+
+class HostLimiter:
+    def __init__(self, *, max_concurrency: int = 4, max_queue: int = 32, queue_timeout: float = 10.0) -> None:
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._hosts: dict[str, _HostState] = {}
+
+    def _state(self, host: str) -> _HostState:
+        state = self._hosts.get(host)
+        if state is None:
+            state = self._hosts[host] = _HostState(asyncio.Semaphore(self.max_concurrency))
+        return state
+
+    async def acquire(self, host: str) -> None:
+        """Take a slot on `host`; pair with `release` (or use `slot`)."""
+        state = self._state(host)
+        if state.semaphore.locked():
+            if state.waiting >= self.max_queue:
+                state.rejected_queue_full += 1
+                raise BackpressureError(f"Too many queued requests for {host}", status=429)
+            state.waiting += 1
+            try:
+                await asyncio.wait_for(state.semaphore.acquire(), self.queue_timeout)
+            except asyncio.TimeoutError:
+                state.rejected_timeout += 1
+                raise BackpressureError(
+                    f"Timed out after {self.queue_timeout}s waiting for a free slot on {host}",
+                    status=503,
+                    retry_after=max(1, int(self.queue_timeout)),
+                )
+            finally:
+                state.waiting -= 1
+        else:
+            await state.semaphore.acquire()
+        state.in_flight += 1
+
+    def release(self, host: str) -> None:
+        state = self._hosts[host]
+        state.in_flight -= 1
+        state.completed += 1
+        state.semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self, host: str) -> AsyncIterator[None]:
+        await self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "hosts": {
+                host: {
+                    "in_flight": s.in_flight,
+                    "waiting": s.waiting,
+                    "completed": s.completed,
+                    "rejected_queue_full": s.rejected_queue_full,
+                    "rejected_timeout": s.rejected_timeout,
+                }
+                for host, s in self._hosts.items()
+            },
+        }
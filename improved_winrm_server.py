@@ -1,16 +1,33 @@
-from flask import Flask, request, jsonify
-import winrm
+from quart import Quart, Response, g, request, jsonify
+import asyncio
+import codecs
 import logging
 import json
 import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from asgiref.wsgi import WsgiToAsgi
+
+from clearance_api import clearance
+from compression import MIN_COMPRESS_BYTES, compress, match_etag, negotiate, weak_etag
+from excel_cache import FileStamp, ReadCache, SingleFlight, cache_key, make_etag, stat_script
+from excel_host import ExcelHostClient, ExcelHostUnavailable
+from host_limiter import BackpressureError, HostLimiter
+from job_queue import JobManager, SqliteJobStore
+from metrics import BYTE_BUCKETS, Registry
+from remote_wait import wait_for_file
+from winrm_pool import SessionPool
 
 # Load environment variables
 load_dotenv()
 
-app = Flask(__name__)
-asgi_app = WsgiToAsgi(app)
+app = Quart(__name__)
+# Kept for existing `uvicorn improved_winrm_server:asgi_app` invocations;
+# Quart is ASGI-native so no WSGI adapter is needed any more.
+asgi_app = app
 
 # -----------------------------------------------------------------------------
 # Logging
@@ -18,6 +35,38 @@ asgi_app = WsgiToAsgi(app)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger("winrm-gateway")
 
+# -----------------------------------------------------------------------------
+# Metrics (GET /metrics, Prometheus text format)
+# -----------------------------------------------------------------------------
+METRICS = Registry()
+PHASE_SECONDS = METRICS.histogram(
+    "winrm_gateway_phase_seconds",
+    "Time spent per phase: session_checkout, remote_exec, decode, json_parse, excel_host, schtasks_setup, task_wait",
+    ["phase"],
+)
+REMOTE_BYTES = METRICS.counter(
+    "winrm_gateway_remote_bytes_total",
+    "Bytes sent to (script) and received from (stdout, stderr) the Windows host",
+    ["direction"],
+)
+REMOTE_ERRORS = METRICS.counter(
+    "winrm_gateway_remote_errors_total",
+    "Exceptions raised by WinRM calls, by where they happened and exception class",
+    ["where", "error_class"],
+)
+REQUEST_SECONDS = METRICS.histogram(
+    "winrm_gateway_request_seconds",
+    "HTTP request latency until the response headers are sent",
+    ["route", "method", "status"],
+)
+REQUEST_BYTES = METRICS.histogram(
+    "winrm_gateway_request_bytes", "HTTP request body size", ["route"], buckets=BYTE_BUCKETS
+)
+RESPONSE_BYTES = METRICS.histogram(
+    "winrm_gateway_response_bytes", "HTTP response body size (streamed responses excluded)", ["route"], buckets=BYTE_BUCKETS
+)
+REQUESTS_IN_FLIGHT = METRICS.gauge("winrm_gateway_requests_in_flight", "HTTP requests being handled", ["route"])
+
 # -----------------------------------------------------------------------------
 # WinRM Configuration (loaded from .env)
 # -----------------------------------------------------------------------------
@@ -26,6 +75,7 @@ WINRM_CONFIG = {
     "username": os.getenv("WINRM_USERNAME"),
     "password": os.getenv("WINRM_PASSWORD"),
     "port": int(os.getenv("WINRM_PORT", 5986)),
+    "transport": os.getenv("WINRM_TRANSPORT", "plaintext"),
 }
 
 WINRM_ENDPOINT = (
@@ -33,79 +83,438 @@ WINRM_ENDPOINT = (
 )
 
 # -----------------------------------------------------------------------------
-# Utility: Create WinRM session
+# WinRM session pool (keep-alive connections shared across requests)
 # -----------------------------------------------------------------------------
-def create_session():
-    return winrm.Session(
+POOL_CONFIG = {
+    "max_size": int(os.getenv("WINRM_POOL_SIZE", 4)),
+    "idle_timeout": float(os.getenv("WINRM_POOL_IDLE_TIMEOUT", 300)),
+    "health_check_after": float(os.getenv("WINRM_POOL_HEALTH_CHECK_AFTER", 60)),
+    "checkout_timeout": float(os.getenv("WINRM_POOL_CHECKOUT_TIMEOUT", 30)),
+    "prewarm": int(os.getenv("WINRM_POOL_PREWARM", 1)),
+    # Keep a warm remote shell per pooled session instead of one per script.
+    "reuse_shell": os.getenv("WINRM_REUSE_SHELL", "false").strip().lower() in {"1", "true", "yes", "on"},
+    "shell_max_commands": int(os.getenv("WINRM_SHELL_MAX_COMMANDS", 50)),
+}
+
+SESSION_POOL = SessionPool(
+    max_size=POOL_CONFIG["max_size"],
+    idle_timeout=POOL_CONFIG["idle_timeout"],
+    health_check_after=POOL_CONFIG["health_check_after"],
+    checkout_timeout=POOL_CONFIG["checkout_timeout"],
+    server_cert_validation="ignore",
+    reuse_shell=POOL_CONFIG["reuse_shell"],
+    shell_max_commands=POOL_CONFIG["shell_max_commands"],
+)
+SESSION_POOL.start_reaper()
+
+
+def _prewarm_pool():
+    warmed = SESSION_POOL.prewarm(
         WINRM_ENDPOINT,
-        auth=(WINRM_CONFIG["username"], WINRM_CONFIG["password"]),
-        server_cert_validation="ignore",
+        WINRM_CONFIG["username"],
+        WINRM_CONFIG["password"],
+        WINRM_CONFIG["transport"],
+        count=POOL_CONFIG["prewarm"],
     )
+    logger.info("Pre-warmed %d WinRM session(s) for %s", warmed, WINRM_ENDPOINT)
+
+
+if WINRM_CONFIG["server"] and POOL_CONFIG["prewarm"] > 0:
+    # Don't block startup on the remote host; the first request will simply
+    # create its own session if pre-warming has not finished yet.
+    threading.Thread(target=_prewarm_pool, name="winrm-pool-prewarm", daemon=True).start()
 
 # -----------------------------------------------------------------------------
-# Utility: Execute PowerShell safely
+# Utility: Check out a pooled WinRM session (use as a context manager)
 # -----------------------------------------------------------------------------
-def run_ps(script: str, timeout: int = 60):
-    session = create_session()
-    result = session.run_ps(script)
+@contextmanager
+def create_session():
+    start = time.perf_counter()
+    checked_out = False
+    try:
+        with SESSION_POOL.session(
+            WINRM_ENDPOINT,
+            WINRM_CONFIG["username"],
+            WINRM_CONFIG["password"],
+            WINRM_CONFIG["transport"],
+        ) as session:
+            checked_out = True
+            PHASE_SECONDS.observe(time.perf_counter() - start, phase="session_checkout")
+            yield session
+    except Exception as e:
+        if not checked_out:
+            REMOTE_ERRORS.inc(where="session_checkout", error_class=type(e).__name__)
+        raise
 
-    stdout = result.std_out.decode("utf-8", errors="ignore").strip()
-    stderr = result.std_err.decode("utf-8", errors="ignore").strip()
+# -----------------------------------------------------------------------------
+# Utility: Execute PowerShell safely
+# -----------------------------------------------------------------------------
+def run_ps_raw(script: str, timeout: int = 60):
+    """Like `run_ps`, but stdout is returned as the undecoded bytes."""
+    REMOTE_BYTES.inc(len(script.encode("utf-8")), direction="script")
+    with create_session() as session:
+        try:
+            with PHASE_SECONDS.time(phase="remote_exec"):
+                result = session.run_ps(script)
+        except Exception as e:
+            REMOTE_ERRORS.inc(where="run_ps", error_class=type(e).__name__)
+            raise
 
+    REMOTE_BYTES.inc(len(result.std_out), direction="stdout")
+    REMOTE_BYTES.inc(len(result.std_err), direction="stderr")
     return {
         "status": result.status_code,
-        "stdout": stdout,
-        "stderr": stderr,
+        "stdout": result.std_out,
+        "stderr": result.std_err.decode("utf-8", errors="ignore").strip(),
         "success": result.status_code == 0,
     }
 
+
+def run_ps(script: str, timeout: int = 60):
+    result = run_ps_raw(script, timeout)
+    with PHASE_SECONDS.time(phase="decode"):
+        result["stdout"] = result["stdout"].decode("utf-8", errors="ignore").strip()
+    return result
+
+# -----------------------------------------------------------------------------
+# Async execution: sized executor + per-host concurrency limits
+# -----------------------------------------------------------------------------
+# pywinrm is blocking, so every remote call runs on this executor. The host
+# limiter caps concurrent calls per target and rejects early (429/503) when
+# its queue is full, so slow /excel/open calls cannot starve /execute.
+ASYNC_CONFIG = {
+    "executor_workers": int(os.getenv("WINRM_EXECUTOR_WORKERS", 16)),
+    "host_concurrency": int(os.getenv("WINRM_HOST_CONCURRENCY", POOL_CONFIG["max_size"])),
+    "host_queue": int(os.getenv("WINRM_HOST_QUEUE", 32)),
+    "queue_timeout": float(os.getenv("WINRM_QUEUE_TIMEOUT", 10)),
+}
+
+EXECUTOR = ThreadPoolExecutor(
+    max_workers=ASYNC_CONFIG["executor_workers"],
+    thread_name_prefix="winrm-io",
+)
+
+HOST_LIMITER = HostLimiter(
+    max_concurrency=ASYNC_CONFIG["host_concurrency"],
+    max_queue=ASYNC_CONFIG["host_queue"],
+    queue_timeout=ASYNC_CONFIG["queue_timeout"],
+)
+
+
+async def run_blocking(func, *args, host: str | None = None):
+    """Run a blocking WinRM call on the executor under the host's limit.
+
+    The slot belongs to the executor thread, not to the awaiting coroutine:
+    a job timeout, a cancelled job or a client that goes away stops the
+    wait, but the call keeps its session and its slot until it returns, so
+    abandoned calls still count against the host's limit.
+    """
+    host = host or WINRM_CONFIG["server"] or "default"
+    await HOST_LIMITER.acquire(host)
+    try:
+        future = asyncio.get_running_loop().run_in_executor(EXECUTOR, func, *args)
+    except BaseException:
+        HOST_LIMITER.release(host)
+        raise
+
+    def done(fut: asyncio.Future) -> None:
+        HOST_LIMITER.release(host)
+        if not fut.cancelled():
+            # Retrieved, so an abandoned call's failure doesn't log a warning.
+            fut.exception()
+
+    future.add_done_callback(done)
+    # Shielded: cancelling the executor future would fire `done` while the
+    # thread is still running.
+    return await asyncio.shield(future)
+
+
+async def run_ps_async(script: str, timeout: int = 60):
+    return await run_blocking(run_ps, script, timeout)
+
+
+# Items buffered between a streaming producer thread and the HTTP response.
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 16))
+
+
+async def stream_blocking(gen_func, *args, host: str | None = None):
+    """Drive a blocking generator on the executor and yield its items.
+
+    The producer thread blocks when the bounded queue is full, so a slow
+    client slows down the WinRM receive loop instead of growing memory.
+    The host slot is held until the stream ends or the client goes away.
+    """
+    async with HOST_LIMITER.slot(host or WINRM_CONFIG["server"] or "default"):
+        loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=STREAM_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def put(kind, item):
+            asyncio.run_coroutine_threadsafe(queue.put((kind, item)), loop).result()
+
+        def produce():
+            gen = gen_func(*args)
+            try:
+                for item in gen:
+                    if stop.is_set():
+                        break
+                    put("item", item)
+            except BaseException as e:
+                put("error", e)
+                return
+            finally:
+                gen.close()
+            put("end", None)
+
+        producer = loop.run_in_executor(EXECUTOR, produce)
+        try:
+            while True:
+                kind, item = await queue.get()
+                if kind == "end":
+                    break
+                if kind == "error":
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            # Unblock a producer waiting on a full queue so it can exit.
+            while not queue.empty():
+                queue.get_nowait()
+            await producer
+
+
+@app.errorhandler(BackpressureError)
+async def handle_backpressure(e: BackpressureError):
+    response = jsonify({"success": False, "error": str(e)})
+    response.status_code = e.status
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
+
+def _route_label() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+@app.before_request
+async def _metrics_before():
+    g.metrics_start = time.perf_counter()
+    g.metrics_route = _route_label()
+    REQUESTS_IN_FLIGHT.inc(route=g.metrics_route)
+    if request.content_length:
+        REQUEST_BYTES.observe(request.content_length, route=g.metrics_route)
+
+
+@app.after_request
+async def _metrics_after(response):
+    route = g.get("metrics_route")
+    if route is not None:
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - g.metrics_start, route=route, method=request.method, status=response.status_code
+        )
+        if response.content_length is not None:
+            RESPONSE_BYTES.observe(response.content_length, route=route)
+    return response
+
+
+@app.teardown_request
+async def _metrics_teardown(exc):
+    route = g.get("metrics_route")
+    if route is not None:
+        REQUESTS_IN_FLIGHT.dec(route=route)
+
+
+# -----------------------------------------------------------------------------
+# Response compression (Accept-Encoding: zstd / gzip)
+# -----------------------------------------------------------------------------
+COMPRESSIBLE_MIMETYPES = {"application/json", "text/plain"}
+# Larger bodies are compressed off the event loop.
+COMPRESS_INLINE_BYTES = 256 * 1024
+
+
+# Registered after the metrics hooks, so it runs before them and the
+# response-size histogram sees the bytes actually sent.
+@app.after_request
+async def _compress_response(response):
+    if (
+        response.status_code != 200
+        or response.mimetype not in COMPRESSIBLE_MIMETYPES
+        or "Content-Encoding" in response.headers
+        or response.content_length is None
+        or response.content_length < MIN_COMPRESS_BYTES
+    ):
+        return response
+    response.vary.add("Accept-Encoding")
+    encoding = negotiate(request.headers.get("Accept-Encoding"))
+    if encoding is None:
+        return response
+
+    body = await response.get_data()
+    if len(body) > COMPRESS_INLINE_BYTES:
+        packed = await asyncio.to_thread(compress, body, encoding)
+    else:
+        packed = compress(body, encoding)
+    response.set_data(packed)
+    response.headers["Content-Encoding"] = encoding
+    if "ETag" in response.headers:
+        response.headers["ETag"] = weak_etag(response.headers["ETag"])
+    return response
+
+
+def _collect_runtime_metrics():
+    """Scrape-time view of the host limiter, session pool and job queue."""
+    for host, h in HOST_LIMITER.stats()["hosts"].items():
+        yield "winrm_gateway_host_in_flight", "gauge", "WinRM calls running per host", {"host": host}, h["in_flight"]
+        yield "winrm_gateway_host_waiting", "gauge", "WinRM calls queued per host", {"host": host}, h["waiting"]
+        for reason in ("queue_full", "timeout"):
+            yield (
+                "winrm_gateway_host_rejected_total",
+                "counter",
+                "Calls rejected by host backpressure",
+                {"host": host, "reason": reason},
+                h[f"rejected_{reason}"],
+            )
+
+    pool = SESSION_POOL.stats()
+    yield "winrm_gateway_pool_checkouts_total", "counter", "Session pool checkouts", {"result": "hit"}, pool["hits"]
+    yield "winrm_gateway_pool_checkouts_total", "counter", "Session pool checkouts", {"result": "miss"}, pool["misses"]
+    yield "winrm_gateway_pool_sessions_created_total", "counter", "WinRM sessions opened", {}, pool["created"]
+    yield "winrm_gateway_pool_wait_seconds_total", "counter", "Time spent waiting for a free session", {}, pool["wait_seconds_total"]
+    for ep in pool["endpoints"]:
+        yield "winrm_gateway_pool_sessions", "gauge", "Pooled sessions", {"endpoint": ep["endpoint"], "state": "idle"}, ep["idle"]
+        yield "winrm_gateway_pool_sessions", "gauge", "Pooled sessions", {"endpoint": ep["endpoint"], "state": "in_use"}, ep["in_use"]
+
+    jobs = JOBS.stats()
+    yield "winrm_gateway_jobs", "gauge", "Asynchronous jobs by state", {"state": "queued"}, jobs["queued"]
+    yield "winrm_gateway_jobs", "gauge", "Asynchronous jobs by state", {"state": "running"}, jobs["running"]
+    for status, count in jobs["completed"].items():
+        yield "winrm_gateway_jobs_completed_total", "counter", "Finished asynchronous jobs", {"status": status}, count
+
+    cache = EXCEL_CACHE.stats()
+    yield "winrm_gateway_excel_cache_hits_total", "counter", "/excel/read cache hits", {}, cache["hits"]
+    yield "winrm_gateway_excel_cache_misses_total", "counter", "/excel/read cache misses", {}, cache["misses"]
+    yield "winrm_gateway_excel_cache_bytes", "gauge", "/excel/read cache size", {}, cache["bytes"]
+
+
+METRICS.collect(_collect_runtime_metrics)
+
+
+@app.route("/metrics", methods=["GET"])
+async def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
 # -----------------------------------------------------------------------------
 # Health
 # -----------------------------------------------------------------------------
 @app.route("/health", methods=["GET"])
-def health():
+async def health():
     return jsonify(
         {
             "status": "running",
             "target": WINRM_CONFIG["server"],
             "port": WINRM_CONFIG["port"],
+            "limits": HOST_LIMITER.stats(),
         }
     )
 
+# -----------------------------------------------------------------------------
+# Session pool stats
+# -----------------------------------------------------------------------------
+@app.route("/pool/stats", methods=["GET"])
+async def pool_stats():
+    return jsonify(SESSION_POOL.stats())
+
 # -----------------------------------------------------------------------------
 # Test WinRM
 # -----------------------------------------------------------------------------
+def _whoami():
+    with create_session() as session:
+        return session.run_cmd("whoami")
+
+
 @app.route("/test", methods=["GET"])
-def test():
+async def test():
     try:
-        session = create_session()
-        result = session.run_cmd("whoami")
+        result = await run_blocking(_whoami)
         return jsonify(
             {
                 "success": True,
                 "output": result.std_out.decode("utf-8").strip(),
             }
         )
+    except BackpressureError:
+        raise
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
 # -----------------------------------------------------------------------------
 # Execute Raw PowerShell (used by n8n)
 # -----------------------------------------------------------------------------
+EXECUTE_STREAM_FORMATS = ("ndjson", "sse")
+
+
+def _stream_event(fmt: str, event: str, payload: dict) -> bytes:
+    if fmt == "sse":
+        return f"event: {event}\ndata: {json.dumps(payload)}\n\n".encode()
+    return (json.dumps({"event": event, **payload}) + "\n").encode()
+
+
+async def _execute_stream(script: str, fmt: str):
+    """Forward stdout/stderr chunks as WinRM receives them, then the exit status.
+
+    Only one receive chunk is held at a time (plus the bounded queue in
+    `stream_blocking`), however much the script prints. Chunks are decoded
+    incrementally so a UTF-8 sequence split across receives stays intact.
+    """
+    decoders = {name: codecs.getincrementaldecoder("utf-8")(errors="replace") for name in ("stdout", "stderr")}
+    status = -1
+    try:
+        async for stdout, stderr, code, done in stream_blocking(_stream_ps, script):
+            for name, raw in (("stdout", stdout), ("stderr", stderr)):
+                text = decoders[name].decode(raw, final=done)
+                if text:
+                    yield _stream_event(fmt, name, {"data": text})
+            if done:
+                status = code
+    except BackpressureError as e:
+        yield _stream_event(fmt, "done", {"success": False, "status": e.status, "error": str(e)})
+        return
+    except Exception as e:
+        logger.exception("Execution stream failure")
+        yield _stream_event(fmt, "done", {"success": False, "status": -1, "error": str(e)})
+        return
+    yield _stream_event(fmt, "done", {"success": status == 0, "status": status})
+
+
 @app.route("/execute", methods=["POST"])
-def execute():
+async def execute():
     try:
-        data = request.json
+        data = await request.get_json()
         if not data or "script" not in data:
             return jsonify({"error": "script required"}), 400
 
         script = data["script"]  # DO NOT STRIP NEWLINES
 
+        fmt = data.get("format")
+        if fmt is None and data.get("stream"):
+            fmt = "sse" if "text/event-stream" in request.headers.get("Accept", "") else "ndjson"
+        if fmt in EXECUTE_STREAM_FORMATS:
+            logger.info("Executing PowerShell script (streaming %s)", fmt)
+            mimetype = "text/event-stream" if fmt == "sse" else "application/x-ndjson"
+            response = Response(_execute_stream(script, fmt), mimetype=mimetype)
+            response.headers["Cache-Control"] = "no-cache"
+            # Keep reverse proxies from buffering the stream.
+            response.headers["X-Accel-Buffering"] = "no"
+            # Long scripts outlive Quart's 60 s RESPONSE_TIMEOUT.
+            response.timeout = None
+            return response
+
         logger.info("Executing PowerShell script")
-        result = run_ps(script)
+        result = await run_ps_async(script)
 
         return jsonify(result)
 
+    except BackpressureError:
+        raise
     except Exception as e:
         logger.exception("Execution failure")
         return jsonify(
@@ -120,49 +529,156 @@ def execute():
 # -----------------------------------------------------------------------------
 # Excel Read (Session-Attached, STA-Safe)
 # -----------------------------------------------------------------------------
-@app.route("/excel/read", methods=["POST"])
-def excel_read():
-    try:
-        data = request.json
-        if not data or "file_path" not in data:
-            return jsonify({"error": "file_path required"}), 400
+EXCEL_READ_MODES = ("value2", "text")
 
-        file_path = data["file_path"]
+# Rows fetched per COM call / flushed per stdout write on the Windows side.
+EXCEL_READ_BATCH_ROWS = int(os.getenv("EXCEL_READ_BATCH_ROWS", 1000))
+
+
+def ps_quote(s: str) -> str:
+    # Single-quote and escape single quotes for PowerShell.
+    return "'" + s.replace("'", "''") + "'"
+
+
+def build_excel_read_body(
+    mode: str = "value2",
+    range_address: str | None = None,
+    *,
+    sheet: str | int | None = None,
+    offset: int = 0,
+    limit: int | None = None,
+    ndjson: bool = False,
+) -> str:
+    """PowerShell that reads a row window of an open workbook as JSON.
+
+    Expects `$workbook` and `$ExcelFile` in scope, so the same code runs in a
+    one-shot script (`build_excel_read_script`) and in the persistent Excel
+    host (`excel_host.py`).
+
+    mode="value2": `Range.Value2` per batch of rows, raw values (numbers,
+        strings, booleans, null for empty cells; dates as serials).
+    mode="text":   per-cell `.Text`, i.e. the formatted strings Excel shows.
+        One COM call per cell, so only use it when formatting matters.
+
+    `sheet` is a worksheet name or 1-based index; `range_address` an A1-style
+    range (default: the sheet's UsedRange). `offset`/`limit` select a window
+    of rows within that range.
+
+    Output is either a single JSON object
+        {"total_rows": N, "offset": o, "file_size": S, "file_mtime": T, "data": [[...], ...]}
+    or, with `ndjson=True`, a meta line followed by one line per row, written
+    straight to stdout every EXCEL_READ_BATCH_ROWS rows so the gateway can
+    stream it:
+        {"total_rows": N, "offset": o, "cols": C}
+        {"row": 0, "values": [...]}
+    """
+    if mode not in EXCEL_READ_MODES:
+        raise ValueError(f"mode must be one of {', '.join(EXCEL_READ_MODES)}")
+
+    if sheet is None or sheet == "":
+        sheet_expr = "1"
+    elif isinstance(sheet, int):
+        sheet_expr = str(sheet)
+    else:
+        sheet_expr = ps_quote(str(sheet))
+
+    range_expr = f"$worksheet.Range({ps_quote(range_address)})" if range_address else "$worksheet.UsedRange"
+
+    if mode == "value2":
+        cell_expr = "if ($single) { $values } else { $values[$r, $c] }"
+        prefetch = "$values = $blk.Value2\n    $single = ($n -eq 1 -and $cols -eq 1)"
+    else:
+        cell_expr = "$blk.Cells.Item($r, $c).Text"
+        prefetch = ""
+
+    if ndjson:
+        header = """[Console]::Out.Write('{"total_rows":' + $total + ',"offset":' + $start + ',"cols":' + $cols + "}`n")"""
+        row_open = """[void]$sb.Append('{"row":').Append($start + $b + $r - 1).Append(',"values":[')"""
+        row_close = """[void]$sb.Append("]}`n")"""
+        flush = "[Console]::Out.Write($sb.ToString()); [Console]::Out.Flush(); [void]$sb.Clear()"
+        footer = ""
+        emit = ""
+    else:
+        header = """[void]$sb.Append('{"total_rows":').Append($total).Append(',"offset":').Append($start).Append($fileStamp).Append(',"data":[')"""
+        row_open = """if ($b + $r -gt 1) { [void]$sb.Append(',') }
+        [void]$sb.Append('[')"""
+        row_close = "[void]$sb.Append(']')"
+        flush = ""
+        footer = "[void]$sb.Append(']}')"
+        emit = "$sb.ToString()"
+
+    return rf"""
+# Size/LastWriteTime as of this read, so the gateway cache can validate it later.
+$fileInfo = Get-Item -LiteralPath $ExcelFile
+$fileStamp = ',"file_size":' + $fileInfo.Length + ',"file_mtime":' + $fileInfo.LastWriteTimeUtc.Ticks
+
+$worksheet = $workbook.Worksheets.Item({sheet_expr})
+$rng = {range_expr}
+$total = $rng.Rows.Count
+$cols = $rng.Columns.Count
+$start = [Math]::Min({int(offset)}, $total)
+$count = $total - $start
+$limit = {-1 if limit is None else int(limit)}
+if ($limit -ge 0) {{ $count = [Math]::Min($count, $limit) }}
+$batch = {EXCEL_READ_BATCH_ROWS}
+
+$inv = [Globalization.CultureInfo]::InvariantCulture
+$sb = New-Object System.Text.StringBuilder
+{header}
+for ($b = 0; $b -lt $count; $b += $batch) {{
+    $n = [Math]::Min($batch, $count - $b)
+    $blk = $rng.Offset($start + $b, 0).Resize($n, $cols)
+    {prefetch}
+    for ($r = 1; $r -le $n; $r++) {{
+        {row_open}
+        for ($c = 1; $c -le $cols; $c++) {{
+            if ($c -gt 1) {{ [void]$sb.Append(',') }}
+            $v = {cell_expr}
+            if ($null -eq $v) {{ [void]$sb.Append('null') }}
+            elseif ($v -is [string]) {{ [void]$sb.Append([System.Web.HttpUtility]::JavaScriptStringEncode($v, $true)) }}
+            elseif ($v -is [bool]) {{ [void]$sb.Append($(if ($v) {{ 'true' }} else {{ 'false' }})) }}
+            else {{ [void]$sb.Append(([double]$v).ToString('R', $inv)) }}
+        }}
+        {row_close}
+    }}
+    [Runtime.InteropServices.Marshal]::ReleaseComObject($blk) | Out-Null
+    {flush}
+}}
+{footer}
+[Runtime.InteropServices.Marshal]::ReleaseComObject($rng) | Out-Null
+[Runtime.InteropServices.Marshal]::ReleaseComObject($worksheet) | Out-Null
+{emit}
+"""
 
-        ps_script = rf"""
-$ExcelFile = "{file_path}"
+
+def build_excel_read_script(file_path: str, mode: str = "value2", range_address: str | None = None, **kwargs) -> str:
+    """One-shot PowerShell: start Excel, run `build_excel_read_body`, quit."""
+    body = build_excel_read_body(mode, range_address, **kwargs)
+    return rf"""
+$ExcelFile = {ps_quote(file_path)}
 
 if (-not (Test-Path $ExcelFile)) {{
     Write-Error "File not found: $ExcelFile"
     exit 2
 }}
 
+Add-Type -AssemblyName System.Web
+[Console]::OutputEncoding = New-Object System.Text.UTF8Encoding($false)
+
 $excel = $null
 $workbook = $null
-$worksheet = $null
 
 try {{
     $excel = New-Object -ComObject Excel.Application
     $excel.Visible = $false
     $excel.DisplayAlerts = $false
 
-    $workbook = $excel.Workbooks.Open($ExcelFile)
-    $worksheet = $workbook.Worksheets.Item(1)
-
-    $used = $worksheet.UsedRange
-    $rows = $used.Rows.Count
-    $cols = $used.Columns.Count
+    $workbook = $excel.Workbooks.Open($ExcelFile, 0, $true)
 
-    $out = @()
-    for ($r = 1; $r -le $rows; $r++) {{
-        $row = @()
-        for ($c = 1; $c -le $cols; $c++) {{
-            $row += $worksheet.Cells.Item($r, $c).Text
-        }}
-        $out += ,$row
+    $json = & {{
+{body}
     }}
-
-    $out | ConvertTo-Json -Depth 10 -Compress
+    if ($null -ne $json) {{ [Console]::Out.Write($json) }}
 }}
 catch {{
     Write-Error $_.Exception.Message
@@ -172,7 +688,6 @@ finally {{
     if ($workbook) {{ $workbook.Close($false) }}
     if ($excel) {{ $excel.Quit() }}
 
-    if ($worksheet) {{ [Runtime.InteropServices.Marshal]::ReleaseComObject($worksheet) | Out-Null }}
     if ($workbook) {{ [Runtime.InteropServices.Marshal]::ReleaseComObject($workbook) | Out-Null }}
     if ($excel) {{ [Runtime.InteropServices.Marshal]::ReleaseComObject($excel) | Out-Null }}
 
@@ -181,23 +696,307 @@ finally {{
 }}
 """
 
-        result = run_ps(ps_script, timeout=90)
 
-        if not result["success"]:
-            return jsonify(result), 500
+# -----------------------------------------------------------------------------
+# /excel/read cache (validated against the file's size + LastWriteTime)
+# -----------------------------------------------------------------------------
+EXCEL_CACHE_CONFIG = {
+    "enabled": os.getenv("EXCEL_CACHE_ENABLED", "true").strip().lower() in {"1", "true", "yes", "on"},
+    "max_bytes": int(os.getenv("EXCEL_CACHE_MAX_BYTES", 256 * 1024 * 1024)),
+    "ttl": float(os.getenv("EXCEL_CACHE_TTL", 3600)),
+}
+
+EXCEL_CACHE = ReadCache(max_bytes=EXCEL_CACHE_CONFIG["max_bytes"], ttl=EXCEL_CACHE_CONFIG["ttl"])
+EXCEL_READ_FLIGHTS = SingleFlight()
+
+# -----------------------------------------------------------------------------
+# Persistent Excel host (functions/excel_host.ps1)
+# -----------------------------------------------------------------------------
+EXCEL_HOST_CONFIG = {
+    "enabled": os.getenv("EXCEL_HOST_ENABLED", "false").strip().lower() in {"1", "true", "yes", "on"},
+    "pipe_name": os.getenv("EXCEL_HOST_PIPE", "gateway-excel-host"),
+    "max_operations": int(os.getenv("EXCEL_HOST_MAX_OPERATIONS", 500)),
+    "max_memory_mb": int(os.getenv("EXCEL_HOST_MAX_MEMORY_MB", 1024)),
+    "max_workbooks": int(os.getenv("EXCEL_HOST_MAX_WORKBOOKS", 8)),
+}
+
+EXCEL_HOST = ExcelHostClient(
+    run_ps,
+    pipe_name=EXCEL_HOST_CONFIG["pipe_name"],
+    max_operations=EXCEL_HOST_CONFIG["max_operations"],
+    max_memory_mb=EXCEL_HOST_CONFIG["max_memory_mb"],
+    max_workbooks=EXCEL_HOST_CONFIG["max_workbooks"],
+)
+
+
+@app.route("/excel/host/stats", methods=["GET"])
+async def excel_host_stats():
+    if not EXCEL_HOST_CONFIG["enabled"]:
+        return jsonify({"enabled": False})
+    try:
+        stats = await run_blocking(EXCEL_HOST.stats)
+    except ExcelHostUnavailable as e:
+        return jsonify({"enabled": True, "success": False, "error": str(e)}), 503
+    return jsonify({"enabled": True, **stats})
+
+
+async def remote_file_stamp(file_path: str) -> FileStamp | None:
+    result = await run_ps_async(stat_script(file_path))
+    if not result["success"]:
+        return None
+    return FileStamp.parse(result["stdout"])
+
+
+def _cached_response(entry, cache_status: str):
+    response = Response(entry.body, mimetype="application/json")
+    response.headers["ETag"] = entry.etag
+    response.headers["X-Cache"] = cache_status
+    return response
+
+
+@app.route("/cache/stats", methods=["GET"])
+async def cache_stats():
+    return jsonify(
+        {
+            "enabled": EXCEL_CACHE_CONFIG["enabled"],
+            "excel_read": EXCEL_CACHE.stats(),
+            "collapsed_reads": EXCEL_READ_FLIGHTS.collapsed,
+        }
+    )
+
+
+def _stream_ps(script: str):
+    REMOTE_BYTES.inc(len(script.encode("utf-8")), direction="script")
+    with create_session() as session:
+        try:
+            for stdout, stderr, code, done in session.stream_ps(script):
+                REMOTE_BYTES.inc(len(stdout), direction="stdout")
+                REMOTE_BYTES.inc(len(stderr), direction="stderr")
+                yield stdout, stderr, code, done
+        except Exception as e:
+            REMOTE_ERRORS.inc(where="stream_ps", error_class=type(e).__name__)
+            raise
+
+
+def _excel_read_params(data: dict) -> dict:
+    """Validate the /excel/read body; raises ValueError with a client message."""
+    mode = data.get("mode", "value2")
+    if mode not in EXCEL_READ_MODES:
+        raise ValueError(f"mode must be one of {', '.join(EXCEL_READ_MODES)}")
+
+    offset = int(data.get("offset") or 0)
+    limit = data.get("limit")
+    limit = None if limit is None else int(limit)
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be non-negative")
+
+    sheet = data.get("sheet")
+    if isinstance(sheet, str) and sheet.isdigit():
+        sheet = int(sheet)
+
+    return {
+        "mode": mode,
+        "range_address": data.get("range"),
+        "sheet": sheet,
+        "offset": offset,
+        "limit": limit,
+    }
+
+
+EXCEL_READ_LAYOUTS = ("rows", "columns")
+
+# Start of the document build_excel_read_body emits (non-NDJSON).
+_EXCEL_READ_HEAD = re.compile(
+    rb'\s*\{"total_rows":(\d+),"offset":(\d+),"file_size":(\d+),"file_mtime":(\d+),"data":(?=\[)'
+)
+
+
+def splice_excel_read(raw: bytes, params: dict) -> tuple[FileStamp, bytes] | None:
+    """Build the /excel/read response around the remote rows without parsing them.
+
+    The remote script emits a fixed header followed by the row array, and the
+    row count follows from total_rows/offset/limit. So only the header is
+    matched and the array bytes are forwarded as they are: no decode,
+    json.loads or re-encode of the data. Returns None for anything that does
+    not look like that document, so the caller can fall back to parsing.
+    """
+    head = _EXCEL_READ_HEAD.match(raw)
+    if head is None:
+        return None
+    end = len(raw)
+    while end and raw[end - 1] in b" \t\r\n":
+        end -= 1
+    if raw[end - 2 : end] != b"]}":
+        return None
+
+    total, offset, size, mtime = (int(g) for g in head.groups())
+    rows = max(0, total - offset)
+    if params["limit"] is not None:
+        rows = min(rows, params["limit"])
+    meta = {
+        "success": True,
+        "mode": params["mode"],
+        "offset": offset,
+        "limit": params["limit"],
+        "rows": rows,
+        "total_rows": total,
+        "has_more": offset + rows < total,
+    }
+    prefix = json.dumps(meta, separators=(",", ":"))[:-1].encode("utf-8") + b',"data":'
+    body = b"".join((prefix, memoryview(raw)[head.end() : end - 1], b"}"))
+    return FileStamp(size, mtime), body
+
+
+def to_columns(body: bytes, header: bool) -> bytes:
+    """Re-shape a rows-layout /excel/read body into named column arrays.
+
+    {"columns": ["A", "B"], "data": [[a1, a2, ...], [b1, b2, ...]]}; with
+    `header` the first row of the window supplies the names and is dropped
+    from the data, otherwise columns are named by their 0-based index.
+    """
+    doc = json.loads(body)
+    rows = doc.pop("data")
+    width = max((len(r) for r in rows), default=0)
+    names: list = list(range(width))
+    if header and rows:
+        first = rows.pop(0)
+        names = [first[i] if i < len(first) and first[i] is not None else i for i in range(width)]
+        doc["rows"] = len(rows)
+    doc["layout"] = "columns"
+    doc["columns"] = [str(n) for n in names]
+    doc["data"] = [[r[i] if i < len(r) else None for r in rows] for i in range(width)]
+    return json.dumps(doc, separators=(",", ":")).encode("utf-8")
+
+
+async def _excel_read_ndjson(script: str):
+    """Forward the remote NDJSON rows as they arrive, then a trailer line."""
+    stderr = bytearray()
+    status = -1
+    tail = b"\n"
+    try:
+        async for stdout, err, code, done in stream_blocking(_stream_ps, script):
+            if stdout:
+                tail = stdout[-1:]
+                yield stdout
+            if err and len(stderr) < 65536:
+                stderr.extend(err)
+            if done:
+                status = code
+    except BackpressureError as e:
+        yield (json.dumps({"done": True, "success": False, "status": e.status, "error": str(e)}) + "\n").encode()
+        return
+    except Exception as e:
+        logger.exception("Excel read stream failure")
+        yield (json.dumps({"done": True, "success": False, "status": -1, "error": str(e)}) + "\n").encode()
+        return
+
+    trailer = {"done": True, "success": status == 0, "status": status}
+    if status != 0:
+        trailer["stderr"] = stderr.decode("utf-8", errors="ignore").strip()
+    prefix = b"" if tail == b"\n" else b"\n"
+    yield prefix + (json.dumps(trailer) + "\n").encode()
+
+
+@app.route("/excel/read", methods=["POST"])
+async def excel_read():
+    try:
+        data = await request.get_json()
+        if not data or "file_path" not in data:
+            return jsonify({"error": "file_path required"}), 400
 
         try:
-            parsed = json.loads(result["stdout"])
-            return jsonify({"success": True, "rows": len(parsed), "data": parsed})
-        except Exception:
-            return jsonify(
-                {
+            params = _excel_read_params(data)
+        except (TypeError, ValueError) as e:
+            return jsonify({"error": str(e)}), 400
+
+        layout = data.get("layout", "rows")
+        if layout not in EXCEL_READ_LAYOUTS:
+            return jsonify({"error": f"layout must be one of {', '.join(EXCEL_READ_LAYOUTS)}"}), 400
+        header = bool(data.get("header"))
+
+        stream = bool(data.get("stream")) or data.get("format") == "ndjson"
+        ps_script = build_excel_read_script(data["file_path"], ndjson=stream, **params)
+
+        if stream:
+            return Response(_excel_read_ndjson(ps_script), mimetype="application/x-ndjson")
+
+        file_path = data["file_path"]
+        key = cache_key(file_path, params)
+        # The cache holds the rows layout; other layouts are derived per request
+        # and get their own ETag.
+        etag_key = key if layout == "rows" else f"{key}|{layout}|{header}"
+        use_cache = EXCEL_CACHE_CONFIG["enabled"] and data.get("cache", True) is not False
+        if_none_match = request.headers.get("If-None-Match")
+
+        def respond(encoded: bytes, stamp: FileStamp, cache_status: str):
+            if layout == "columns":
+                encoded = to_columns(encoded, header)
+            response = Response(encoded, mimetype="application/json")
+            response.headers["ETag"] = make_etag(etag_key, stamp)
+            response.headers["X-Cache"] = cache_status
+            return response
+
+        # One cheap remote stat validates both a cached entry and the caller's
+        # ETag. Skip it when there is nothing to validate.
+        if (use_cache and EXCEL_CACHE.peek(key) is not None) or if_none_match:
+            stamp = await remote_file_stamp(file_path)
+            if stamp is not None:
+                etag = make_etag(etag_key, stamp)
+                matched = match_etag(if_none_match, etag)
+                if matched is not None:
+                    response = Response(b"", status=304)
+                    response.headers["ETag"] = matched
+                    return response
+                if use_cache:
+                    entry = EXCEL_CACHE.get(key, stamp)
+                    if entry is not None:
+                        if layout == "rows":
+                            return _cached_response(entry, "HIT")
+                        return respond(entry.body, stamp, "HIT")
+
+        async def read():
+            """Returns (stamp, encoded_body, None) or (None, None, fallback_payload)."""
+            result = None
+            if EXCEL_HOST_CONFIG["enabled"]:
+                body_code = build_excel_read_body(**params)
+                try:
+                    with PHASE_SECONDS.time(phase="excel_host"):
+                        result = await run_blocking(EXCEL_HOST.exec, body_code, file_path, False, 90)
+                except ExcelHostUnavailable as e:
+                    logger.warning("Excel host unavailable, reading with a one-shot Excel: %s", e)
+            if result is None:
+                result = await run_blocking(run_ps_raw, ps_script, 90)
+            raw = result["stdout"]
+            if isinstance(raw, str):
+                raw = raw.encode("utf-8")
+            if not result["success"]:
+                return None, None, {**result, "stdout": raw.decode("utf-8", errors="ignore").strip()}
+
+            with PHASE_SECONDS.time(phase="json_parse"):
+                spliced = splice_excel_read(raw, params)
+            if spliced is None:
+                return None, None, {
                     "success": True,
-                    "raw": result["stdout"],
+                    "raw": raw.decode("utf-8", errors="ignore").strip(),
                     "note": "Output not valid JSON",
                 }
-            )
+            stamp, encoded = spliced
+            if use_cache:
+                EXCEL_CACHE.put(key, stamp, encoded)
+            return stamp, encoded, None
 
+        # Uncached reads are not collapsed: the caller asked for its own read.
+        if use_cache:
+            stamp, encoded, fallback = await EXCEL_READ_FLIGHTS.run(key, read)
+        else:
+            stamp, encoded, fallback = await read()
+        if fallback is not None:
+            return jsonify(fallback), (200 if fallback.get("success") else 500)
+
+        return respond(encoded, stamp, "MISS" if use_cache else "BYPASS")
+
+    except BackpressureError:
+        raise
     except Exception as e:
         logger.exception("Excel read failure")
         return jsonify({"success": False, "error": str(e)}), 500
@@ -205,12 +1004,84 @@ finally {{
 # -----------------------------------------------------------------------------
 # Excel: Just Open
 # -----------------------------------------------------------------------------
+# Builds the demo workbook /excel/open creates when no file_path is given.
+# Expects $excel in scope; leaves the saved path in $filePath.
+EXCEL_SAMPLE_WORKBOOK_PS = r"""
+    $workbook = $excel.Workbooks.Add()
+    $worksheet = $workbook.Worksheets.Item(1)
+    
+    # Add headers
+    $worksheet.Cells.Item(1, 1) = "Name"
+    $worksheet.Cells.Item(1, 2) = "Email"
+    $worksheet.Cells.Item(1, 3) = "Department"
+    $worksheet.Cells.Item(1, 4) = "Salary"
+    
+    # Format headers
+    $headerRange = $worksheet.Range("A1", "D1")
+    $headerRange.Font.Bold = $true
+    $headerRange.Interior.ColorIndex = 15
+    
+    # Add data
+    $worksheet.Cells.Item(2, 1) = "John Doe"
+    $worksheet.Cells.Item(2, 2) = "john.doe@example.com"
+    $worksheet.Cells.Item(2, 3) = "Engineering"
+    $worksheet.Cells.Item(2, 4) = 75000
+    
+    $worksheet.Cells.Item(3, 1) = "Jane Smith"
+    $worksheet.Cells.Item(3, 2) = "jane.smith@example.com"
+    $worksheet.Cells.Item(3, 3) = "Marketing"
+    $worksheet.Cells.Item(3, 4) = 65000
+    
+    $worksheet.Cells.Item(4, 1) = "Bob Johnson"
+    $worksheet.Cells.Item(4, 2) = "bob.johnson@example.com"
+    $worksheet.Cells.Item(4, 3) = "Sales"
+    $worksheet.Cells.Item(4, 4) = 70000
+    
+    $worksheet.Columns.AutoFit() | Out-Null
+    
+    # Save file
+    $timestamp = Get-Date -Format "yyyyMMdd_HHmmss"
+    $downloadsPath = [Environment]::GetFolderPath("UserProfile") + "\Downloads"
+    $filePath = "$downloadsPath\SampleData_$timestamp.xlsx"
+    
+    $workbook.SaveAs($filePath, 51)
+"""
+
+
+def _excel_open_via_host(file_path: str) -> dict:
+    """Open (or create) a workbook in the persistent host's visible Excel."""
+    if file_path:
+        code = """
+$excel.Visible = $true
+$workbook.Activate()
+@{ success = $true; message = "Excel opened with file: $($workbook.Name)"; file = $ExcelFile } | ConvertTo-Json -Compress
+"""
+        result = EXCEL_HOST.exec(code, file_path, True, 60)
+    else:
+        code = "$excel.Visible = $true\n" + EXCEL_SAMPLE_WORKBOOK_PS + """
+@{ success = $true; message = "Excel file created and saved"; file = $filePath } | ConvertTo-Json -Compress
+"""
+        result = EXCEL_HOST.exec(code, None, True, 60)
+
+    if not result["success"]:
+        return {"success": False, "message": "", "error": result["stderr"].strip()}
+    return json.loads(result["stdout"])
+
+
 @app.route("/excel/open", methods=["POST"])
-def excel_open():
+async def excel_open():
     try:
-        data = request.json or {}
+        data = (await request.get_json()) or {}
         file_path = data.get("file_path", "").strip()
 
+        if EXCEL_HOST_CONFIG["enabled"]:
+            try:
+                with PHASE_SECONDS.time(phase="excel_host"):
+                    output_data = await run_blocking(_excel_open_via_host, file_path)
+                return jsonify(output_data), (200 if output_data.get("success") else 500)
+            except ExcelHostUnavailable as e:
+                logger.warning("Excel host unavailable, opening through a one-shot task: %s", e)
+
         # Create unique task name and paths
         import uuid
         task_id = str(uuid.uuid4())[:8]
@@ -263,45 +1134,7 @@ try {{
     $excel.Visible = $true
     $excel.DisplayAlerts = $false
     
-    $workbook = $excel.Workbooks.Add()
-    $worksheet = $workbook.Worksheets.Item(1)
-    
-    # Add headers
-    $worksheet.Cells.Item(1, 1) = "Name"
-    $worksheet.Cells.Item(1, 2) = "Email"
-    $worksheet.Cells.Item(1, 3) = "Department"
-    $worksheet.Cells.Item(1, 4) = "Salary"
-    
-    # Format headers
-    $headerRange = $worksheet.Range("A1", "D1")
-    $headerRange.Font.Bold = $true
-    $headerRange.Interior.ColorIndex = 15
-    
-    # Add data
-    $worksheet.Cells.Item(2, 1) = "John Doe"
-    $worksheet.Cells.Item(2, 2) = "john.doe@example.com"
-    $worksheet.Cells.Item(2, 3) = "Engineering"
-    $worksheet.Cells.Item(2, 4) = 75000
-    
-    $worksheet.Cells.Item(3, 1) = "Jane Smith"
-    $worksheet.Cells.Item(3, 2) = "jane.smith@example.com"
-    $worksheet.Cells.Item(3, 3) = "Marketing"
-    $worksheet.Cells.Item(3, 4) = 65000
-    
-    $worksheet.Cells.Item(4, 1) = "Bob Johnson"
-    $worksheet.Cells.Item(4, 2) = "bob.johnson@example.com"
-    $worksheet.Cells.Item(4, 3) = "Sales"
-    $worksheet.Cells.Item(4, 4) = 70000
-    
-    $worksheet.Columns.AutoFit() | Out-Null
-    
-    # Save file
-    $timestamp = Get-Date -Format "yyyyMMdd_HHmmss"
-    $downloadsPath = [Environment]::GetFolderPath("UserProfile") + "\\Downloads"
-    $filePath = "$downloadsPath\\SampleData_$timestamp.xlsx"
-    
-    $workbook.SaveAs($filePath, 51)
-    
+{EXCEL_SAMPLE_WORKBOOK_PS}    
     $result.success = $true
     $result.message = "Excel file created and saved"
     $result.file = $filePath
@@ -327,9 +1160,10 @@ New-Item -ItemType Directory -Force -Path $basePath | Out-Null
 if (Test-Path '{output_path}') {{ Remove-Item -Force '{output_path}' }}
 """
         
-        result = run_ps(ps_upload)
+        setup_start = time.perf_counter()
+        result = await run_ps_async(ps_upload)
         if not result["success"]:
-            return jsonify({{"error": "Failed to upload script", "details": result}}), 500
+            return jsonify({"error": "Failed to upload script", "details": result}), 500
         
         # Create and run scheduled task in interactive session
         # Note: Using current WinRM credentials as run-as user
@@ -355,46 +1189,142 @@ schtasks /Run /TN $taskName | Out-Null
 Write-Output "Task created and started: $taskName"
 """
         
-        result = run_ps(ps_task)
+        result = await run_ps_async(ps_task)
+        PHASE_SECONDS.observe(time.perf_counter() - setup_start, phase="schtasks_setup")
         if not result["success"]:
-            return jsonify({{"error": "Failed to create task", "details": result}}), 500
+            return jsonify({"error": "Failed to create task", "details": result}), 500
         
-        # Wait for output file (max 30 seconds)
-        import time
-        max_wait = 30
-        start_time = time.time()
-        
-        while time.time() - start_time < max_wait:
-            ps_check = f"""
-if (Test-Path '{output_path}') {{
-    Get-Content '{output_path}' -Raw -Encoding UTF8
-}}
-"""
-            check_result = run_ps(ps_check)
-            if check_result["success"] and check_result["stdout"].strip():
-                # Clean up task
-                ps_cleanup = f"try {{ schtasks /Delete /TN '{task_name}' /F 2>&1 | Out-Null }} catch {{}}"
-                run_ps(ps_cleanup)
-                
-                # Parse JSON output
-                try:
-                    output_data = json.loads(check_result["stdout"])
-                    return jsonify(output_data)
-                except:
-                    return jsonify({{"success": True, "raw_output": check_result["stdout"]}})
-            
-            time.sleep(0.5)
-        
-        # Timeout - cleanup and return error
+        # Wait for the output file (max 30 seconds). The wait blocks on the
+        # remote side and returns as soon as the task writes the file.
+        with PHASE_SECONDS.time(phase="task_wait"):
+            output = await run_blocking(wait_for_file, run_ps, output_path, 30)
+
         ps_cleanup = f"try {{ schtasks /Delete /TN '{task_name}' /F 2>&1 | Out-Null }} catch {{}}"
-        run_ps(ps_cleanup)
-        
-        return jsonify({{"success": False, "error": "Timeout waiting for Excel to complete"}}), 500
+        await run_ps_async(ps_cleanup)
 
+        if output is not None:
+            try:
+                return jsonify(json.loads(output))
+            except ValueError:
+                return jsonify({"success": True, "raw_output": output})
+
+        return jsonify({"success": False, "error": "Timeout waiting for Excel to complete"}), 500
+
+    except BackpressureError:
+        raise
     except Exception as e:
         logger.exception("Excel open failure")
         return jsonify({"success": False, "error": str(e)}), 500
 
+# -----------------------------------------------------------------------------
+# Asynchronous jobs: POST /jobs returns an id, GET /jobs/<id> returns the result
+# -----------------------------------------------------------------------------
+JOBS_CONFIG = {
+    "workers": int(os.getenv("JOBS_WORKERS", ASYNC_CONFIG["host_concurrency"])),
+    "max_queue": int(os.getenv("JOBS_MAX_QUEUE", 256)),
+    "ttl": float(os.getenv("JOBS_TTL", 3600)),
+    "timeout": float(os.getenv("JOBS_TIMEOUT", 600)),
+    "max_wait": float(os.getenv("JOBS_MAX_WAIT", 60)),
+    "db_path": os.getenv("JOBS_DB", "").strip(),
+}
+
+
+def _endpoint_job(path: str, view, **overrides):
+    """A job handler that runs the synchronous endpoint `view` with the job params as its body.
+
+    Jobs go through exactly the same validation, caching and fallbacks as a
+    direct call; only the result is delivered later.
+    """
+
+    async def handler(params: dict):
+        body = {**params, **overrides}
+        async with app.test_request_context(path, method="POST", json=body):
+            response = await app.make_response(await view())
+            raw = await response.get_data()
+        try:
+            payload = json.loads(raw) if raw else None
+        except ValueError:
+            payload = raw.decode("utf-8", errors="replace")
+        return payload, response.status_code
+
+    return handler
+
+
+JOBS = JobManager(
+    {
+        "execute": _endpoint_job("/execute", execute, stream=False, format="json"),
+        "excel_open": _endpoint_job("/excel/open", excel_open),
+        # Results are stored whole, so a job never streams.
+        "excel_read": _endpoint_job("/excel/read", excel_read, stream=False, format="json"),
+    },
+    workers=JOBS_CONFIG["workers"],
+    max_queue=JOBS_CONFIG["max_queue"],
+    ttl=JOBS_CONFIG["ttl"],
+    timeout=JOBS_CONFIG["timeout"],
+    store=SqliteJobStore(JOBS_CONFIG["db_path"]) if JOBS_CONFIG["db_path"] else None,
+)
+
+
+@app.before_serving
+async def _start_jobs():
+    await JOBS.start()
+
+
+@app.after_serving
+async def _stop_jobs():
+    await JOBS.stop()
+
+
+@app.route("/jobs", methods=["POST"])
+async def submit_job():
+    data = await request.get_json()
+    if not data or "kind" not in data:
+        return jsonify({"error": "kind required"}), 400
+    params = data.get("params") or {}
+    if not isinstance(params, dict):
+        return jsonify({"error": "params must be an object"}), 400
+
+    try:
+        job = await JOBS.submit(data["kind"], params)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    response = jsonify(job.to_dict())
+    response.status_code = 202
+    response.headers["Location"] = f"/jobs/{job.id}"
+    return response
+
+
+@app.route("/jobs/stats", methods=["GET"])
+async def jobs_stats():
+    return jsonify(JOBS.stats())
+
+
+@app.route("/jobs/<job_id>", methods=["GET"])
+async def get_job(job_id: str):
+    try:
+        wait = min(float(request.args.get("wait", 0)), JOBS_CONFIG["max_wait"])
+    except ValueError:
+        return jsonify({"error": "wait must be a number of seconds"}), 400
+
+    job = await JOBS.wait(job_id, wait)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job: {job_id}"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>", methods=["DELETE"])
+async def cancel_job(job_id: str):
+    job = JOBS.cancel(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown or expired job: {job_id}"}), 404
+    return jsonify(job.to_dict(include_result=False))
+
+# -----------------------------------------------------------------------------
+# Clearance rules engine (POST /clearance/evaluate) and the n8n flow's lookups
+# -----------------------------------------------------------------------------
+app.register_blueprint(clearance)
+
 # -----------------------------------------------------------------------------
 # Main
 # -----------------------------------------------------------------------------
@@ -407,12 +1337,18 @@ if __name__ == "__main__":
     print("Endpoints:")
     print("  GET  /health")
     print("  GET  /test")
-    print("  POST /execute")
+    print("  GET  /pool/stats")
+    print("  GET  /metrics")
+    print("  POST /execute         {script, stream?: true, format?: ndjson|sse}")
     print("  POST /excel/read")
+    print("  POST /jobs            {kind, params} -> 202 {id}")
+    print("  GET  /jobs/<id>?wait=30")
+    print("  DELETE /jobs/<id>")
+    print("  POST /clearance/evaluate {input_data, today?, output?: true}")
     print("=" * 60)
     
     uvicorn.run(
-        "improved_winrm_server:asgi_app",
+        "improved_winrm_server:app",
         host="0.0.0.0",
         port=5001,
         reload=True,
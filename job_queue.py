@@ -0,0 +1,344 @@
+"""Asynchronous jobs for the gateway: submit now, collect the result later.
+
+Slow calls such as /excel/open or a long /execute hold the caller's HTTP
+connection for their whole run, and a proxy timeout loses the result. A job
+returns an id straight away; a bounded set of worker tasks runs the jobs and
+keeps each outcome (status, result, timing) for `ttl` seconds so it can be
+polled or long-polled.
+
+Records live in memory. With a SQLite path they are also written through to
+disk, so finished results survive a gateway restart; jobs that were queued or
+running when the previous process stopped come back as failed.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import asdict, dataclass, field
+from typing import Any, Awaitable, Callable
+
+from host_limiter import BackpressureError
+
+logger = logging.getLogger("winrm-gateway.jobs")
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+TERMINAL = frozenset({SUCCEEDED, FAILED, CANCELLED})
+
+# A handler gets the job's params and returns (payload, http_status).
+JobHandler = Callable[[dict], Awaitable[tuple[Any, int]]]
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: dict
+    status: str = QUEUED
+    created: float = field(default_factory=time.time)
+    started: float | None = None
+    finished: float | None = None
+    http_status: int | None = None
+    result: Any = None
+    error: str | None = None
+
+    @property
+    def done(self) -> bool:
+        return self.status in TERMINAL
+
+    def timing(self) -> dict:
+        now = time.time()
+        started = self.started or (self.finished if self.done else now)
+        finished = self.finished or now
+        return {
+            "queued_ms": round((started - self.created) * 1000, 1),
+            "run_ms": round((finished - started) * 1000, 1) if self.started else 0.0,
+            "total_ms": round((finished - self.created) * 1000, 1),
+        }
+
+    def to_dict(self, *, include_result: bool = True) -> dict:
+        out = {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "timing": self.timing(),
+        }
+        if self.done:
+            out["http_status"] = self.http_status
+            out["error"] = self.error
+            if include_result:
+                out["result"] = self.result
+        return out
+
+
+class SqliteJobStore:
+    """Write-through copy of the job records, one JSON row per job."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, created REAL NOT NULL,"
+            " finished REAL, record TEXT NOT NULL)"
+        )
+
+    def save(self, job: Job) -> None:
+        record = json.dumps(asdict(job), default=str)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, created, finished, record) VALUES (?, ?, ?, ?, ?)",
+                (job.id, job.status, job.created, job.finished, record),
+            )
+
+    def load(self, since: float) -> list[Job]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT record FROM jobs WHERE finished IS NULL OR finished >= ? ORDER BY created", (since,)
+            ).fetchall()
+        return [Job(**json.loads(row[0])) for row in rows]
+
+    def delete_before(self, cutoff: float) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM jobs WHERE finished IS NOT NULL AND finished < ?", (cutoff,))
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+
+class JobManager:
+    def __init__(
+        self,
+        handlers: dict[str, JobHandler],
+        *,
+        workers: int = 4,
+        max_queue: int = 256,
+        ttl: float = 3600.0,
+        timeout: float = 600.0,
+        store: SqliteJobStore | None = None,
+    ) -> None:
+        self.handlers = handlers
+        self.workers = workers
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.timeout = timeout
+        self.store = store
+
+        self._jobs: dict[str, Job] = {}
+        self._events: dict[str, asyncio.Event] = {}
+        self._running: dict[str, asyncio.Task] = {}
+        self._queue: deque[str] = deque()
+        self._wakeup: asyncio.Condition | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._last_purge = 0.0
+
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = {SUCCEEDED: 0, FAILED: 0, CANCELLED: 0}
+
+    # -- lifecycle ------------------------------------------------------------
+
+    async def start(self) -> None:
+        self._wakeup = asyncio.Condition()
+        if self.store is not None:
+            self._restore()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"job-worker-{i}") for i in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self.store is not None:
+            self.store.close()
+
+    def _restore(self) -> None:
+        for job in self.store.load(time.time() - self.ttl):
+            if not job.done:
+                job.status = FAILED
+                job.finished = time.time()
+                job.error = "Interrupted by a gateway restart"
+                self.store.save(job)
+            self._jobs[job.id] = job
+        logger.info("Restored %d job record(s) from %s", len(self._jobs), self.store.path)
+
+    # -- public API -------------------------------------------------------------
+
+    async def submit(self, kind: str, params: dict) -> Job:
+        if kind not in self.handlers:
+            raise ValueError(f"kind must be one of {', '.join(sorted(self.handlers))}")
+        self._purge()
+        if len(self._queue) >= self.max_queue:
+            self.rejected += 1
+            raise BackpressureError(f"Job queue is full ({self.max_queue} waiting)", status=429, retry_after=5)
+
+        job = Job(id=uuid.uuid4().hex, kind=kind, params=params)
+        self._jobs[job.id] = job
+        self._events[job.id] = asyncio.Event()
+        self._save(job)
+        self.submitted += 1
+
+        async with self._wakeup:
+            self._queue.append(job.id)
+            self._wakeup.notify()
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        self._purge()
+        return self._jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float) -> Job | None:
+        """Return the job once it is finished or `timeout` has passed."""
+        job = self.get(job_id)
+        if job is None or job.done or timeout <= 0:
+            return job
+        event = self._events.get(job_id)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return job
+
+    def cancel(self, job_id: str) -> Job | None:
+        """Cancel a queued or running job; finished jobs are left as they are.
+
+        A running job's remote call cannot be interrupted mid-flight; it is
+        abandoned and its result discarded, but it keeps its host slot until
+        it returns (see `run_blocking`).
+        """
+        job = self.get(job_id)
+        if job is None or job.done:
+            return job
+        task = self._running.get(job_id)
+        if task is not None:
+            task.cancel()
+        else:
+            try:
+                self._queue.remove(job_id)
+            except ValueError:
+                pass
+            self._finish(job, CANCELLED, None, None, "Cancelled before it started")
+        return job
+
+    def stats(self) -> dict:
+        by_status: dict[str, int] = {}
+        for job in self._jobs.values():
+            by_status[job.status] = by_status.get(job.status, 0) + 1
+        return {
+            "workers": self.workers,
+            "queued": len(self._queue),
+            "running": len(self._running),
+            "max_queue": self.max_queue,
+            "ttl": self.ttl,
+            "timeout": self.timeout,
+            "persistent": self.store is not None,
+            "jobs": by_status,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": dict(self.completed),
+        }
+
+    # -- internals ------------------------------------------------------------
+
+    def _save(self, job: Job) -> None:
+        if self.store is None:
+            return
+        try:
+            self.store.save(job)
+        except sqlite3.Error:
+            logger.exception("Could not persist job %s", job.id)
+
+    def _finish(self, job: Job, status: str, result: Any, http_status: int | None, error: str | None) -> None:
+        job.status = status
+        job.finished = time.time()
+        job.result = result
+        job.http_status = http_status
+        job.error = error
+        self.completed[status] += 1
+        self._save(job)
+        event = self._events.pop(job.id, None)
+        if event is not None:
+            event.set()
+
+    def _purge(self) -> None:
+        now = time.time()
+        if now - self._last_purge < 30:
+            return
+        self._last_purge = now
+        cutoff = now - self.ttl
+        expired = [jid for jid, job in self._jobs.items() if job.done and job.finished < cutoff]
+        for jid in expired:
+            del self._jobs[jid]
+        if self.store is not None:
+            self.store.delete_before(cutoff)
+
+    async def _worker(self) -> None:
+        while True:
+            async with self._wakeup:
+                await self._wakeup.wait_for(lambda: bool(self._queue))
+                job = self._jobs.get(self._queue.popleft())
+            if job is None or job.done:
+                continue
+
+            job.status = RUNNING
+            job.started = time.time()
+            self._save(job)
+            task = asyncio.create_task(self._execute(job))
+            self._running[job.id] = task
+            try:
+                payload, http_status = await task
+            except asyncio.CancelledError:
+                if task.cancelled() and not self._stopping():
+                    self._finish(job, CANCELLED, None, None, "Cancelled while running")
+                    continue
+                raise
+            except asyncio.TimeoutError:
+                self._finish(job, FAILED, None, 504, f"Timed out after {self.timeout}s")
+            except Exception as e:
+                logger.exception("Job %s (%s) failed", job.id, job.kind)
+                self._finish(job, FAILED, None, 500, str(e))
+            else:
+                # Endpoints report remote failures as {"success": false} with a 200.
+                reported = payload.get("success", True) if isinstance(payload, dict) else True
+                status = SUCCEEDED if http_status < 400 and reported is not False else FAILED
+                error = None
+                if status == FAILED and isinstance(payload, dict):
+                    error = payload.get("error") or payload.get("stderr") or "Job failed"
+                self._finish(job, status, payload, http_status, error)
+            finally:
+                self._running.pop(job.id, None)
+
+    def _stopping(self) -> bool:
+        current = asyncio.current_task()
+        return current is not None and current.cancelling() > 0
+
+    async def _execute(self, job: Job) -> tuple[Any, int]:
+        """Run the handler, waiting out host backpressure until the job timeout."""
+        handler = self.handlers[job.kind]
+
+        async def attempt():
+            while True:
+                try:
+                    return await handler(job.params)
+                except BackpressureError as e:
+                    await asyncio.sleep(e.retry_after)
+
+        return await asyncio.wait_for(attempt(), self.timeout)
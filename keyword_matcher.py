@@ -0,0 +1,221 @@
+"""Single-pass keyword matching for business descriptions.
+
+`clearance_keywords.json` lists phrases by group (towing, trucking, garage,
+logging, ...) and the ACORD field aliases of each line of business.
+`KeywordMatcher` compiles the phrases into an Aho-Corasick automaton over
+words rather than characters: a description is split into words once and
+each word is one dict step, so every group is found in a single pass, phrases
+can overlap ("car dealer" is garage, "dealer" is dealer), and matches always
+fall on word boundaries. A hyphen separates words like a space does, so
+"for-hire" matches "for hire"; other punctuation ends a phrase. A trailing
+`*` makes the last word a stem: "timber harvest*" also matches "timber
+harvested" and "timber harvestors".
+
+`KeywordDictionary` holds the matcher for the file and rebuilds it when the
+file changes, either on `refresh()` or from a watcher thread; callers always
+read `.matcher`, which is swapped in whole.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Iterable
+
+logger = logging.getLogger("winrm-gateway.clearance")
+
+DEFAULT_KEYWORDS = Path(__file__).resolve().parent / "clearance_keywords.json"
+
+# Words, plus runs of punctuation other than hyphens as their own tokens: no
+# phrase contains one, so "auto, body" does not match "auto body".
+_TOKEN = re.compile(r"\w+|[^\w\s-]+")
+
+
+def words(text) -> list[str]:
+    return _TOKEN.findall(str(text).casefold()) if text else []
+
+
+class KeywordMatcher:
+    def __init__(self, groups: dict[str, Iterable[str]]) -> None:
+        self.groups = tuple(groups)
+        self.phrases = 0
+        # Trie over words: goto[state][word] -> state; out[state] is a bitmask of
+        # groups. A stem phrase ends in stems[state][prefix], the groups of any
+        # next word starting with the prefix.
+        goto: list[dict[str, int]] = [{}]
+        out: list[int] = [0]
+        stems: list[dict[str, int]] = [{}]
+        for bit, name in enumerate(self.groups):
+            for phrase in groups[name]:
+                stem = phrase.rstrip().endswith("*")
+                tokens = words(phrase.rstrip().rstrip("*") if stem else phrase)
+                prefix = tokens.pop() if stem and tokens else ""
+                state = 0
+                for word in tokens:
+                    nxt = goto[state].get(word)
+                    if nxt is None:
+                        nxt = len(goto)
+                        goto.append({})
+                        out.append(0)
+                        stems.append({})
+                        goto[state][word] = nxt
+                    state = nxt
+                if stem and prefix:
+                    stems[state][prefix] = stems[state].get(prefix, 0) | 1 << bit
+                    self.phrases += 1
+                elif state and not stem:
+                    out[state] |= 1 << bit
+                    self.phrases += 1
+
+        # Breadth-first failure links, folded into full transitions so matching
+        # never backtracks: a word with no edge from a state takes the edge its
+        # failure state would. Words in no phrase go back to the root.
+        fail = [0] * len(goto)
+        delta: list[dict[str, int]] = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        stem_at: list[tuple[tuple[str, int], ...]] = [tuple(stems[0].items())]
+        stem_at.extend(() for _ in range(len(goto) - 1))
+        queue = list(goto[0].values())
+        for state in queue:
+            out[state] |= out[fail[state]]
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            stem_at[state] = stem_at[fail[state]] + tuple(stems[state].items())
+            for word, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(word, 0)
+                queue.append(nxt)
+        self._delta = delta
+        self._out = out
+        self._stems = stem_at
+        self._names: dict[int, frozenset[str]] = {}
+        # One evaluation asks about the same description two or three times.
+        self._last: tuple = (None, 0)
+
+    def mask(self, text) -> int:
+        """Bitmask of the groups with a phrase in the text (bit i is `groups[i]`)."""
+        last_text, last_hits = self._last
+        if text == last_text:
+            return last_hits
+        delta, out, stems = self._delta, self._out, self._stems
+        state = hits = 0
+        for word in words(text):
+            for prefix, bits in stems[state]:
+                if word.startswith(prefix):
+                    hits |= bits
+            state = delta[state].get(word, 0)
+            hits |= out[state]
+        self._last = (text, hits)
+        return hits
+
+    def match(self, text) -> frozenset[str]:
+        """Names of the groups with a phrase in the text."""
+        hits = self.mask(text)
+        names = self._names.get(hits)
+        if names is None:
+            names = self._names[hits] = frozenset(name for bit, name in enumerate(self.groups) if hits >> bit & 1)
+        return names
+
+    def match_many(self, texts: Iterable) -> list[frozenset[str]]:
+        return [self.match(text) for text in texts]
+
+    def __len__(self) -> int:
+        return len(self._delta)
+
+
+class KeywordDictionary:
+    """The compiled keyword file, rebuilt when the file changes."""
+
+    def __init__(self, path: str | Path = DEFAULT_KEYWORDS) -> None:
+        self.path = Path(path)
+        self._stamp = None
+        self._stop = threading.Event()
+        self._watcher: threading.Thread | None = None
+        self.version = 0
+        self.digest = ""
+        self.matcher = KeywordMatcher({})
+        self.line_by_alias: dict[str, str] = {}
+        self.last_error: str | None = None
+        self.last_reload: float | None = None
+        self.refresh(raise_errors=True)
+
+    def load(self, doc: dict) -> None:
+        groups = doc.get("groups")
+        aliases = doc.get("lob_aliases") or {}
+        if not isinstance(groups, dict) or not all(isinstance(v, list) for v in groups.values()):
+            raise ValueError("'groups' must map group names to lists of phrases")
+        matcher = KeywordMatcher(groups)
+        line_by_alias = {alias: line for line, names in aliases.items() for alias in names}
+        # Part of the description-analysis cache key, so new keywords start a cold cache.
+        digest = hashlib.sha1(json.dumps(doc, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+        self.matcher, self.line_by_alias, self.digest = matcher, line_by_alias, digest
+        self.version += 1
+
+    def refresh(self, *, force: bool = False, raise_errors: bool = False) -> bool:
+        """Rebuild from the file if it changed; True when the matcher was replaced."""
+        try:
+            st = self.path.stat()
+            stamp = (st.st_size, st.st_mtime_ns)
+            if stamp == self._stamp and not force:
+                return False
+            start = time.perf_counter()
+            self.load(json.loads(self.path.read_text(encoding="utf-8")))
+        except Exception as e:
+            if raise_errors:
+                raise
+            # Keep matching with the previous dictionary.
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.warning("Keyword dictionary reload from %s failed: %s", self.path, e)
+            return False
+        self._stamp = stamp
+        self.last_error = None
+        self.last_reload = time.time()
+        logger.info(
+            "Keywords v%d from %s: %d phrase(s), %d state(s) in %.1f ms",
+            self.version,
+            self.path,
+            self.matcher.phrases,
+            len(self.matcher),
+            (time.perf_counter() - start) * 1000,
+        )
+        return True
+
+    def start_watch(self, interval: float) -> None:
+        if self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def watch() -> None:
+            while not self._stop.wait(interval):
+                self.refresh()
+
+        self._watcher = threading.Thread(target=watch, name="keyword-dictionary-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watch(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    def stats(self) -> dict:
+        return {
+            "path": str(self.path),
+            "version": self.version,
+            "digest": self.digest,
+            "groups": list(self.matcher.groups),
+            "phrases": self.matcher.phrases,
+            "states": len(self.matcher),
+            "lob_aliases": len(self.line_by_alias),
+            "last_reload": self.last_reload,
+            "last_error": self.last_error,
+            "watching": self._watcher is not None,
+        }
+
+
+def keywords_from_env() -> KeywordDictionary:
+    return KeywordDictionary(os.getenv("CLEARANCE_KEYWORDS", "").strip() or DEFAULT_KEYWORDS)
@@ -0,0 +1,457 @@
+"""In-memory producer list index for /producer/lookup.
+
+The producer list (agency, location, agent, lead underwriter, logging lead)
+is loaded from a local CSV/JSON/XLSX export or from the workbook itself
+through the gateway's /excel/read. Lookups never touch the source; they hit:
+
+  - hash indexes on the normalized agency name, on the "core" name without
+    legal/industry words (so "Acme Insurance Agency, LLC" == "ACME Ins."),
+    and on the agent's name,
+  - a trigram index over core agency names for the fuzzy fallback, scored
+    with the Dice coefficient.
+
+A watcher thread polls the source's stamp (file size/mtime, or the workbook
+ETag) and, when it changes, diffs the rows and updates only the records that
+were added or removed.
+"""
+
+from __future__ import annotations
+
+import csv
+import io
+import json
+import logging
+import math
+import os
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from pathlib import Path
+from typing import Any, Iterable
+
+try:
+    import openpyxl
+except ImportError:  # optional; only needed for local .xlsx producer lists
+    openpyxl = None
+
+from clearance_services import normalize_name
+
+logger = logging.getLogger("winrm-gateway.producers")
+
+FUZZY_MIN_SCORE = 0.6
+
+# Words that do not tell agencies apart.
+NOISE_WORDS = frozenset(
+    "the and of llc inc incorporated co corp corporation company ltd lp llp pllc pc "
+    "agency agencies insurance ins group services service associates assoc".split()
+)
+
+# Spreadsheet headers (normalized) for the fields the clearance flow reads.
+HEADER_ALIASES = {
+    "agency": "agency_name",
+    "agency_name": "agency_name",
+    "producer": "agency_name",
+    "producer_name": "agency_name",
+    "agency_display_name": "agency_display_name",
+    "display_name": "agency_display_name",
+    "location": "agency_location",
+    "office": "agency_location",
+    "city": "agency_location",
+    "agency_location": "agency_location",
+    "agent": "agent_name",
+    "agent_name": "agent_name",
+    "contact": "agent_name",
+    "first_name": "agent_firstname",
+    "agent_first_name": "agent_firstname",
+    "agent_firstname": "agent_firstname",
+    "last_name": "agent_lastname",
+    "agent_last_name": "agent_lastname",
+    "agent_lastname": "agent_lastname",
+    "underwriter": "underwriter_name",
+    "underwriter_name": "underwriter_name",
+    "lead": "underwriter_name",
+    "lead_uw": "underwriter_name",
+    "lead_underwriter": "underwriter_name",
+    "logging_lead": "logging_lead_name",
+    "logging_lead_name": "logging_lead_name",
+    "logging_uw": "logging_lead_name",
+}
+
+
+class ProducerIndexNotReady(RuntimeError):
+    """The producer list has a source but has not been loaded yet."""
+
+
+def header_key(name) -> str:
+    key = "_".join(normalize_name(name).split())
+    return HEADER_ALIASES.get(key, key)
+
+
+def core_name(name) -> str:
+    normalized = normalize_name(name)
+    core = " ".join(w for w in normalized.split() if w not in NOISE_WORDS)
+    return core or normalized
+
+
+def trigrams(text: str) -> set[str]:
+    padded = f"  {text} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def _agent_keys(record: dict) -> list[str]:
+    first = normalize_name(record.get("agent_firstname"))
+    last = normalize_name(record.get("agent_lastname"))
+    keys = []
+    if first and last:
+        keys += [f"{first} {last}", f"{last} {first}"]
+    full = normalize_name(record.get("agent_name"))
+    if full and full not in keys:
+        keys.append(full)
+    return keys
+
+
+def normalize_record(row: dict) -> dict | None:
+    record = {}
+    for name, value in row.items():
+        if name is None or name == "":
+            continue
+        if isinstance(value, float) and value.is_integer():
+            value = int(value)
+        record[header_key(name)] = "" if value is None else str(value).strip()
+    if not record.get("agency_name"):
+        return None
+    # Split a single "Agent" column into the first/last names the flow writes back.
+    agent = record.get("agent_name", "")
+    if agent and not (record.get("agent_firstname") or record.get("agent_lastname")):
+        if "," in agent:
+            last, _, first = agent.partition(",")
+        else:
+            first, _, last = agent.rpartition(" ")
+        record["agent_firstname"], record["agent_lastname"] = first.strip(), last.strip()
+    return record
+
+
+def rows_from_table(table: list[list]) -> list[dict]:
+    """Header row plus data rows (as /excel/read returns them) to dicts."""
+    if not table:
+        return []
+    header = table[0]
+    return [dict(zip(header, row)) for row in table[1:] if any(v not in (None, "") for v in row)]
+
+
+# -----------------------------------------------------------------------------
+# Sources
+# -----------------------------------------------------------------------------
+class LocalFileSource:
+    """A producer list exported to CSV, JSON (array of objects) or XLSX."""
+
+    def __init__(self, path: str, sheet: str | None = None) -> None:
+        self.path = Path(path)
+        self.sheet = sheet
+
+    def __str__(self) -> str:
+        return str(self.path)
+
+    def fetch(self, stamp) -> tuple[Any, list[dict]] | None:
+        st = self.path.stat()
+        current = (st.st_size, st.st_mtime_ns)
+        if current == stamp:
+            return None
+        suffix = self.path.suffix.lower()
+        if suffix == ".json":
+            rows = json.loads(self.path.read_text(encoding="utf-8"))
+        elif suffix in (".xlsx", ".xlsm"):
+            if openpyxl is None:
+                raise RuntimeError("openpyxl is required to read .xlsx producer lists")
+            workbook = openpyxl.load_workbook(self.path, read_only=True, data_only=True)
+            try:
+                sheet = workbook[self.sheet] if self.sheet else workbook.worksheets[0]
+                rows = rows_from_table([list(r) for r in sheet.iter_rows(values_only=True)])
+            finally:
+                workbook.close()
+        else:
+            rows = list(csv.DictReader(io.StringIO(self.path.read_text(encoding="utf-8-sig"))))
+        return current, rows
+
+
+class GatewayWorkbookSource:
+    """The producer workbook on the Windows host, read through the gateway's /excel/read.
+
+    The ETag of the last read is sent back as If-None-Match, so an unchanged
+    workbook costs the gateway one remote stat and returns 304.
+    """
+
+    def __init__(self, base_url: str, file_path: str, sheet: str | None = None, timeout: float = 120.0) -> None:
+        self.url = base_url.rstrip("/") + "/excel/read"
+        self.file_path = file_path
+        self.sheet = sheet
+        self.timeout = timeout
+
+    def __str__(self) -> str:
+        return f"{self.file_path} via {self.url}"
+
+    def fetch(self, stamp) -> tuple[Any, list[dict]] | None:
+        body = {"file_path": self.file_path, "layout": "rows"}
+        if self.sheet:
+            body["sheet"] = self.sheet
+        req = urllib.request.Request(
+            self.url,
+            data=json.dumps(body).encode("utf-8"),
+            headers={"Content-Type": "application/json", **({"If-None-Match": stamp} if stamp else {})},
+            method="POST",
+        )
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as resp:
+                etag = resp.headers.get("ETag")
+                doc = json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 304:
+                return None
+            raise RuntimeError(f"/excel/read returned {e.code}: {e.read()[:500]!r}") from e
+        if not doc.get("success", True) or "data" not in doc:
+            raise RuntimeError(f"/excel/read failed: {doc.get('error') or doc.get('stderr') or doc}")
+        return etag, rows_from_table(doc["data"])
+
+
+# -----------------------------------------------------------------------------
+# Index
+# -----------------------------------------------------------------------------
+class ProducerIndex:
+    def __init__(self, source=None, *, fuzzy_min_score: float = FUZZY_MIN_SCORE) -> None:
+        self.source = source
+        self.fuzzy_min_score = fuzzy_min_score
+        self._lock = threading.Lock()
+        self._records: dict[int, dict] = {}
+        self._ids_by_row: dict[tuple, int] = {}
+        self._next_id = 0
+        self._by_name: dict[str, set[int]] = {}
+        self._by_core: dict[str, set[int]] = {}
+        self._by_agent: dict[str, set[int]] = {}
+        # Fuzzy index over distinct core names: trigram -> cores, core -> its trigrams.
+        self._cores_by_gram: dict[str, set[str]] = {}
+        self._grams: dict[str, frozenset[str]] = {}
+
+        self._stamp = None
+        self.loaded = source is None
+        self.version = 0
+        self.last_reload: float | None = None
+        self.last_error: str | None = None
+        self.last_change = {"added": 0, "removed": 0, "seconds": 0.0}
+        self.lookups = Counter()
+
+        self._watcher: threading.Thread | None = None
+        self._stop = threading.Event()
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    # -- building -------------------------------------------------------------
+
+    def _insert(self, rid: int, record: dict) -> None:
+        self._records[rid] = record
+        name = normalize_name(record["agency_name"])
+        core = core_name(record["agency_name"])
+        self._by_name.setdefault(name, set()).add(rid)
+        if core not in self._by_core:
+            self._by_core[core] = set()
+            grams = self._grams[core] = frozenset(trigrams(core))
+            for gram in grams:
+                self._cores_by_gram.setdefault(gram, set()).add(core)
+        self._by_core[core].add(rid)
+        for key in _agent_keys(record):
+            self._by_agent.setdefault(key, set()).add(rid)
+
+    def _remove(self, rid: int) -> None:
+        record = self._records.pop(rid)
+
+        def discard(index: dict, key: str) -> bool:
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(rid)
+                if not ids:
+                    del index[key]
+                    return True
+            return False
+
+        discard(self._by_name, normalize_name(record["agency_name"]))
+        core = core_name(record["agency_name"])
+        if discard(self._by_core, core):
+            for gram in self._grams.pop(core):
+                cores = self._cores_by_gram[gram]
+                cores.discard(core)
+                if not cores:
+                    del self._cores_by_gram[gram]
+        for key in _agent_keys(record):
+            discard(self._by_agent, key)
+
+    def apply(self, rows: Iterable[dict]) -> dict:
+        """Bring the index in line with `rows`, touching only rows that changed."""
+        start = time.perf_counter()
+        wanted: dict[tuple, dict] = {}
+        for row in rows:
+            record = normalize_record(row)
+            if record is not None:
+                wanted[tuple(sorted(record.items()))] = record
+        with self._lock:
+            removed = [key for key in self._ids_by_row if key not in wanted]
+            added = [key for key in wanted if key not in self._ids_by_row]
+            for key in removed:
+                self._remove(self._ids_by_row.pop(key))
+            for key in added:
+                rid = self._next_id
+                self._next_id += 1
+                self._ids_by_row[key] = rid
+                self._insert(rid, wanted[key])
+            self.version += 1
+            self.loaded = True
+        self.last_change = {"added": len(added), "removed": len(removed), "seconds": round(time.perf_counter() - start, 4)}
+        return self.last_change
+
+    def refresh(self, *, force: bool = False) -> bool:
+        """Reload from the source if it changed; True when the index was updated."""
+        if self.source is None:
+            return False
+        try:
+            fetched = self.source.fetch(None if force else self._stamp)
+        except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
+            logger.warning("Producer list refresh from %s failed: %s", self.source, e)
+            return False
+        self.last_error = None
+        self.last_reload = time.time()
+        if fetched is None:
+            return False
+        stamp, rows = fetched
+        change = self.apply(rows)
+        self._stamp = stamp
+        logger.info(
+            "Producer list v%d from %s: %d record(s), +%d -%d in %.1f ms",
+            self.version,
+            self.source,
+            len(self),
+            change["added"],
+            change["removed"],
+            change["seconds"] * 1000,
+        )
+        return True
+
+    def start_watch(self, interval: float) -> None:
+        if self.source is None or self._watcher is not None:
+            return
+        self._stop.clear()
+
+        def watch() -> None:
+            while True:
+                self.refresh()
+                if self._stop.wait(interval):
+                    return
+
+        self._watcher = threading.Thread(target=watch, name="producer-index-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watch(self) -> None:
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=5)
+            self._watcher = None
+
+    # -- lookup ---------------------------------------------------------------
+
+    def _fuzzy(self, core: str) -> tuple[str | None, float]:
+        """Best core name by trigram Dice score, if any reaches fuzzy_min_score.
+
+        A name scoring at least t shares at least t*|A|/(2-t) of the query's
+        |A| trigrams, so it must appear in the postings of the |A|-need+1
+        rarest of them; only those short lists are scanned.
+        """
+        grams = trigrams(core)
+        t = self.fuzzy_min_score
+        need = max(1, math.ceil(t * len(grams) / (2 - t)))
+        postings = sorted((self._cores_by_gram.get(gram, ()) for gram in grams), key=len)
+        candidates = set().union(*postings[: len(grams) - need + 1])
+        best, best_score = None, 0.0
+        for candidate in candidates:
+            other = self._grams[candidate]
+            score = 2 * len(grams & other) / (len(grams) + len(other))
+            if score > best_score:
+                best, best_score = candidate, score
+        return best, best_score
+
+    @staticmethod
+    def _rank(records: list[dict], location: str, agent: str) -> dict:
+        """Prefer the record at the submitted location, then the submitted agent."""
+        if len(records) == 1:
+            return records[0]
+        location_words = set(location.split())
+
+        def score(record: dict) -> tuple[int, int]:
+            at = set(normalize_name(record.get("agency_location")).split())
+            return (
+                1 if at and location_words and (at <= location_words or location_words <= at) else 0,
+                1 if agent and agent in _agent_keys(record) else 0,
+            )
+
+        return max(records, key=score)
+
+    def lookup(self, body: dict) -> dict:
+        """The flow's /producer/lookup: {agency_name, agency_location, agent_name} -> {found, producer_info}."""
+        if not self.loaded:
+            raise ProducerIndexNotReady(f"Producer list from {self.source} is not loaded yet")
+        agency = body.get("agency_name")
+        location = normalize_name(body.get("agency_location"))
+        agent = normalize_name(body.get("agent_name"))
+
+        with self._lock:
+            match, score = "exact", 1.0
+            ids = self._by_name.get(normalize_name(agency))
+            if not ids and agency:
+                core = core_name(agency)
+                ids = self._by_core.get(core)
+                match = "core"
+                if not ids:
+                    best, score = self._fuzzy(core)
+                    if best is not None and score >= self.fuzzy_min_score:
+                        ids, match = self._by_core[best], "fuzzy"
+            # An agency that is not on the list is a house account, whoever the
+            # agent is; the agent only identifies the agency when none was given.
+            if not agency and agent:
+                ids, match, score = self._by_agent.get(agent), "agent", 1.0
+            if not ids:
+                self.lookups["miss"] += 1
+                return {"found": False, "producer_info": {}, "match": None}
+            record = self._rank([self._records[rid] for rid in ids], location, agent)
+            self.lookups[match] += 1
+        return {"found": True, "producer_info": dict(record), "match": match, "score": round(score, 3)}
+
+    def records(self) -> list[dict]:
+        """A snapshot of the records, e.g. to build an identical index in another process."""
+        with self._lock:
+            return list(self._records.values())
+
+    def stats(self) -> dict:
+        return {
+            "source": str(self.source) if self.source is not None else None,
+            "loaded": self.loaded,
+            "records": len(self),
+            "agencies": len(self._by_core),
+            "version": self.version,
+            "last_reload": self.last_reload,
+            "last_error": self.last_error,
+            "last_change": self.last_change,
+            "lookups": dict(self.lookups),
+        }
+
+
+def source_from_env() -> LocalFileSource | GatewayWorkbookSource | None:
+    """PRODUCER_LIST (local file) or PRODUCER_WORKBOOK (path on the Windows host, via the gateway)."""
+    sheet = os.getenv("PRODUCER_SHEET", "").strip() or None
+    local = os.getenv("PRODUCER_LIST", "").strip()
+    if local:
+        return LocalFileSource(local, sheet)
+    remote = os.getenv("PRODUCER_WORKBOOK", "").strip()
+    if remote:
+        gateway = os.getenv("PRODUCER_GATEWAY_URL", "http://127.0.0.1:5001").strip()
+        return GatewayWorkbookSource(gateway, remote, sheet)
+    return None
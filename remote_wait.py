@@ -0,0 +1,93 @@
+"""Remote-side completion waits for the scheduled-task bridge.
+
+Work handed to the interactive session (schtasks /IT) reports back by writing
+an output file. Instead of polling for that file with one WinRM call per tick,
+`wait_for_file_script` blocks on the remote host on a FileSystemWatcher and
+returns the file's contents as soon as the writer closes it, or nothing once
+the deadline passes.
+"""
+
+from __future__ import annotations
+
+from typing import Callable
+
+
+def _ps_quote(s: str) -> str:
+    return "'" + s.replace("'", "''") + "'"
+
+
+def wait_for_file_script(path: str, timeout_s: float) -> str:
+    """PowerShell that prints `path`'s contents once it is complete.
+
+    Prints nothing (exit 0) if the file has not appeared within `timeout_s`.
+    A file still held open by its writer counts as not there yet, so a
+    half-written JSON document is never returned.
+    """
+    return f"""
+$ErrorActionPreference = 'Stop'
+[Console]::OutputEncoding = New-Object System.Text.UTF8Encoding($false)
+$path = {_ps_quote(path)}
+$deadline = [DateTime]::UtcNow.AddMilliseconds({int(timeout_s * 1000)})
+$dir = Split-Path -Parent $path
+New-Item -ItemType Directory -Force -Path $dir | Out-Null
+
+function Read-CompleteFile {{
+    if (-not [IO.File]::Exists($path)) {{ return $null }}
+    try {{
+        # Deny writers: fails while Set-Content/Out-File still has the file open.
+        $fs = [IO.File]::Open($path, [IO.FileMode]::Open, [IO.FileAccess]::Read, [IO.FileShare]::Read)
+    }} catch [IO.IOException] {{
+        return $null
+    }}
+    try {{
+        $reader = New-Object IO.StreamReader($fs, [Text.Encoding]::UTF8, $true)
+        return $reader.ReadToEnd()
+    }} finally {{
+        $fs.Dispose()
+    }}
+}}
+
+$watcher = New-Object IO.FileSystemWatcher($dir, (Split-Path -Leaf $path))
+$watcher.NotifyFilter = [IO.NotifyFilters]'FileName, LastWrite, Size'
+try {{
+    while ($true) {{
+        $text = Read-CompleteFile
+        if ($text -and $text.Trim()) {{
+            [Console]::Out.Write($text)
+            exit 0
+        }}
+        $left = ($deadline - [DateTime]::UtcNow).TotalMilliseconds
+        if ($left -le 0) {{ exit 0 }}
+        # Wakes on create/write/close. The cap only covers an event landing
+        # between the check above and this wait, or a writer still closing.
+        [void]$watcher.WaitForChanged([IO.WatcherChangeTypes]::All, [int][Math]::Min($left, 500))
+    }}
+}} finally {{
+    $watcher.Dispose()
+}}
+"""
+
+
+def wait_for_file(
+    run_ps: Callable[..., dict],
+    path: str,
+    timeout_s: float,
+    *,
+    slice_s: float = 60.0,
+) -> str | None:
+    """Wait for `path` with as few remote calls as the WinRM timeouts allow.
+
+    `run_ps` is the gateway's `run_ps(script, timeout=...)`. Each call blocks
+    remotely for up to `slice_s`; returns the file contents, or None on
+    timeout.
+    """
+    remaining = timeout_s
+    while remaining > 0:
+        wait = min(remaining, slice_s)
+        result = run_ps(wait_for_file_script(path, wait), timeout=int(wait) + 30)
+        if not result["success"]:
+            raise RuntimeError(f"Remote wait for {path} failed: {result['stderr']}")
+        if result["stdout"].strip():
+            return result["stdout"]
+        remaining -= wait
+    return None
@@ -0,0 +1,247 @@
+"""Run many UIA actions concurrently, with a cap on in-flight jobs per host.
+
+Also the fleet fan-out behind `run.py --hosts/--inventory`: the same action on
+many hosts, results streamed as they complete plus a latency summary.
+
+Each job is a one-shot `run_action` (own job folder and scheduled task on the
+Windows side, see `winrm_client._run_action`), or an agent job with --agent.
+Jobs for different hosts run in parallel; jobs for the same host run at most
+`--max-per-host` at a time, the rest wait in a per-host queue.
+
+Jobs file: a JSON list or JSON lines, one object per job, using the same keys
+as the uia_run.ps1 input plus an optional host:
+  {"host": "10.0.0.42", "action": "sendKeysToWindow", "windowName": "Notepad", "keys": "Hi{ENTER}"}
+  {"action": "listTopWindows"}
+
+Connection settings come from the same env vars / .env as run.py; a job may
+override `host`. Results are printed as JSON lines as jobs finish.
+
+Usage:
+  python job_runner.py jobs.jsonl --max-per-host 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import asdict, dataclass, fields, replace
+from getpass import getpass
+from pathlib import Path
+from typing import IO, Iterable, Iterator
+
+from winrm_client import Args, run_action
+
+# uia_run.ps1 input keys -> Args fields.
+JOB_FIELDS = {
+    "action": "action",
+    "windowName": "window_name",
+    "keys": "keys",
+    "folderPath": "folder_path",
+    "subjectContains": "subject_contains",
+    "host": "host",
+    "jobId": "job_id",
+    "actions": "actions",
+    "stopOnError": "stop_on_error",
+    "containerName": "container_name",
+    "maxDepth": "max_depth",
+    "fields": "fields",
+}
+
+
+@dataclass
+class JobResult:
+    index: int
+    host: str
+    action: str
+    ok: bool
+    seconds: float
+    result: object = None
+    error: str | None = None
+
+
+def job_args(base: Args, job: dict) -> Args:
+    unknown = set(job) - set(JOB_FIELDS)
+    if unknown:
+        raise ValueError(f"Unknown job keys: {', '.join(sorted(unknown))}")
+    return replace(base, **{JOB_FIELDS[k]: v for k, v in job.items()})
+
+
+def _run_one(index: int, args: Args) -> JobResult:
+    start = time.perf_counter()
+    try:
+        out = run_action(args)
+    except Exception as e:
+        return JobResult(index, args.host, args.action, False, round(time.perf_counter() - start, 3), error=str(e))
+    elapsed = round(time.perf_counter() - start, 3)
+    try:
+        parsed = json.loads(out)
+    except ValueError:
+        return JobResult(index, args.host, args.action, True, elapsed, result=out)
+    ok = bool(parsed.get("ok", True)) if isinstance(parsed, dict) else True
+    error = parsed.get("error") if isinstance(parsed, dict) else None
+    return JobResult(index, args.host, args.action, ok, elapsed, result=parsed, error=error)
+
+
+def run_jobs(jobs: Iterable[Args], *, max_per_host: int = 1, max_workers: int = 16) -> Iterator[JobResult]:
+    """Run `jobs` and yield their results in completion order.
+
+    A job is only handed to the thread pool once its host has a free slot,
+    so queued jobs for a busy host never tie up worker threads.
+    """
+    queues: dict[str, deque[tuple[int, Args]]] = {}
+    for i, args in enumerate(jobs):
+        queues.setdefault(args.host, deque()).append((i, args))
+
+    in_flight: dict[str, int] = {host: 0 for host in queues}
+    running: dict[Future, str] = {}
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+
+        def fill() -> None:
+            for host, queue in queues.items():
+                while queue and in_flight[host] < max_per_host and len(running) < max_workers:
+                    i, args = queue.popleft()
+                    in_flight[host] += 1
+                    running[pool.submit(_run_one, i, args)] = host
+
+        fill()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in done:
+                in_flight[running.pop(fut)] -= 1
+                yield fut.result()
+            fill()
+
+
+def load_jobs(path: Path) -> list[dict]:
+    text = path.read_text(encoding="utf-8").strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def load_inventory(path: Path) -> list[dict]:
+    """Hosts for a fan-out.
+
+    Either plain text (one host per line, `#` comments) or JSON: a list of
+    host strings, or of objects with "host" plus per-host Args overrides
+    such as "port", "username" or "use_ssl".
+    """
+    text = path.read_text(encoding="utf-8").strip()
+    if not text.startswith("["):
+        lines = (line.split("#", 1)[0].strip() for line in text.splitlines())
+        return [{"host": line} for line in lines if line]
+
+    allowed = {f.name for f in fields(Args)}
+    hosts = []
+    for entry in json.loads(text):
+        if isinstance(entry, str):
+            entry = {"host": entry}
+        unknown = set(entry) - allowed
+        if unknown or not entry.get("host"):
+            raise ValueError(f"Bad inventory entry {entry!r} (unknown keys: {sorted(unknown)})")
+        hosts.append(entry)
+    return hosts
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(results: list[JobResult], wall_seconds: float) -> dict:
+    latencies = sorted(r.seconds for r in results)
+    failed = [r.host for r in results if not r.ok]
+    return {
+        "hosts": len(results),
+        "ok": len(results) - len(failed),
+        "failed": len(failed),
+        "failed_hosts": failed,
+        "wall_seconds": round(wall_seconds, 3),
+        "latency_seconds": {
+            "p50": percentile(latencies, 50),
+            "p90": percentile(latencies, 90),
+            "p95": percentile(latencies, 95),
+            "p99": percentile(latencies, 99),
+            "max": latencies[-1] if latencies else 0.0,
+        },
+    }
+
+
+def run_fleet(base: Args, hosts: list[dict], *, concurrency: int = 8, out: IO[str] = sys.stdout) -> dict:
+    """Run `base` on every host, `concurrency` hosts at a time.
+
+    Prints one JSON line per host as it completes, then returns (and prints)
+    the summary.
+    """
+    jobs = [replace(base, **entry) for entry in hosts]
+    start = time.perf_counter()
+    results = []
+    for result in run_jobs(jobs, max_per_host=1, max_workers=concurrency):
+        results.append(result)
+        print(json.dumps(asdict(result)), file=out, flush=True)
+    summary = summarize(results, time.perf_counter() - start)
+    print(json.dumps({"summary": summary}), file=out, flush=True)
+    return summary
+
+
+def main() -> None:
+    from run import env_bool, load_dotenv
+
+    load_dotenv(Path(__file__).resolve().parent / ".env")
+
+    p = argparse.ArgumentParser()
+    p.add_argument("jobs", type=Path, help="JSON list or JSON lines of jobs")
+    p.add_argument("--max-per-host", type=int, default=int(os.getenv("UIA_MAX_PER_HOST", "1")))
+    p.add_argument("--max-workers", type=int, default=16)
+    p.add_argument("--host", default=os.getenv("WINRM_HOST"))
+    p.add_argument("--username", default=os.getenv("WINRM_USERNAME"), required=os.getenv("WINRM_USERNAME") is None)
+    p.add_argument("--password", default=os.getenv("WINRM_PASSWORD"))
+    p.add_argument("--run-as-user", default=os.getenv("WINRM_RUN_AS_USER"))
+    p.add_argument("--run-as-password", default=os.getenv("WINRM_RUN_AS_PASSWORD"))
+    p.add_argument("--transport", default=os.getenv("WINRM_TRANSPORT", "ntlm"), choices=["ntlm", "kerberos", "basic"])
+    p.add_argument("--port", type=int, default=int(os.getenv("WINRM_PORT", "5985")))
+    p.add_argument("--use-ssl", action="store_true", default=env_bool("WINRM_USE_SSL", False))
+    p.add_argument("--reuse-shell", action="store_true", default=env_bool("WINRM_REUSE_SHELL", False))
+    p.add_argument("--agent", action="store_true", default=env_bool("WINRM_UIA_AGENT", False))
+    ns = p.parse_args()
+
+    password = ns.password or getpass("WinRM password: ")
+    base = Args(
+        host=ns.host or "",
+        username=ns.username,
+        password=password,
+        run_as_user=ns.run_as_user or ns.username,
+        run_as_password=ns.run_as_password or password,
+        action="",
+        window_name=None,
+        keys=None,
+        folder_path=None,
+        subject_contains=None,
+        transport=ns.transport,
+        port=ns.port,
+        use_ssl=bool(ns.use_ssl),
+        reuse_shell=bool(ns.reuse_shell),
+        use_agent=bool(ns.agent),
+    )
+
+    jobs = [job_args(base, job) for job in load_jobs(ns.jobs)]
+    missing = [i for i, j in enumerate(jobs) if not j.host]
+    if missing:
+        raise SystemExit(f"Jobs {missing} have no host (set WINRM_HOST, --host or a per-job host)")
+
+    for result in run_jobs(jobs, max_per_host=ns.max_per_host, max_workers=ns.max_workers):
+        print(json.dumps(asdict(result)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
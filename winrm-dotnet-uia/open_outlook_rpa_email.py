@@ -8,8 +8,10 @@ Usage:
 
 Optional env vars (loaded from a local `.env` next to this file if present):
   WINRM_HOST, WINRM_USERNAME, WINRM_PASSWORD,
+  WINRM_HOSTS / WINRM_INVENTORY (fan out to many hosts), WINRM_FANOUT_CONCURRENCY,
   WINRM_RUN_AS_USER, WINRM_RUN_AS_PASSWORD,
-  WINRM_TRANSPORT (ntlm|kerberos|basic), WINRM_PORT, WINRM_USE_SSL (true/false)
+  WINRM_TRANSPORT (ntlm|kerberos|basic), WINRM_PORT, WINRM_USE_SSL (true/false),
+  WINRM_REUSE_SHELL (true/false), WINRM_UIA_AGENT (true/false)
 
   OUTLOOK_FOLDER_PATH (default: Inbox\\RPA)
   OUTLOOK_SUBJECT_CONTAINS (optional)
@@ -21,6 +23,7 @@ import os
 from getpass import getpass
 from pathlib import Path
 
+from run import fleet_hosts
 from winrm_client import Args, run_action
 
 
@@ -56,8 +59,9 @@ def main() -> None:
 
     host = os.getenv("WINRM_HOST")
     username = os.getenv("WINRM_USERNAME")
-    if not host or not username:
-        raise SystemExit("WINRM_HOST and WINRM_USERNAME must be set (e.g. in .env)")
+    fleet = fleet_hosts(os.getenv("WINRM_HOSTS"), os.getenv("WINRM_INVENTORY"))
+    if not (host or fleet) or not username:
+        raise SystemExit("WINRM_HOST (or WINRM_HOSTS / WINRM_INVENTORY) and WINRM_USERNAME must be set (e.g. in .env)")
 
     password = os.getenv("WINRM_PASSWORD") or getpass("WinRM password: ")
 
@@ -72,7 +76,7 @@ def main() -> None:
     use_ssl = env_bool("WINRM_USE_SSL", False)
 
     args = Args(
-        host=host,
+        host=host or "",
         username=username,
         password=password,
         run_as_user=run_as_user,
@@ -85,8 +89,17 @@ def main() -> None:
         transport=transport,
         port=port,
         use_ssl=use_ssl,
+        reuse_shell=env_bool("WINRM_REUSE_SHELL", False),
+        use_agent=env_bool("WINRM_UIA_AGENT", False),
     )
 
+    if fleet:
+        from job_runner import run_fleet
+
+        concurrency = int(os.getenv("WINRM_FANOUT_CONCURRENCY", "8"))
+        summary = run_fleet(args, fleet, concurrency=concurrency)
+        raise SystemExit(1 if summary["failed"] else 0)
+
     print(run_action(args))
 
 
@@ -13,10 +13,18 @@ Examples:
   python run.py send-keys --host 10.0.0.42 --username 'DOMAIN\\user' --run-as-user 'DOMAIN\\user' \
     --window-name Notepad --keys 'Hello{ENTER}'
 
+  # Same action on a fleet, 16 hosts at a time; one JSON line per host, then a summary
+  python run.py list-windows --inventory hosts.txt --concurrency 16 --username 'DOMAIN\\user'
+
+  # Several steps in one scheduled run (stops at the first failing step)
+  python run.py batch --host 10.0.0.42 --username 'DOMAIN\\user' --actions-file steps.json
+
 Env vars (optional):
-  WINRM_HOST, WINRM_USERNAME, WINRM_PASSWORD,
+  WINRM_HOST, WINRM_HOSTS, WINRM_INVENTORY, WINRM_FANOUT_CONCURRENCY,
+  WINRM_USERNAME, WINRM_PASSWORD,
   WINRM_RUN_AS_USER, WINRM_RUN_AS_PASSWORD,
-  WINRM_TRANSPORT (ntlm|kerberos|basic), WINRM_PORT, WINRM_USE_SSL (true/false)
+  WINRM_TRANSPORT (ntlm|kerberos|basic), WINRM_PORT, WINRM_USE_SSL (true/false),
+  WINRM_REUSE_SHELL (true/false), WINRM_UIA_AGENT (true/false)
 """
 
 from __future__ import annotations
@@ -26,7 +34,7 @@ import os
 from getpass import getpass
 from pathlib import Path
 
-from winrm_client import Args, run_action
+from winrm_client import Args, load_actions, load_fields, run_action
 
 
 def load_dotenv(path: Path) -> None:
@@ -59,7 +67,29 @@ def env_bool(name: str, default: bool = False) -> bool:
     return val.strip().lower() in {"1", "true", "yes", "y", "on"}
 
 
-def parse() -> tuple[str, Args]:
+def fleet_hosts(hosts: str | None, inventory: str | None) -> list[dict]:
+    """Hosts from --hosts and --inventory; empty means single-host mode."""
+    fleet = [{"host": h.strip()} for h in (hosts or "").split(",") if h.strip()]
+    if inventory:
+        from job_runner import load_inventory
+
+        fleet.extend(load_inventory(Path(inventory)))
+    return fleet
+
+
+def form_fields(p: argparse.ArgumentParser, ns: argparse.Namespace) -> dict:
+    fields = load_fields(ns.fields_file) if ns.fields_file else {}
+    for item in ns.field:
+        label, sep, value = item.partition("=")
+        if not sep or not label.strip():
+            p.error(f"--field expects LABEL=VALUE, got {item!r}")
+        fields[label.strip()] = value
+    if not fields:
+        p.error("fill-form needs --fields-file or --field")
+    return fields
+
+
+def parse() -> tuple[str, Args, list[dict], int]:
     # Allow users to keep WINRM_* defaults in a local `.env` file.
     load_dotenv(Path(__file__).resolve().parent / ".env")
 
@@ -68,7 +98,19 @@ def parse() -> tuple[str, Args]:
     sub = p.add_subparsers(dest="cmd", required=True)
 
     def add_common(sp: argparse.ArgumentParser) -> None:
-        sp.add_argument("--host", default=os.getenv("WINRM_HOST"), required=os.getenv("WINRM_HOST") is None)
+        sp.add_argument("--host", default=os.getenv("WINRM_HOST"))
+        sp.add_argument("--hosts", default=os.getenv("WINRM_HOSTS"), help="Comma-separated hosts to fan out to")
+        sp.add_argument(
+            "--inventory",
+            default=os.getenv("WINRM_INVENTORY"),
+            help="Host list file (one per line, or JSON) to fan out to",
+        )
+        sp.add_argument(
+            "--concurrency",
+            type=int,
+            default=int(os.getenv("WINRM_FANOUT_CONCURRENCY", "8")),
+            help="Hosts in flight at once when fanning out",
+        )
         sp.add_argument("--username", default=os.getenv("WINRM_USERNAME"), required=os.getenv("WINRM_USERNAME") is None)
         sp.add_argument("--password", default=os.getenv("WINRM_PASSWORD"))
 
@@ -78,6 +120,18 @@ def parse() -> tuple[str, Args]:
         sp.add_argument("--transport", default=os.getenv("WINRM_TRANSPORT", "ntlm"), choices=["ntlm", "kerberos", "basic"])
         sp.add_argument("--port", type=int, default=int(os.getenv("WINRM_PORT", "5985")))
         sp.add_argument("--use-ssl", action="store_true", default=env_bool("WINRM_USE_SSL", False))
+        sp.add_argument(
+            "--reuse-shell",
+            action="store_true",
+            default=env_bool("WINRM_REUSE_SHELL", False),
+            help="Run all PowerShell calls in one warm remote shell",
+        )
+        sp.add_argument(
+            "--agent",
+            action="store_true",
+            default=env_bool("WINRM_UIA_AGENT", False),
+            help="Queue actions to the resident UIA agent instead of a one-shot scheduled task",
+        )
 
     sp_list = sub.add_parser("list-windows", help="List top-level window titles")
     add_common(sp_list)
@@ -100,8 +154,47 @@ def parse() -> tuple[str, Args]:
         help="Optional substring filter for email subject",
     )
 
+    sp_warm = sub.add_parser("warm-up", help="Snapshot a window (or one pane) and prime the element cache")
+    add_common(sp_warm)
+    sp_warm.add_argument("--window-name", required=True)
+    sp_warm.add_argument("--container-name", help="Name of the pane to snapshot instead of the whole window")
+    sp_warm.add_argument("--max-depth", type=int, help="Levels below the window/pane to walk (default 12)")
+
+    sp_fill = sub.add_parser("fill-form", help="Set form fields by label in one pass")
+    add_common(sp_fill)
+    sp_fill.add_argument("--window-name", required=True)
+    sp_fill.add_argument("--container-name", help="Name of the pane holding the fields")
+    sp_fill.add_argument("--fields-file", help='JSON object of label -> value, e.g. {"Business Name": "Acme LLC"}')
+    sp_fill.add_argument(
+        "--field",
+        action="append",
+        default=[],
+        metavar="LABEL=VALUE",
+        help="A field to set (repeatable; applied after --fields-file)",
+    )
+
+    sp_clear = sub.add_parser("clear-cache", help="Empty the element cache (agent)")
+    add_common(sp_clear)
+
+    sp_batch = sub.add_parser("batch", help="Run an ordered list of actions in one scheduled run")
+    add_common(sp_batch)
+    sp_batch.add_argument(
+        "--actions-file",
+        required=True,
+        help='JSON list of steps, e.g. [{"action": "sendKeysToWindow", "windowName": "Notepad", "keys": "Hi"}]',
+    )
+    sp_batch.add_argument(
+        "--continue-on-error",
+        action="store_true",
+        help="Run the remaining steps after a failing one (default: stop at the first error)",
+    )
+
     ns = p.parse_args()
 
+    fleet = fleet_hosts(ns.hosts, ns.inventory)
+    if not ns.host and not fleet:
+        p.error("one of --host, --hosts or --inventory is required (or set WINRM_HOST)")
+
     password = ns.password or getpass("WinRM password: ")
 
     # For UIA we normally need the scheduled task to run as an interactive user.
@@ -112,11 +205,19 @@ def parse() -> tuple[str, Args]:
         action = "listTopWindows"
     elif ns.cmd == "send-keys":
         action = "sendKeysToWindow"
+    elif ns.cmd == "warm-up":
+        action = "warmUp"
+    elif ns.cmd == "clear-cache":
+        action = "clearCache"
+    elif ns.cmd == "fill-form":
+        action = "fillForm"
+    elif ns.cmd == "batch":
+        action = "batch"
     else:
         action = "openOutlookEmail"
 
     args = Args(
-        host=ns.host,
+        host=ns.host or "",
         username=ns.username,
         password=password,
         run_as_user=run_as_user,
@@ -129,13 +230,25 @@ def parse() -> tuple[str, Args]:
         transport=ns.transport,
         port=ns.port,
         use_ssl=bool(ns.use_ssl),
+        reuse_shell=bool(ns.reuse_shell),
+        use_agent=bool(ns.agent),
+        actions=load_actions(ns.actions_file) if ns.cmd == "batch" else None,
+        stop_on_error=not getattr(ns, "continue_on_error", False),
+        container_name=getattr(ns, "container_name", None),
+        max_depth=getattr(ns, "max_depth", None),
+        fields=form_fields(p, ns) if ns.cmd == "fill-form" else None,
     )
 
-    return ns.cmd, args
+    return ns.cmd, args, fleet, ns.concurrency
 
 
 def main() -> None:
-    _, args = parse()
+    _, args, fleet, concurrency = parse()
+    if fleet:
+        from job_runner import run_fleet
+
+        summary = run_fleet(args, fleet, concurrency=concurrency)
+        raise SystemExit(1 if summary["failed"] else 0)
     print(run_action(args))
 
 
@@ -0,0 +1,152 @@
+<#
+Resident UIA agent for the interactive desktop session.
+
+Started once through a scheduled task (see `winrm_client.py --agent`), then
+keeps running and serves jobs from a spool directory. The UIAutomation
+assemblies and the functions of `uia_run.ps1` (plus helper scripts such as
+`uia_cache.ps1` and `select_dd.ps1`) stay loaded, so a job costs neither a
+scheduled task nor a cold PowerShell start, and elements resolved by one job
+are reused by the next (see uia_cache.ps1).
+
+Spool layout (under -SpoolPath):
+  staged\<id>.json uploaded by the client, not yet queued
+  in\<id>.json     job queued by the client (renamed from staged\ once this agent is up)
+  work\<id>.json   job being processed
+  out\<id>.json    result (same shape as uia_run.ps1 output)
+  agent.json       heartbeat: pid, version, started, jobs, lastSeen
+
+Stop it with `schtasks /End /TN WinRM-UIA-Agent` or by killing the pid in
+agent.json; the client starts a new one on the next job.
+#>
+
+[CmdletBinding()]
+param(
+  [Parameter(Mandatory = $true)]
+  [string]$SpoolPath,
+
+  # Scripts whose top-level functions are loaded (uia_run.ps1 first).
+  [Parameter(Mandatory = $true)]
+  [string[]]$ScriptPaths,
+
+  # Identifies the uploaded script set; the client restarts the agent when it differs.
+  [string]$Version = '',
+
+  [int]$TimeoutSeconds = 15
+)
+
+$ErrorActionPreference = 'Stop'
+
+Add-Type -AssemblyName UIAutomationClient | Out-Null
+Add-Type -AssemblyName UIAutomationTypes  | Out-Null
+Add-Type -AssemblyName System.Windows.Forms | Out-Null
+
+function Import-ScriptFunctions {
+  param([Parameter(Mandatory=$true)][string]$Path)
+
+  # Only take function definitions and Add-Type preambles: the scripts' main
+  # blocks run their own action and must not execute inside the agent.
+  $errors = $null
+  $ast = [System.Management.Automation.Language.Parser]::ParseFile($Path, [ref]$null, [ref]$errors)
+  if ($errors -and $errors.Count -gt 0) { throw "Parse error in ${Path}: $($errors[0].Message)" }
+
+  $names = @()
+  foreach ($stmt in $ast.EndBlock.Statements) {
+    if ($stmt -is [System.Management.Automation.Language.FunctionDefinitionAst]) {
+      Set-Item -Path "function:global:$($stmt.Name)" -Value $stmt.Body.GetScriptBlock()
+      $names += $stmt.Name
+    } elseif ($stmt.Extent.Text -match '\bAdd-Type\b') {
+      & ([scriptblock]::Create($stmt.Extent.Text)) | Out-Null
+    }
+  }
+  return $names
+}
+
+function Write-FileAtomic {
+  param(
+    [Parameter(Mandatory=$true)][string]$Path,
+    [Parameter(Mandatory=$true)][string]$Text
+  )
+  $tmp = "$Path.tmp"
+  Set-Content -LiteralPath $tmp -Value $Text -Encoding UTF8
+  Move-Item -LiteralPath $tmp -Destination $Path -Force
+}
+
+$inDir = Join-Path $SpoolPath 'in'
+$workDir = Join-Path $SpoolPath 'work'
+$outDir = Join-Path $SpoolPath 'out'
+$heartbeatPath = Join-Path $SpoolPath 'agent.json'
+foreach ($d in @($inDir, $workDir, $outDir)) {
+  New-Item -ItemType Directory -Force -Path $d | Out-Null
+}
+
+$functions = @()
+foreach ($p in $ScriptPaths) {
+  if (Test-Path -LiteralPath $p) { $functions += Import-ScriptFunctions -Path $p }
+}
+if (-not (Get-Command Invoke-UiaAction -ErrorAction SilentlyContinue)) {
+  throw "Invoke-UiaAction not found in: $($ScriptPaths -join ', ')"
+}
+
+$started = Get-Date
+$jobs = 0
+
+function Write-Heartbeat {
+  $hb = @{
+    pid = $PID
+    version = $Version
+    started = $started.ToString('o')
+    lastSeen = (Get-Date).ToString('o')
+    jobs = $jobs
+    functions = $functions.Count
+  }
+  Write-FileAtomic -Path $heartbeatPath -Text ($hb | ConvertTo-Json -Compress)
+}
+
+# Jobs interrupted by a previous agent go back to the queue.
+Get-ChildItem -LiteralPath $workDir -Filter '*.json' -ErrorAction SilentlyContinue |
+  ForEach-Object { Move-Item -LiteralPath $_.FullName -Destination (Join-Path $inDir $_.Name) -Force }
+
+Write-Heartbeat
+
+$watcher = New-Object IO.FileSystemWatcher($inDir, '*.json')
+$watcher.NotifyFilter = [IO.NotifyFilters]'FileName'
+$lastBeat = Get-Date
+
+while ($true) {
+  $pending = @(Get-ChildItem -LiteralPath $inDir -Filter '*.json' | Sort-Object LastWriteTimeUtc, Name)
+
+  foreach ($job in $pending) {
+    $workPath = Join-Path $workDir $job.Name
+    try {
+      Move-Item -LiteralPath $job.FullName -Destination $workPath -Force
+    } catch {
+      continue
+    }
+
+    $id = [IO.Path]::GetFileNameWithoutExtension($job.Name)
+    try {
+      $request = Get-Content -LiteralPath $workPath -Raw -Encoding UTF8 | ConvertFrom-Json
+      if (-not $request.action) { throw "Job must include 'action'" }
+      $result = Invoke-UiaAction -Request $request -TimeoutSeconds $TimeoutSeconds
+    } catch {
+      $result = @{ ok = $false; action = $null; error = $_.Exception.Message; data = $null }
+    }
+
+    Write-FileAtomic -Path (Join-Path $outDir "$id.json") -Text ($result | ConvertTo-Json -Depth 8)
+    Remove-Item -LiteralPath $workPath -Force -ErrorAction SilentlyContinue
+    $jobs++
+  }
+
+  if ($pending.Count -gt 0 -or ((Get-Date) - $lastBeat).TotalSeconds -ge 30) {
+    Write-Heartbeat
+    $lastBeat = Get-Date
+    # Results nobody collected (client gave up or went away).
+    Get-ChildItem -LiteralPath $outDir -File -ErrorAction SilentlyContinue |
+      Where-Object { $_.LastWriteTime -lt (Get-Date).AddHours(-1) } |
+      Remove-Item -Force -ErrorAction SilentlyContinue
+  }
+
+  # Wake on the rename that publishes a job; the cap keeps the heartbeat fresh
+  # and covers a job published between the scan above and this wait.
+  [void]$watcher.WaitForChanged([IO.WatcherChangeTypes]'Created, Renamed', 1000)
+}
@@ -19,6 +19,33 @@ Example input JSON:
   "windowName": "Notepad",
   "keys": "Hello{ENTER}"
 }
+
+Several steps in one run (per-step results in data.steps):
+{
+  "action": "batch",
+  "stopOnError": true,
+  "actions": [
+    { "action": "sendKeysToWindow", "windowName": "Notepad", "keys": "Hello" },
+    { "action": "listTopWindows" }
+  ]
+}
+
+Prime the element cache for a form before filling it (data: the snapshot's
+nodes plus cache stats); clearCache empties it:
+{
+  "action": "warmUp",
+  "windowName": "Insurance Management System",
+  "containerName": "Insured Information",
+  "maxDepth": 12
+}
+
+Fill a form by label (per-field results in data.fields):
+{
+  "action": "fillForm",
+  "windowName": "Insurance Management System",
+  "containerName": "Insured Information",
+  "fields": { "Business Name": "Acme Insurance Holdings LLC", "Tax ID": "98-7654321" }
+}
 #>
 
 [CmdletBinding()]
@@ -38,6 +65,12 @@ Add-Type -AssemblyName UIAutomationClient | Out-Null
 Add-Type -AssemblyName UIAutomationTypes  | Out-Null
 Add-Type -AssemblyName System.Windows.Forms | Out-Null
 
+# Cached element lookup (Find-TopLevelWindowByName, Get-UiaSnapshot, ...). It
+# sits next to this script on the remote host and in ..\functions in the repo.
+$uiaCachePath = Join-Path $PSScriptRoot 'uia_cache.ps1'
+if (-not (Test-Path -LiteralPath $uiaCachePath)) { $uiaCachePath = Join-Path $PSScriptRoot '..\functions\uia_cache.ps1' }
+. $uiaCachePath
+
 function Write-ResultJson {
   param(
     [Parameter(Mandatory=$true)][hashtable]$Obj,
@@ -47,38 +80,7 @@ function Write-ResultJson {
   if ($dir -and -not (Test-Path $dir)) {
     New-Item -ItemType Directory -Path $dir -Force | Out-Null
   }
-  ($Obj | ConvertTo-Json -Depth 6) | Set-Content -LiteralPath $Path -Encoding UTF8
-}
-
-function Find-TopLevelWindowByName {
-  param(
-    [Parameter(Mandatory=$true)][string]$Name,
-    [int]$TimeoutSeconds = 10
-  )
-
-  $deadline = (Get-Date).AddSeconds($TimeoutSeconds)
-  $root = [System.Windows.Automation.AutomationElement]::RootElement
-  $cond = New-Object System.Windows.Automation.PropertyCondition(
-    [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
-    [System.Windows.Automation.ControlType]::Window
-  )
-
-  while ((Get-Date) -lt $deadline) {
-    $windows = $root.FindAll([System.Windows.Automation.TreeScope]::Children, $cond)
-    foreach ($w in $windows) {
-      try {
-        $n = $w.Current.Name
-        if ($n -and $n -like "*$Name*") {
-          return $w
-        }
-      } catch {
-        # Ignore transient UIA exceptions.
-      }
-    }
-    Start-Sleep -Milliseconds 250
-  }
-
-  return $null
+  ($Obj | ConvertTo-Json -Depth 8) | Set-Content -LiteralPath $Path -Encoding UTF8
 }
 
 function Focus-Window {
@@ -104,20 +106,189 @@ function Find-TopLevelWindowsByProcessId {
   )
 
   $root = [System.Windows.Automation.AutomationElement]::RootElement
-  $condWin = New-Object System.Windows.Automation.PropertyCondition(
-    [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
-    [System.Windows.Automation.ControlType]::Window
+  $cond = New-Object System.Windows.Automation.AndCondition(
+    (New-Object System.Windows.Automation.PropertyCondition(
+      [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
+      [System.Windows.Automation.ControlType]::Window
+    )),
+    (New-Object System.Windows.Automation.PropertyCondition(
+      [System.Windows.Automation.AutomationElement]::ProcessIdProperty,
+      $ProcessId
+    ))
   )
 
-  $windows = $root.FindAll([System.Windows.Automation.TreeScope]::Children, $condWin)
-  $matches = @()
-  foreach ($w in $windows) {
+  # UIA filters by process in the provider instead of one read per window.
+  $windows = Find-UiaAll -Element $root -Scope Children -Condition $cond
+  return @($windows)
+}
+
+function ConvertTo-SendKeysText {
+  param([Parameter(Mandatory=$true)][AllowEmptyString()][string]$Text)
+  # + ^ % ~ ( ) { } [ ] are SendKeys syntax; braced, they are typed as is.
+  return [regex]::Replace($Text, '[+^%~(){}\[\]]', '{$0}')
+}
+
+function Set-UiaEditValue {
+  param(
+    [Parameter(Mandatory=$true)]$Element,
+    [Parameter(Mandatory=$true)][AllowEmptyString()][string]$Value
+  )
+
+  # ValuePattern sets the text in one call, without focus or keystrokes. It
+  # is read back because some editors accept SetValue and ignore it.
+  $vp = $null
+  if ($Element.TryGetCurrentPattern([System.Windows.Automation.ValuePattern]::Pattern, [ref]$vp) -and -not $vp.Current.IsReadOnly) {
     try {
-      $pid = [int]$w.GetCurrentPropertyValue([System.Windows.Automation.AutomationElement]::ProcessIdProperty)
-      if ($pid -eq $ProcessId) { $matches += $w }
+      $vp.SetValue($Value)
+      if ($vp.Current.Value -eq $Value) { return 'value' }
+    } catch [System.Windows.Automation.ElementNotAvailableException] {
+      throw
     } catch {}
   }
-  return $matches
+
+  try { $Element.SetFocus() } catch [System.Windows.Automation.ElementNotAvailableException] { throw } catch {}
+  Start-Sleep -Milliseconds 50
+  [System.Windows.Forms.SendKeys]::SendWait('^a')
+  [System.Windows.Forms.SendKeys]::SendWait((ConvertTo-SendKeysText $Value))
+  return 'keys'
+}
+
+function Select-UiaComboValue {
+  param(
+    [Parameter(Mandatory=$true)]$Combo,
+    [Parameter(Mandatory=$true)][string]$Value
+  )
+
+  # Items come from the form index's subtree fetch when the combo exposes
+  # them closed; otherwise it is opened once to list them.
+  $items = @(Get-UiaCachedDescendants -Element $Combo -ControlType ([System.Windows.Automation.ControlType]::ListItem))
+  $item = $items | Where-Object { $_.Cached.Name -eq $Value } | Select-Object -First 1
+  $ec = $null
+  $expanded = $false
+  try {
+    if (-not $item -and $Combo.TryGetCurrentPattern([System.Windows.Automation.ExpandCollapsePattern]::Pattern, [ref]$ec)) {
+      try {
+        $ec.Expand()
+        $expanded = $true
+      } catch [System.Windows.Automation.ElementNotAvailableException] {
+        throw
+      } catch {}
+      $item = Find-UiaFirst -Element $Combo -Scope Descendants -Condition (New-Object System.Windows.Automation.AndCondition(
+        (New-Object System.Windows.Automation.PropertyCondition(
+          [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
+          [System.Windows.Automation.ControlType]::ListItem
+        )),
+        (New-Object System.Windows.Automation.PropertyCondition(
+          [System.Windows.Automation.AutomationElement]::NameProperty,
+          $Value
+        ))
+      ))
+    }
+
+    $sp = $null
+    if ($item -and $item.TryGetCurrentPattern([System.Windows.Automation.SelectionItemPattern]::Pattern, [ref]$sp)) {
+      $sp.Select()
+      return 'select'
+    }
+
+    $vp = $null
+    if ($Combo.TryGetCurrentPattern([System.Windows.Automation.ValuePattern]::Pattern, [ref]$vp) -and -not $vp.Current.IsReadOnly) {
+      $vp.SetValue($Value)
+      return 'value'
+    }
+  } finally {
+    if ($expanded) { try { $ec.Collapse() } catch {} }
+  }
+
+  # Keystrokes, as Select-IMSComboByValue does: the initial letter until the
+  # value comes up among the items starting with it.
+  $initialKey = $Value.Substring(0, 1)
+  $matching = @($items | Where-Object { $_.Cached.Name.StartsWith($initialKey, [StringComparison]::InvariantCultureIgnoreCase) })
+  $targetIndex = -1
+  for ($i = 0; $i -lt $matching.Count; $i++) {
+    if ($matching[$i].Cached.Name -eq $Value) {
+      $targetIndex = $i
+      break
+    }
+  }
+  if ($targetIndex -lt 0) { throw "Value '$Value' not offered by the combo box" }
+
+  try { $Combo.SetFocus() } catch [System.Windows.Automation.ElementNotAvailableException] { throw } catch {}
+  Start-Sleep -Milliseconds 100
+  [System.Windows.Forms.SendKeys]::SendWait('%{DOWN}')
+  Start-Sleep -Milliseconds 200
+  for ($k = 0; $k -le $targetIndex; $k++) {
+    [System.Windows.Forms.SendKeys]::SendWait((ConvertTo-SendKeysText $initialKey))
+    Start-Sleep -Milliseconds 80
+  }
+  [System.Windows.Forms.SendKeys]::SendWait('{ENTER}')
+  return 'keys'
+}
+
+function Invoke-UiaFormFill {
+  param(
+    [Parameter(Mandatory=$true)]$Container,
+    # label -> value (JSON object or hashtable), filled in order.
+    [Parameter(Mandatory=$true)]$Fields,
+    [bool]$StopOnError = $false
+  )
+
+  $pairs = @()
+  if ($Fields -is [System.Collections.IDictionary]) {
+    foreach ($k in $Fields.Keys) { $pairs += @{ label = [string]$k; value = $Fields[$k] } }
+  } else {
+    foreach ($prop in $Fields.PSObject.Properties) { $pairs += @{ label = $prop.Name; value = $prop.Value } }
+  }
+
+  $index = Get-UiaFormIndex -Container $Container
+  $formKey = (Get-UiaElementKey -Element $Container) + '|form'
+  $rebuilt = $false
+  $fieldResults = @()
+  $failed = 0
+  foreach ($pair in $pairs) {
+    $sw = [Diagnostics.Stopwatch]::StartNew()
+    $r = @{ label = $pair.label; ok = $false; controlType = $null; method = $null; error = $null }
+    while ($true) {
+      try {
+        $target = $index.labels[(Get-UiaFormLabelKey $pair.label)]
+        if (-not $target) { throw "Label '$($pair.label)' not found" }
+        $r.controlType = $target.type
+        $text = [string]$pair.value
+        if ($target.type -eq 'ComboBox') {
+          $r.method = Select-UiaComboValue -Combo $target.element -Value $text
+        } else {
+          $r.method = Set-UiaEditValue -Element $target.editor -Value $text
+        }
+        $r.ok = $true
+        $r.error = $null
+        break
+      } catch {
+        $r.error = $_.Exception.Message
+        # The form changed under a cached index: index it again, once per fill.
+        if (-not $rebuilt -and (Test-UiaElementGone -ErrorRecord $_)) {
+          $rebuilt = $true
+          Remove-UiaCachedElement -Key $formKey
+          $index = Get-UiaFormIndex -Container $Container
+          continue
+        }
+        break
+      }
+    }
+    $r.ms = [int]$sw.ElapsedMilliseconds
+    $fieldResults += $r
+    if (-not $r.ok) {
+      $failed++
+      if ($StopOnError) { break }
+    }
+  }
+
+  return @{
+    fields = $fieldResults
+    total = $pairs.Count
+    filled = @($fieldResults | Where-Object { $_.ok }).Count
+    failed = $failed
+    labels = $index.labels.Count
+  }
 }
 
 function Dismiss-OutlookModalDialogs {
@@ -351,48 +522,93 @@ function Open-OutlookEmailFromFolder {
   return @{ folder = $FolderPath; subject = [string]$mail.Subject }
 }
 
-try {
-  if (-not (Test-Path -LiteralPath $InputJsonPath)) {
-    throw "InputJsonPath not found: $InputJsonPath"
+function Invoke-UiaBatch {
+  param(
+    [Parameter(Mandatory=$true)]$Request,
+    [int]$TimeoutSeconds = 15
+  )
+
+  # Runs the steps in order in this process; by default the first failing
+  # step ends the batch (stopOnError = false runs the rest anyway).
+  $stopOnError = $true
+  if ($null -ne $Request.stopOnError) { $stopOnError = [bool]$Request.stopOnError }
+
+  $steps = @()
+  $failed = 0
+  $index = 0
+  foreach ($step in @($Request.actions)) {
+    $sw = [Diagnostics.Stopwatch]::StartNew()
+    try {
+      if (-not $step.action) { throw "Step $index has no 'action'" }
+      if ($step.action -eq 'batch') { throw "Nested batches are not supported" }
+      $r = Invoke-UiaAction -Request $step -TimeoutSeconds $TimeoutSeconds
+    } catch {
+      $r = @{ ok = $false; action = [string]$step.action; error = $_.Exception.Message; data = $null }
+    }
+    $r.index = $index
+    $r.ms = [int]$sw.ElapsedMilliseconds
+    $steps += $r
+    $index++
+    if (-not $r.ok) {
+      $failed++
+      if ($stopOnError) { break }
+    }
   }
 
-  $input = Get-Content -LiteralPath $InputJsonPath -Raw -Encoding UTF8 | ConvertFrom-Json
-  if (-not $input.action) {
-    throw "Input JSON must include 'action'"
+  $total = @($Request.actions).Count
+  $batchError = $null
+  if ($failed -gt 0) {
+    $first = $steps | Where-Object { -not $_.ok } | Select-Object -First 1
+    $batchError = "Step $($first.index) ($($first.action)) failed: $($first.error)"
+  }
+  return @{
+    ok = ($failed -eq 0 -and $steps.Count -eq $total)
+    action = 'batch'
+    error = $batchError
+    data = @{ steps = $steps; completed = $steps.Count; total = $total }
+  }
+}
+
+function Invoke-UiaAction {
+  param(
+    [Parameter(Mandatory=$true)]$Request,
+    [int]$TimeoutSeconds = 15
+  )
+
+  if ($Request.action -eq 'batch') {
+    return Invoke-UiaBatch -Request $Request -TimeoutSeconds $TimeoutSeconds
   }
 
   $result = @{
     ok = $false
-    action = [string]$input.action
+    action = [string]$Request.action
     error = $null
     data = $null
   }
 
-  switch ($input.action) {
+  switch ($Request.action) {
     'listTopWindows' {
       $root = [System.Windows.Automation.AutomationElement]::RootElement
       $cond = New-Object System.Windows.Automation.PropertyCondition(
         [System.Windows.Automation.AutomationElement]::ControlTypeProperty,
         [System.Windows.Automation.ControlType]::Window
       )
-      $windows = $root.FindAll([System.Windows.Automation.TreeScope]::Children, $cond)
+      $windows = Find-UiaAll -Element $root -Scope Children -Condition $cond
       $names = @()
       foreach ($w in $windows) {
-        try {
-          $n = $w.Current.Name
-          if ($n) { $names += $n }
-        } catch {}
+        $n = $w.Cached.Name
+        if ($n) { $names += $n }
       }
       $result.ok = $true
       $result.data = @{ windows = $names }
     }
 
     'sendKeysToWindow' {
-      $win = Find-TopLevelWindowByName -Name ([string]$input.windowName) -TimeoutSeconds $TimeoutSeconds
-      if (-not $win) { throw "Window not found: $($input.windowName)" }
+      $win = Find-TopLevelWindowByName -Name ([string]$Request.windowName) -TimeoutSeconds $TimeoutSeconds
+      if (-not $win) { throw "Window not found: $($Request.windowName)" }
       Focus-Window -Window $win
 
-      $keys = [string]$input.keys
+      $keys = [string]$Request.keys
       # SendKeys syntax uses {ENTER}, {TAB}, etc.
       [System.Windows.Forms.SendKeys]::SendWait($keys)
 
@@ -400,11 +616,68 @@ try {
       $result.data = @{ window = $win.Current.Name }
     }
 
+    'warmUp' {
+      # Fetch the window (or one pane of it) in one call and prime the element
+      # cache, so the steps that follow skip their tree walks.
+      $win = Find-TopLevelWindowByName -Name ([string]$Request.windowName) -TimeoutSeconds $TimeoutSeconds
+      if (-not $win) { throw "Window not found: $($Request.windowName)" }
+      $scope = $win
+      if ($Request.containerName) {
+        $scope = Find-UiaPane -Scope $win -Name ([string]$Request.containerName)
+        if (-not $scope) { throw "Container not found: $($Request.containerName)" }
+      }
+      $maxDepth = 12
+      if ($Request.maxDepth) { $maxDepth = [int]$Request.maxDepth }
+      $maxNodes = 2000
+      if ($Request.maxNodes) { $maxNodes = [int]$Request.maxNodes }
+
+      $pruned = Remove-UiaDeadElements
+      $snapshot = Get-UiaSnapshot -Element $scope -MaxDepth $maxDepth -MaxNodes $maxNodes
+      $snapshot.window = $win.Current.Name
+      $snapshot.pruned = $pruned
+      $snapshot.cache = Get-UiaElementCacheStats
+      $result.ok = $true
+      $result.data = $snapshot
+    }
+
+    'fillForm' {
+      # Fields by label from one index of the window or pane; ValuePattern and
+      # SelectionItemPattern first, keystrokes only where they do not take.
+      if (-not $Request.fields) { throw "fillForm needs 'fields' (label -> value)" }
+      $win = Find-TopLevelWindowByName -Name ([string]$Request.windowName) -TimeoutSeconds $TimeoutSeconds
+      if (-not $win) { throw "Window not found: $($Request.windowName)" }
+      $scope = $win
+      if ($Request.containerName) {
+        $scope = Find-UiaPane -Scope $win -Name ([string]$Request.containerName)
+        if (-not $scope) { throw "Container not found: $($Request.containerName)" }
+      }
+      $stopOnError = $false
+      if ($null -ne $Request.stopOnError) { $stopOnError = [bool]$Request.stopOnError }
+
+      # Keystroke fallbacks go to the foreground window.
+      Focus-Window -Window $win
+      $fill = Invoke-UiaFormFill -Container $scope -Fields $Request.fields -StopOnError $stopOnError
+      $fill.window = $win.Current.Name
+      $fill.cache = Get-UiaElementCacheStats
+      $result.ok = ($fill.failed -eq 0 -and $fill.filled -eq $fill.total)
+      if (-not $result.ok) {
+        $first = $fill.fields | Where-Object { -not $_.ok } | Select-Object -First 1
+        $result.error = "$($fill.total - $fill.filled) of $($fill.total) field(s) not filled; '$($first.label)': $($first.error)"
+      }
+      $result.data = $fill
+    }
+
+    'clearCache' {
+      $removed = Clear-UiaElementCache
+      $result.ok = $true
+      $result.data = @{ removed = $removed; cache = Get-UiaElementCacheStats }
+    }
+
     'openOutlookEmail' {
-      $folderPath = [string]$input.folderPath
+      $folderPath = [string]$Request.folderPath
       if (-not $folderPath) { $folderPath = 'Inbox\\RPA' }
       $subjectContains = $null
-      if ($input.subjectContains) { $subjectContains = [string]$input.subjectContains }
+      if ($Request.subjectContains) { $subjectContains = [string]$Request.subjectContains }
 
       $data = Open-OutlookEmailFromFolder -FolderPath $folderPath -SubjectContains $subjectContains
       $result.ok = $true
@@ -412,10 +685,25 @@ try {
     }
 
     default {
-      throw "Unsupported action: $($input.action)"
+      throw "Unsupported action: $($Request.action)"
     }
   }
 
+  return $result
+}
+
+try {
+  if (-not (Test-Path -LiteralPath $InputJsonPath)) {
+    throw "InputJsonPath not found: $InputJsonPath"
+  }
+
+  $input = Get-Content -LiteralPath $InputJsonPath -Raw -Encoding UTF8 | ConvertFrom-Json
+  if (-not $input.action) {
+    throw "Input JSON must include 'action'"
+  }
+
+  $result = Invoke-UiaAction -Request $input -TimeoutSeconds $TimeoutSeconds
+
   Write-ResultJson -Obj $result -Path $OutputJsonPath
   exit 0
 } catch {
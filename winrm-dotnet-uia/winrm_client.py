@@ -26,9 +26,12 @@ from __future__ import annotations
 
 import argparse
 import base64
+import gzip
+import hashlib
 import json
 import sys
 import time
+import uuid
 from datetime import datetime
 from pathlib import Path
 from dataclasses import dataclass
@@ -51,6 +54,17 @@ class Args:
     transport: str
     port: int
     use_ssl: bool
+    reuse_shell: bool = False
+    use_agent: bool = False
+    job_id: str | None = None
+    # action="batch": ordered steps (uia_run.ps1 input objects) run in one process.
+    actions: list[dict] | None = None
+    stop_on_error: bool = True
+    # action="warmUp": pane to snapshot instead of the whole window, and how deep.
+    container_name: str | None = None
+    max_depth: int | None = None
+    # action="fillForm": label -> value, set in order.
+    fields: dict | None = None
 
 
 def parse_args() -> Args:
@@ -66,16 +80,31 @@ def parse_args() -> Args:
     p.add_argument(
         "--action",
         required=True,
-        choices=["listTopWindows", "sendKeysToWindow", "openOutlookEmail"],
+        choices=["listTopWindows", "sendKeysToWindow", "openOutlookEmail", "warmUp", "clearCache", "fillForm", "batch"],
     )
     p.add_argument("--window-name")
     p.add_argument("--keys")
     p.add_argument("--folder-path")
     p.add_argument("--subject-contains")
+    p.add_argument("--container-name", help="warmUp/fillForm: name of the pane to snapshot or fill")
+    p.add_argument("--fields-file", help='fillForm: JSON object of label -> value, e.g. {"Tax ID": "98-7654321"}')
+    p.add_argument("--max-depth", type=int, help="warmUp: how many levels below the window/pane to walk")
+    p.add_argument("--actions-file", help="JSON list of steps for --action batch")
+    p.add_argument("--continue-on-error", action="store_true", help="Run remaining batch steps after a failure")
 
     p.add_argument("--transport", default="ntlm", choices=["ntlm", "kerberos", "basic"]) 
     p.add_argument("--port", type=int, default=5985)
     p.add_argument("--use-ssl", action="store_true")
+    p.add_argument(
+        "--reuse-shell",
+        action="store_true",
+        help="Run all PowerShell calls in one warm remote shell instead of one shell per call",
+    )
+    p.add_argument(
+        "--agent",
+        action="store_true",
+        help="Queue the action to a resident agent in the desktop session instead of a one-shot scheduled task",
+    )
 
     ns = p.parse_args()
     return Args(
@@ -92,14 +121,98 @@ def parse_args() -> Args:
         transport=ns.transport,
         port=ns.port,
         use_ssl=bool(ns.use_ssl),
+        reuse_shell=bool(ns.reuse_shell),
+        use_agent=bool(ns.agent),
+        actions=load_actions(ns.actions_file) if ns.actions_file else None,
+        stop_on_error=not ns.continue_on_error,
+        container_name=ns.container_name,
+        max_depth=ns.max_depth,
+        fields=load_fields(ns.fields_file) if ns.fields_file else None,
     )
 
 
+def load_actions(path: str) -> list[dict]:
+    """Read a batch: a JSON list of step objects, each with an "action"."""
+    actions = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(actions, list) or not all(isinstance(a, dict) and a.get("action") for a in actions):
+        raise ValueError(f"{path} must contain a JSON list of objects with an 'action'")
+    return actions
+
+
+def load_fields(path: str) -> dict:
+    """Read form fields: a JSON object mapping labels to values."""
+    fields = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(fields, dict) or not all(isinstance(v, (str, int, float)) for v in fields.values()):
+        raise ValueError(f"{path} must contain a JSON object of label -> value")
+    return fields
+
+
 def ps_quote(s: str) -> str:
     # Single-quote and escape single quotes for PowerShell.
     return "'" + s.replace("'", "''") + "'"
 
 
+class ReusableShellSession(winrm.Session):
+    """`winrm.Session` that runs successive commands in one open remote shell.
+
+    Plain `Session.run_cmd` opens a shell, runs one command and deletes the
+    shell again. The chatty parts of `run_action` (chunked upload, output
+    polling, task setup) issue dozens of calls, so reusing the shell saves two
+    round trips per call. The shell is recycled after `max_commands` commands
+    or after any error; call `close()` when done.
+    """
+
+    def __init__(self, target: str, auth: tuple[str, str], *, max_commands: int = 100, **kwargs) -> None:
+        super().__init__(target, auth, **kwargs)
+        self.max_commands = max_commands
+        self._shell_id: str | None = None
+        self._commands = 0
+
+    def shell(self) -> str:
+        """The warm shell id, opening a shell if needed (for raw protocol use)."""
+        if self._shell_id is None:
+            self._shell_id = self.protocol.open_shell()
+            self._commands = 0
+        return self._shell_id
+
+    def run_cmd(self, command, args=()):
+        fresh = self._shell_id is None
+        if fresh:
+            self._shell_id = self.protocol.open_shell()
+            self._commands = 0
+        try:
+            command_id = self.protocol.run_command(self._shell_id, command, args)
+        except Exception:
+            self.close_shell()
+            if fresh:
+                raise
+            # Warm shell expired server-side; nothing ran, so retry once.
+            return self.run_cmd(command, args)
+        try:
+            rs = winrm.Response(self.protocol.get_command_output(self._shell_id, command_id))
+            self.protocol.cleanup_command(self._shell_id, command_id)
+        except Exception:
+            self.close_shell()
+            raise
+        self._commands += 1
+        if self._commands >= self.max_commands:
+            self.close_shell()
+        return rs
+
+    def close_shell(self) -> None:
+        shell_id, self._shell_id = self._shell_id, None
+        if shell_id is None:
+            return
+        try:
+            self.protocol.close_shell(shell_id, close_session=False)
+        except Exception:
+            pass
+
+    def close(self) -> None:
+        self.close_shell()
+        self.protocol.transport.close_session()
+
+
 def run_ps(session: winrm.Session, script: str) -> str:
     r = session.run_ps(script)
     if r.status_code != 0:
@@ -113,42 +226,468 @@ def tlog(message: str) -> None:
     print(f"[{ts}] {message}", file=sys.stderr, flush=True)
 
 
+# pywinrm sends MaxEnvelopeSize 153600 and base64-encodes stdin inside the
+# SOAP body, so one Send carries at most ~110 KB of stdin. Each stdin line is
+# itself base64 of the payload, hence the second 3/4 factor. Chunks stay
+# multiples of 3 so every line decodes on its own.
+MAX_ENVELOPE_BYTES = 153600
+MAX_UPLOAD_CHUNK = (MAX_ENVELOPE_BYTES - 8192) * 3 // 4 * 3 // 4 // 3 * 3
+MIN_UPLOAD_CHUNK = 12 * 1024
+
+
+@dataclass
+class TransferStats:
+    size: int
+    wire_bytes: int
+    chunks: int
+    seconds: float
+    sha256: str
+    compressed: bool = False
+    skipped: bool = False
+
+    @property
+    def mb_per_s(self) -> float:
+        return self.size / 1e6 / self.seconds if self.seconds else 0.0
+
+
+# Receives base64 lines on stdin into <path>.part, optionally gunzips, checks
+# the SHA-256 of the result and only then replaces the target.
+UPLOAD_RECEIVER_PS = r"""
+$ErrorActionPreference = 'Stop'
+$p = {path}
+$expected = {sha}
+# Per-transfer temp names so concurrent uploads of the same file don't collide.
+$tmp = "$p." + [guid]::NewGuid().ToString('N')
+$part = "$tmp.part"
+New-Item -ItemType Directory -Force -Path (Split-Path -Parent $p) | Out-Null
+$fs = [IO.File]::Open($part, [IO.FileMode]::Create, [IO.FileAccess]::Write, [IO.FileShare]::None)
+try {{
+  $stdin = [Console]::In
+  while ($null -ne ($line = $stdin.ReadLine())) {{
+    if ($line.Length -eq 0) {{ continue }}
+    $b = [Convert]::FromBase64String($line)
+    $fs.Write($b, 0, $b.Length)
+  }}
+}} finally {{
+  $fs.Dispose()
+}}
+if ({gzip}) {{
+  $src = [IO.File]::OpenRead($part)
+  $dst = [IO.File]::Create("$tmp.new")
+  try {{
+    $gz = New-Object IO.Compression.GZipStream($src, [IO.Compression.CompressionMode]::Decompress)
+    $gz.CopyTo($dst)
+  }} finally {{
+    $dst.Dispose(); $src.Dispose()
+  }}
+  Remove-Item -LiteralPath $part -Force
+}} else {{
+  Move-Item -LiteralPath $part -Destination "$tmp.new" -Force
+}}
+$hash = (Get-FileHash -LiteralPath "$tmp.new" -Algorithm SHA256).Hash
+if ($hash -ne $expected) {{
+  Remove-Item -LiteralPath "$tmp.new" -Force
+  [Console]::Error.Write("SHA-256 mismatch for ${{p}}: got $hash, expected $expected")
+  exit 5
+}}
+Move-Item -LiteralPath "$tmp.new" -Destination $p -Force
+$hash
+"""
+
+
 def upload_bytes_b64_chunked(
     session: winrm.Session,
     remote_path: str,
     data: bytes,
     *,
-    chunk_size: int = 2000,
-) -> None:
-    """Upload bytes to a remote path using multiple small PowerShell calls.
+    chunk_size: int | None = None,
+    compress: bool = True,
+    skip_if_same: bool = True,
+    target_seconds: float = 0.5,
+) -> TransferStats:
+    """Upload bytes to a remote path, streamed on stdin of one remote command.
+
+    The payload is gzipped when that helps, then sent as base64 lines with
+    `send_command_input` into a single receiver process in one shell (the
+    warm shell of a `ReusableShellSession`), so the remote side decodes and
+    writes while the next chunk is in flight. Chunks start small and double
+    while a send stays under `target_seconds`, up to the envelope limit;
+    pass `chunk_size` to pin them. The receiver verifies the SHA-256 of the
+    decompressed file before replacing `remote_path`.
+
+    With `skip_if_same`, a remote file that already has the same SHA-256 is
+    left alone (one round trip).
+    """
+    start = time.perf_counter()
+    digest = hashlib.sha256(data).hexdigest().upper()
+
+    if skip_if_same:
+        existing = run_ps(
+            session,
+            f"$p={ps_quote(remote_path)}; "
+            "if (Test-Path -LiteralPath $p) { (Get-FileHash -LiteralPath $p -Algorithm SHA256).Hash }",
+        ).strip()
+        if existing == digest:
+            tlog(f"Upload skipped, {remote_path} is up to date")
+            return TransferStats(len(data), 0, 0, time.perf_counter() - start, digest, skipped=True)
+
+    payload = data
+    compressed = False
+    if compress and data:
+        packed = gzip.compress(data, compresslevel=6, mtime=0)
+        if len(packed) < len(data) * 0.9:
+            payload, compressed = packed, True
+
+    tlog(f"Uploading to {remote_path} ({len(data)} bytes, {len(payload)} on the wire{', gzip' if compressed else ''})")
+
+    receiver = UPLOAD_RECEIVER_PS.format(
+        path=ps_quote(remote_path),
+        sha=ps_quote(digest),
+        gzip="$true" if compressed else "$false",
+    )
+    command = "powershell -NoProfile -NonInteractive -encodedcommand " + base64.b64encode(
+        receiver.encode("utf_16_le")
+    ).decode("ascii")
+
+    protocol = session.protocol
+    reusable = isinstance(session, ReusableShellSession)
+    shell_id = session.shell() if reusable else protocol.open_shell()
+    chunk = chunk_size or MIN_UPLOAD_CHUNK
+    chunk = max(3, min(chunk, MAX_UPLOAD_CHUNK) // 3 * 3)
+    chunks = 0
+    wire = 0
+    try:
+        command_id = protocol.run_command(shell_id, command)
+        offset = 0
+        while True:
+            piece = payload[offset : offset + chunk]
+            offset += len(piece)
+            last = offset >= len(payload)
+            line = base64.b64encode(piece) + b"\r\n"
+            t0 = time.perf_counter()
+            protocol.send_command_input(shell_id, command_id, line, end=last)
+            elapsed = time.perf_counter() - t0
+            chunks += 1
+            wire += len(line)
+            if last:
+                break
+            if chunk_size is None:
+                if elapsed < target_seconds / 2:
+                    chunk = min(chunk * 2, MAX_UPLOAD_CHUNK)
+                elif elapsed > target_seconds * 2:
+                    chunk = max(chunk // 2 // 3 * 3, MIN_UPLOAD_CHUNK)
+        stdout, stderr, status = protocol.get_command_output(shell_id, command_id)
+        protocol.cleanup_command(shell_id, command_id)
+    except Exception:
+        if reusable:
+            session.close_shell()
+        raise
+    finally:
+        if not reusable:
+            protocol.close_shell(shell_id, close_session=False)
+
+    if status != 0:
+        raise RuntimeError(f"Upload to {remote_path} failed ({status}): {stderr.decode(errors='ignore')}")
+    remote_digest = stdout.decode(errors="ignore").strip()
+    if remote_digest != digest:
+        raise RuntimeError(f"Upload to {remote_path}: remote SHA-256 {remote_digest!r} != {digest}")
+
+    stats = TransferStats(len(data), wire, chunks, time.perf_counter() - start, digest, compressed)
+    tlog(f"Uploaded {remote_path}: {chunks} chunks in {stats.seconds:.2f}s ({stats.mb_per_s:.2f} MB/s)")
+    return stats
+
+
+# Blocks on the remote host until a file is complete, or until the timeout.
+# A FileSystemWatcher wakes as soon as the writer creates/renames/closes the
+# file, and a file its writer still holds open counts as not there yet.
+WAIT_FILE_PS = r"""
+function Wait-CompleteFile {
+  param([string]$Path, [int]$TimeoutMs)
+  $deadline = [DateTime]::UtcNow.AddMilliseconds($TimeoutMs)
+  $dir = Split-Path -Parent $Path
+  New-Item -ItemType Directory -Force -Path $dir | Out-Null
+  $watcher = New-Object IO.FileSystemWatcher($dir, (Split-Path -Leaf $Path))
+  $watcher.NotifyFilter = [IO.NotifyFilters]'FileName, LastWrite, Size'
+  try {
+    while ($true) {
+      if ([IO.File]::Exists($Path)) {
+        try {
+          $fs = [IO.File]::Open($Path, [IO.FileMode]::Open, [IO.FileAccess]::Read, [IO.FileShare]::Read)
+          try { $text = (New-Object IO.StreamReader($fs, [Text.Encoding]::UTF8, $true)).ReadToEnd() } finally { $fs.Dispose() }
+          if ($text.Trim()) { return $text }
+        } catch [IO.IOException] {}
+      }
+      $left = ($deadline - [DateTime]::UtcNow).TotalMilliseconds
+      if ($left -le 0) { return $null }
+      [void]$watcher.WaitForChanged([IO.WatcherChangeTypes]::All, [int][Math]::Min($left, 500))
+    }
+  } finally {
+    $watcher.Dispose()
+  }
+}
+"""
 
-    This avoids WinRM/PowerShell command-line length limits that occur when
-    embedding large Base64 strings in a single `run_ps` call.
+
+def wait_for_output(session: winrm.Session, remote_path: str, timeout_s: float, *, slice_s: float = 60.0) -> str:
+    """Block on the remote host until `remote_path` is written; "" on timeout.
+
+    Each call returns as soon as the file is complete, so a whole wait costs
+    one WinRM round trip per `slice_s` instead of one per poll tick.
     """
+    remaining = timeout_s
+    while remaining > 0:
+        wait_ms = int(min(remaining, slice_s) * 1000)
+        script = (
+            "$ErrorActionPreference = 'Stop'\n"
+            "[Console]::OutputEncoding = New-Object System.Text.UTF8Encoding($false)\n"
+            + WAIT_FILE_PS
+            + f"$text = Wait-CompleteFile -Path {ps_quote(remote_path)} -TimeoutMs {wait_ms}\n"
+            "if ($text) { [Console]::Out.Write($text) }\n"
+        )
+        out = run_ps(session, script).strip()
+        if out:
+            return out
+        remaining -= slice_s
+    return ""
+
+
+def build_payload(args: Args) -> dict:
+    """Input JSON for uia_run.ps1 / the agent."""
+    if args.action == "batch":
+        return {"action": "batch", "actions": args.actions or [], "stopOnError": args.stop_on_error}
+    payload = {"action": args.action}
+    if args.window_name:
+        payload["windowName"] = args.window_name
+    if args.keys:
+        payload["keys"] = args.keys
+    if args.folder_path:
+        payload["folderPath"] = args.folder_path
+    if args.subject_contains:
+        payload["subjectContains"] = args.subject_contains
+    if args.container_name:
+        payload["containerName"] = args.container_name
+    if args.max_depth:
+        payload["maxDepth"] = args.max_depth
+    if args.fields:
+        payload["fields"] = args.fields
+    return payload
+
+
+def _step_timeout(action: str) -> int:
+    # Outlook startup / profile initialization can easily exceed 30 seconds.
+    if action == "openOutlookEmail":
+        return 180
+    # A snapshot of a large form is one big cross-process fetch.
+    if action in ("warmUp", "fillForm"):
+        return 60
+    return 30
+
+
+def action_timeout(args: Args) -> int:
+    if args.action == "batch":
+        return sum(_step_timeout(str(step.get("action"))) for step in args.actions or []) or 30
+    return _step_timeout(args.action)
+
+
+# Resident agent (uia_agent.ps1): started once via a scheduled task, then
+# serves jobs from a spool directory in the desktop session.
+AGENT_TASK_NAME = "WinRM-UIA-Agent"
+AGENT_BASE = r"C:\Windows\Temp\winrm-uia\agent"
+AGENT_SPOOL = AGENT_BASE + r"\spool"
+EXIT_AGENT_DOWN = 10
+# Held by the start script, so two clients that both find no agent start one.
+AGENT_START_MUTEX = r"Global\WinRM-UIA-Agent-Start"
+
+# The heartbeat in agent.json, or $null when its pid is not a live agent.
+LIVE_AGENT_PS = r"""
+function Get-LiveAgent {
+  param([string]$HbPath)
+  try {
+    $hb = Get-Content -LiteralPath $HbPath -Raw -Encoding UTF8 -ErrorAction Stop | ConvertFrom-Json
+    if (Get-Process -Id $hb.pid -ErrorAction SilentlyContinue | Where-Object { $_.ProcessName -eq 'powershell' }) { return $hb }
+  } catch {}
+  return $null
+}
+"""
+# Element lookup and cache shared by uia_run.ps1 and select_dd.ps1.
+UIA_CACHE_PS = Path(__file__).resolve().parent.parent / "functions" / "uia_cache.ps1"
+
 
-    b64 = base64.b64encode(data).decode("ascii")
+def agent_files() -> list[tuple[str, bytes]]:
+    """(remote file name, contents) of the scripts the agent keeps loaded."""
+    here = Path(__file__).resolve().parent
+    files = [
+        ("uia_run.ps1", here / "uia_run.ps1"),
+        ("uia_cache.ps1", UIA_CACHE_PS),
+        ("uia_agent.ps1", here / "uia_agent.ps1"),
+    ]
+    helper = here.parent / "functions" / "select_dd.ps1"
+    if helper.exists():
+        files.append(("select_dd.ps1", helper))
+    return [(name, path.read_bytes()) for name, path in files]
+
+
+def agent_version(files: list[tuple[str, bytes]]) -> str:
+    h = hashlib.sha256()
+    for name, data in files:
+        h.update(name.encode("utf-8") + b"\0" + data)
+    return h.hexdigest()[:16]
+
+
+def start_agent(args: Args, session: winrm.Session, files: list[tuple[str, bytes]], version: str) -> None:
+    """Upload the agent scripts, (re)start the agent task and wait for its heartbeat.
+
+    Does nothing when an agent with this version is already up: another
+    client may have started it since this one found none.
+    """
+    hb_path = AGENT_SPOOL + r"\agent.json"
+    check = LIVE_AGENT_PS + f"$hb = Get-LiveAgent {ps_quote(hb_path)}\nif ($hb -and $hb.version -eq {ps_quote(version)}) {{ 'up' }}\n"
+    if run_ps(session, check).strip() == "up":
+        tlog(f"UIA agent {version} is already running")
+        return
+
+    script_paths = ", ".join(ps_quote(f"{AGENT_BASE}\\{name}") for name, _ in files if name != "uia_agent.ps1")
+    runner_path = AGENT_BASE + r"\start_agent.ps1"
+    log_path = AGENT_BASE + r"\agent.log"
+    agent_path = AGENT_BASE + r"\uia_agent.ps1"
+    runner_script = (
+        f"& {ps_quote(agent_path)} -SpoolPath {ps_quote(AGENT_SPOOL)} "
+        f"-ScriptPaths @({script_paths}) -Version {ps_quote(version)} *> {ps_quote(log_path)}\n"
+    )
+    # The runner goes up with the scripts, keeping the start command short.
+    for name, data in [*files, ("start_agent.ps1", runner_script.encode("utf-8-sig"))]:
+        upload_bytes_b64_chunked(session, f"{AGENT_BASE}\\{name}", data)
 
-    # Ensure parent dir exists and remove existing file.
-    tlog(f"Uploading to {remote_path} ({len(data)} bytes)")
+    tlog(f"Starting UIA agent {version}")
     run_ps(
         session,
-        f"$p={ps_quote(remote_path)}; "
-        "New-Item -ItemType Directory -Force -Path (Split-Path -Parent $p) | Out-Null; "
-        "if (Test-Path -LiteralPath $p) { Remove-Item -Force -LiteralPath $p }",
+        LIVE_AGENT_PS
+        + f"""
+$ErrorActionPreference = 'Stop'
+$spool = {ps_quote(AGENT_SPOOL)}
+$hbPath = Join-Path $spool 'agent.json'
+$taskName = {ps_quote(AGENT_TASK_NAME)}
+$runAsUser = {ps_quote(args.run_as_user)}
+$runAsPass = {ps_quote(args.run_as_password)}
+$runnerPath = {ps_quote(runner_path)}
+$schtasks = Join-Path $env:WINDIR 'System32\\schtasks.exe'
+
+# One starter at a time (released when this script exits); a client that
+# waited here finds the agent the previous one started and leaves it alone.
+$mutex = New-Object Threading.Mutex($false, {ps_quote(AGENT_START_MUTEX)})
+try {{ [void]$mutex.WaitOne(60000) }} catch [Threading.AbandonedMutexException] {{}}
+
+$old = Get-LiveAgent $hbPath
+if ($old -and $old.version -eq {ps_quote(version)}) {{ exit 0 }}
+# Replace an agent running an older script set.
+if ($old) {{ Stop-Process -Id $old.pid -Force -ErrorAction SilentlyContinue }}
+Remove-Item -LiteralPath $hbPath -Force -ErrorAction SilentlyContinue
+
+New-Item -ItemType Directory -Force -Path $spool | Out-Null
+# Jobs whose client gave up before an agent came up.
+Get-ChildItem -LiteralPath (Join-Path $spool 'staged') -Filter '*.json' -ErrorAction SilentlyContinue |
+  Where-Object {{ $_.LastWriteTime -lt (Get-Date).AddHours(-{STALE_JOB_HOURS}) }} |
+  Remove-Item -Force -ErrorAction SilentlyContinue
+
+$psExe = Join-Path $env:WINDIR 'System32\\WindowsPowerShell\\v1.0\\powershell.exe'
+$tr = "$psExe -NoProfile -ExecutionPolicy Bypass -STA -WindowStyle Hidden -File $runnerPath"
+$sd = (Get-Date).ToString('MM/dd/yyyy')
+& $schtasks /Create /F /TN $taskName /SC ONCE /ST 00:00 /SD $sd /RL HIGHEST /RU $runAsUser /RP $runAsPass /IT /TR $tr | Out-Null
+& $schtasks /Run /TN $taskName | Out-Null
+
+# Wait here rather than polling over WinRM.
+$deadline = (Get-Date).AddSeconds(30)
+while ((Get-Date) -lt $deadline) {{
+  if (Test-Path -LiteralPath $hbPath) {{
+    try {{
+      $hb = Get-Content -LiteralPath $hbPath -Raw -Encoding UTF8 | ConvertFrom-Json
+      if ($hb.version -eq {ps_quote(version)}) {{ exit 0 }}
+    }} catch {{}}
+  }}
+  Start-Sleep -Milliseconds 200
+}}
+$log = ''
+if (Test-Path -LiteralPath {ps_quote(log_path)}) {{ $log = Get-Content -LiteralPath {ps_quote(log_path)} -Tail 50 | Out-String }}
+Write-Error "UIA agent did not start within 30s. $log"
+exit 4
+""",
     )
 
-    # Append chunks as bytes.
-    for i in range(0, len(b64), chunk_size):
-        chunk = b64[i : i + chunk_size]
-        run_ps(
-            session,
-            "$ErrorActionPreference='Stop'; "
-            f"$p={ps_quote(remote_path)}; "
-            f"$c={ps_quote(chunk)}; "
-            "$b=[Convert]::FromBase64String($c); "
-            "$fs=[IO.File]::Open($p,[IO.FileMode]::Append,[IO.FileAccess]::Write,[IO.FileShare]::Read); "
-            "$fs.Write($b,0,$b.Length); $fs.Close()",
-        )
+
+def stage_agent_job(session: winrm.Session, job_id: str, payload: dict) -> None:
+    """Upload the job JSON to staged\\<id>.json, where the agent does not look.
+
+    Streamed on stdin like the scripts: a fillForm over a whole screen or a
+    long batch does not fit on a command line (cmd.exe stops at 8191 chars).
+    """
+    data = json.dumps(payload).encode("utf-8")
+    upload_bytes_b64_chunked(session, f"{AGENT_SPOOL}\\staged\\{job_id}.json", data, skip_if_same=False)
+
+
+def submit_agent_job(session: winrm.Session, job_id: str, version: str, wait_s: float) -> str | None:
+    """Queue a staged job and wait up to `wait_s` for its result, in a single round trip.
+
+    Returns the result JSON, "" if it is not ready yet, or None when no agent
+    with this script version is running; the job then stays staged.
+    """
+    out_path = f"{AGENT_SPOOL}\\out\\{job_id}.json"
+    script = (
+        "$ErrorActionPreference = 'Stop'\n"
+        "[Console]::OutputEncoding = New-Object System.Text.UTF8Encoding($false)\n"
+        + WAIT_FILE_PS
+        + LIVE_AGENT_PS
+        + f"""
+$spool = {ps_quote(AGENT_SPOOL)}
+$hbPath = Join-Path $spool 'agent.json'
+$hb = Get-LiveAgent $hbPath
+if (-not $hb -or $hb.version -ne {ps_quote(version)}) {{ exit {EXIT_AGENT_DOWN} }}
+
+# Publish the staged job with a rename, only once an agent is there to run it.
+Move-Item -LiteralPath (Join-Path $spool 'staged\\{job_id}.json') -Destination (Join-Path $spool 'in\\{job_id}.json') -Force
+
+$outPath = {ps_quote(out_path)}
+$text = Wait-CompleteFile -Path $outPath -TimeoutMs {int(wait_s * 1000)}
+if ($text) {{
+  Remove-Item -LiteralPath $outPath -Force -ErrorAction SilentlyContinue
+  [Console]::Out.Write($text)
+}}
+"""
+    )
+    r = session.run_ps(script)
+    if r.status_code == EXIT_AGENT_DOWN:
+        return None
+    if r.status_code != 0:
+        raise RuntimeError(f"PowerShell failed ({r.status_code}): {r.std_err.decode(errors='ignore')}")
+    return r.std_out.decode(errors="ignore").strip()
+
+
+def _run_action_agent(args: Args, session: winrm.Session) -> str:
+    files = agent_files()
+    version = agent_version(files)
+    payload = build_payload(args)
+    wait_seconds = action_timeout(args)
+    first_wait = min(wait_seconds, 60)
+
+    job_id = args.job_id or uuid.uuid4().hex
+    stage_agent_job(session, job_id, payload)
+    out = submit_agent_job(session, job_id, version, first_wait)
+    if out is None:
+        tlog("UIA agent not running (or outdated); starting it")
+        start_agent(args, session, files, version)
+        out = submit_agent_job(session, job_id, version, first_wait)
+        if out is None:
+            raise RuntimeError("UIA agent is not reachable after start")
+
+    if not out and wait_seconds > first_wait:
+        out_path = f"{AGENT_SPOOL}\\out\\{job_id}.json"
+        out = wait_for_output(session, out_path, wait_seconds - first_wait)
+        if out:
+            run_ps(session, f"Remove-Item -LiteralPath {ps_quote(out_path)} -Force -ErrorAction SilentlyContinue")
+    if not out:
+        raise TimeoutError(f"Timed out waiting for agent job {job_id} after {wait_seconds}s")
+
+    tlog(f"Received agent result for job {job_id}")
+    return out
 
 
 def run_action(args: Args) -> str:
@@ -159,53 +698,75 @@ def run_action(args: Args) -> str:
     scheme = "https" if args.use_ssl else "http"
     endpoint = f"{scheme}://{args.host}:{args.port}/wsman"
 
-    session = winrm.Session(
+    session_cls = ReusableShellSession if args.reuse_shell else winrm.Session
+    session = session_cls(
         target=endpoint,
         auth=(args.username, args.password),
         transport=args.transport,
         server_cert_validation="ignore" if args.use_ssl else "validate",
     )
+    try:
+        if args.use_agent:
+            return _run_action_agent(args, session)
+        return _run_action(args, session)
+    finally:
+        if isinstance(session, ReusableShellSession):
+            session.close()
+
+
+# One-shot runs: every job gets its own folder and scheduled task, so
+# concurrent runs against one host don't overwrite each other. Folders of
+# jobs that died without cleaning up are removed after STALE_JOB_HOURS.
+UIA_BASE = r"C:\Windows\Temp\winrm-uia"
+JOB_TASK_PREFIX = "WinRM-UIA-Job-"
+STALE_JOB_HOURS = 6
+
 
+def _run_action(args: Args, session: winrm.Session) -> str:
     # Remote paths
     # Use single backslashes to avoid confusing PowerShell/schtasks quoting.
-    base = r"C:\Windows\Temp\winrm-uia"
+    job_id = args.job_id or uuid.uuid4().hex[:12]
+    base = UIA_BASE
+    jobs_dir = base + r"\jobs"
+    job_dir = f"{jobs_dir}\\{job_id}"
     ps_path = base + r"\uia_run.ps1"
-    runner_path = base + r"\run_task.ps1"
-    in_path = base + r"\input.json"
-    out_path = base + r"\output.json"
-    log_path = base + r"\task.log"
+    runner_path = job_dir + r"\run_task.ps1"
+    in_path = job_dir + r"\input.json"
+    out_path = job_dir + r"\output.json"
+    log_path = job_dir + r"\task.log"
 
     local_ps = Path(__file__).resolve().parent / "uia_run.ps1"
     ps_bytes = local_ps.read_bytes()
 
-    payload = {"action": args.action}
-    if args.window_name:
-        payload["windowName"] = args.window_name
-    if args.keys:
-        payload["keys"] = args.keys
-    if args.folder_path:
-        payload["folderPath"] = args.folder_path
-    if args.subject_contains:
-        payload["subjectContains"] = args.subject_contains
+    payload = build_payload(args)
 
-    task_name = "WinRM-UIA-OneShot"
+    task_name = JOB_TASK_PREFIX + job_id
+    tlog(f"Job {job_id}")
 
     # 1) Prepare files
-    # Upload the UIA runner script in small chunks to avoid command length limits.
+    # Shared by all jobs; skipped when the remote copy is already current.
     upload_bytes_b64_chunked(session, ps_path, ps_bytes)
+    upload_bytes_b64_chunked(session, base + r"\uia_cache.ps1", UIA_CACHE_PS.read_bytes())
 
-    # Input JSON is small; write it directly.
-    tlog(f"Writing input payload to {in_path}")
-    input_json = json.dumps(payload)
+    # Sweep stale job folders (and their tasks), then stream the input JSON
+    # on stdin: a fillForm or batch payload can outgrow the command line.
     run_ps(
         session,
-        "$ErrorActionPreference='Stop'; "
-        f"$base={ps_quote(base)}; "
-        "New-Item -ItemType Directory -Force -Path $base | Out-Null; "
-        f"Set-Content -LiteralPath {ps_quote(in_path)} -Value {ps_quote(input_json)} -Encoding UTF8; "
-        f"if (Test-Path -LiteralPath {ps_quote(out_path)}) {{ Remove-Item -Force -LiteralPath {ps_quote(out_path)} }}; "
-        f"if (Test-Path -LiteralPath {ps_quote(log_path)}) {{ Remove-Item -Force -LiteralPath {ps_quote(log_path)} }}",
+        f"""
+$ErrorActionPreference = 'Stop'
+$jobsDir = {ps_quote(jobs_dir)}
+$schtasks = Join-Path $env:WINDIR 'System32\\schtasks.exe'
+Get-ChildItem -LiteralPath $jobsDir -Directory -ErrorAction SilentlyContinue |
+  Where-Object {{ $_.LastWriteTime -lt (Get-Date).AddHours(-{STALE_JOB_HOURS}) }} |
+  ForEach-Object {{
+    try {{ & $schtasks /Delete /TN ({ps_quote(JOB_TASK_PREFIX)} + $_.Name) /F *> $null }} catch {{}}
+    Remove-Item -LiteralPath $_.FullName -Recurse -Force -ErrorAction SilentlyContinue
+  }}
+New-Item -ItemType Directory -Force -Path {ps_quote(job_dir)} | Out-Null
+""",
     )
+    tlog(f"Writing input payload to {in_path}")
+    upload_bytes_b64_chunked(session, in_path, json.dumps(payload).encode("utf-8"), skip_if_same=False)
 
     # Create a short wrapper script to keep schtasks /TR under 261 chars.
     tlog(f"Writing task wrapper to {runner_path}")
@@ -275,26 +836,17 @@ try {{ & $schtasks /Delete /TN $taskName /F *> $null }} catch {{}}
 
     # 3) Wait for output
     try:
-        # Outlook startup / profile initialization can easily exceed 30 seconds.
-        wait_seconds = 180 if args.action == "openOutlookEmail" else 30
-        deadline = time.time() + wait_seconds
-        while time.time() < deadline:
-            check = f"""
-if (Test-Path {ps_quote(out_path)}) {{
-  Get-Content -LiteralPath {ps_quote(out_path)} -Raw -Encoding UTF8
-}}
-"""
-            out = run_ps(session, check).strip()
-            if out:
-                tlog(f"Received output from {out_path}")
-                return out
-            time.sleep(0.25)
+        wait_seconds = action_timeout(args)
+        out = wait_for_output(session, out_path, wait_seconds)
+        if out:
+            tlog(f"Received output from {out_path}")
+            return out
 
         diag = run_ps(
             session,
             f"""
 $ErrorActionPreference = 'Continue'
-$base = {ps_quote(base)}
+$base = {ps_quote(job_dir)}
 $outPath = {ps_quote(out_path)}
 $logPath = {ps_quote(log_path)}
 $taskName = {ps_quote(task_name)}
@@ -308,8 +860,8 @@ if (Test-Path -LiteralPath $outPath) {{
   "NO"
 }}
 
-"=== DIAG: base dir listing ==="
-try {{ Get-ChildItem -LiteralPath $base -Force | Select-Object Name,Length,LastWriteTime | Format-Table -AutoSize | Out-String }} catch {{ "(could not list base dir)" }}
+"=== DIAG: job dir listing ==="
+try {{ Get-ChildItem -LiteralPath $base -Force | Select-Object Name,Length,LastWriteTime | Format-Table -AutoSize | Out-String }} catch {{ "(could not list job dir)" }}
 
 "=== DIAG: task.log (last 200 lines) ==="
 if (Test-Path -LiteralPath $logPath) {{
@@ -322,14 +874,18 @@ if (Test-Path -LiteralPath $logPath) {{
 try {{ & $schtasks /Query /TN $taskName /V /FO LIST 2>&1 | Out-String }} catch {{ "(schtasks query failed)" }}
 """,
         )
-        raise TimeoutError(f"Timed out waiting for output.json after {wait_seconds}s\n{diag}")
+        raise TimeoutError(f"Timed out waiting for output.json of job {job_id} after {wait_seconds}s\n{diag}")
     finally:
         tlog("Cleaning up scheduled task")
+        # The job folder is kept after a timeout (task.log) until the stale sweep.
         cleanup = f"""
     $taskName = {ps_quote(task_name)}
     $schtasks = Join-Path $env:WINDIR 'System32\\schtasks.exe'
     try {{ & $schtasks /End /TN $taskName *> $null }} catch {{}}
     try {{ & $schtasks /Delete /TN $taskName /F *> $null }} catch {{}}
+    if (Test-Path -LiteralPath {ps_quote(out_path)}) {{
+      Remove-Item -LiteralPath {ps_quote(job_dir)} -Recurse -Force -ErrorAction SilentlyContinue
+    }}
     """
         run_ps(session, cleanup)
 
@@ -0,0 +1,483 @@
+"""Bounded, thread-safe pool of reusable WinRM sessions for the gateway.
+
+`winrm.Session.run_cmd` closes the underlying `requests` session after every
+command, so each call pays for a new TCP connection, TLS handshake and NTLM
+auth round trip. The pool keeps sessions (and their HTTP connections) alive
+between calls:
+
+- sessions are keyed by endpoint + credentials + transport
+- at most `max_size` sessions exist per key; callers wait for a free one
+- sessions idle for longer than `idle_timeout` are evicted
+- a session that sat idle for `health_check_after` seconds is probed on checkout
+- `prewarm()` opens connections up front so the first n8n call is not cold
+- `stats()` reports hit rate and checkout wait time
+- optionally, each session keeps a warm remote shell (see `PooledSession`)
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import threading
+import time
+from base64 import b64encode
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Iterator
+
+import winrm
+from winrm.exceptions import WinRMOperationTimeoutError
+
+logger = logging.getLogger("winrm-gateway.pool")
+
+
+# cmd.exe rejects command lines longer than 8191 characters, which an
+# -EncodedCommand (UTF-16 + base64) hits at roughly 3 KB of script.
+MAX_COMMAND_LINE = 8000
+# pywinrm caps envelopes at 150 KB (MaxEnvelopeSize 153600) and base64s the
+# stdin stream inside it, so each send stays well under 150 KB * 3/4.
+STDIN_CHUNK_BYTES = 96 * 1024
+
+# Small fixed command that reads the real script (base64 UTF-8) from stdin
+# and dot-sources it, so `exit N` and $LASTEXITCODE behave as if inline.
+_STDIN_BOOTSTRAP = (
+    "$s = [Console]::In.ReadToEnd(); "
+    ". ([scriptblock]::Create([Text.Encoding]::UTF8.GetString([Convert]::FromBase64String($s.Trim()))))"
+)
+STDIN_BOOTSTRAP_COMMAND = "powershell -NoProfile -NonInteractive -encodedcommand " + b64encode(
+    _STDIN_BOOTSTRAP.encode("utf_16_le")
+).decode("ascii")
+
+
+def ps_command(script: str) -> tuple[str, bytes | None]:
+    """Command line (and stdin payload, if any) that runs `script` remotely.
+
+    Short scripts go inline with -EncodedCommand like `Session.run_ps`;
+    longer ones are sent on stdin behind a small bootstrap.
+    """
+    encoded = b64encode(script.encode("utf_16_le")).decode("ascii")
+    command = f"powershell -encodedcommand {encoded}"
+    if len(command) <= MAX_COMMAND_LINE:
+        return command, None
+    return STDIN_BOOTSTRAP_COMMAND, b64encode(script.encode("utf-8")) + b"\r\n"
+
+
+class PoolTimeoutError(RuntimeError):
+    """Raised when no session becomes available within the checkout timeout."""
+
+
+class PooledSession(winrm.Session):
+    """`winrm.Session` that keeps its HTTP connection open between commands.
+
+    With `reuse_shell=True` the remote shell is also kept open and successive
+    commands run inside it, saving the Create/Delete shell round trips. The
+    shell is recycled after `max_commands` commands or after any error.
+    """
+
+    def __init__(self, target, auth, *, reuse_shell: bool = False, max_commands: int = 50, **kwargs) -> None:
+        super().__init__(target, auth, **kwargs)
+        self.reuse_shell = reuse_shell
+        self.max_commands = max_commands
+        self._shell_id: str | None = None
+        self._shell_commands = 0
+        self.shells_opened = 0
+
+    def _open_shell(self) -> str:
+        shell_id = self.protocol.open_shell()
+        self.shells_opened += 1
+        return shell_id
+
+    def _send_stdin(self, shell_id: str, command_id: str, stdin: bytes | None) -> None:
+        if stdin is None:
+            return
+        for i in range(0, max(len(stdin), 1), STDIN_CHUNK_BYTES):
+            chunk = stdin[i : i + STDIN_CHUNK_BYTES]
+            self.protocol.send_command_input(shell_id, command_id, chunk, end=i + STDIN_CHUNK_BYTES >= len(stdin))
+
+    def _run_in_shell(self, shell_id: str, command: str, args=(), stdin: bytes | None = None) -> winrm.Response:
+        command_id = self.protocol.run_command(shell_id, command, args)
+        self._send_stdin(shell_id, command_id, stdin)
+        rs = winrm.Response(self.protocol.get_command_output(shell_id, command_id))
+        self.protocol.cleanup_command(shell_id, command_id)
+        return rs
+
+    def _execute(self, command: str, args=(), stdin: bytes | None = None) -> winrm.Response:
+        if not self.reuse_shell:
+            shell_id = self._open_shell()
+            try:
+                return self._run_in_shell(shell_id, command, args, stdin)
+            finally:
+                # close_session=False keeps the keep-alive connection in the pool.
+                self.protocol.close_shell(shell_id, close_session=False)
+
+        fresh = self._shell_id is None
+        if fresh:
+            self._shell_id = self._open_shell()
+            self._shell_commands = 0
+        try:
+            command_id = self.protocol.run_command(self._shell_id, command, args)
+        except Exception:
+            self.close_shell()
+            if fresh:
+                raise
+            # The warm shell most likely hit the server-side idle timeout.
+            # Nothing ran yet, so retry once in a new shell.
+            return self._execute(command, args, stdin)
+        try:
+            self._send_stdin(self._shell_id, command_id, stdin)
+            rs = winrm.Response(self.protocol.get_command_output(self._shell_id, command_id))
+            self.protocol.cleanup_command(self._shell_id, command_id)
+        except Exception:
+            self.close_shell()
+            raise
+        self._shell_commands += 1
+        if self._shell_commands >= self.max_commands:
+            self.close_shell()
+        return rs
+
+    def run_cmd(self, command, args=()):
+        return self._execute(command, args)
+
+    def run_ps(self, script: str) -> winrm.Response:
+        command, stdin = ps_command(script)
+        rs = self._execute(command, (), stdin)
+        if len(rs.std_err):
+            rs.std_err = self._clean_error_msg(rs.std_err)
+        return rs
+
+    def stream_ps(self, script: str) -> Iterator[tuple[bytes, bytes, int, bool]]:
+        """Run a PowerShell script and yield output as WinRM receives it.
+
+        Yields `(stdout, stderr, status_code, done)` tuples; `status_code` is
+        only meaningful on the final (`done=True`) item. Streams always get a
+        dedicated shell so an abandoned stream cannot poison the warm shell;
+        closing the generator early terminates the remote command.
+        """
+        command, stdin = ps_command(script)
+        shell_id = self._open_shell()
+        command_id = None
+        try:
+            command_id = self.protocol.run_command(shell_id, command)
+            self._send_stdin(shell_id, command_id, stdin)
+            done = False
+            while not done:
+                try:
+                    stdout, stderr, status, done = self.protocol.get_command_output_raw(shell_id, command_id)
+                except WinRMOperationTimeoutError:
+                    # No output within the operation timeout; keep waiting.
+                    continue
+                if stdout or stderr or done:
+                    yield stdout, stderr, status, done
+        finally:
+            try:
+                if command_id is not None:
+                    self.protocol.cleanup_command(shell_id, command_id)
+            finally:
+                self.protocol.close_shell(shell_id, close_session=False)
+
+    def close_shell(self) -> None:
+        """Delete the warm remote shell, if any (best-effort)."""
+        shell_id, self._shell_id = self._shell_id, None
+        self._shell_commands = 0
+        if shell_id is None:
+            return
+        try:
+            self.protocol.close_shell(shell_id, close_session=False)
+        except Exception as e:
+            logger.debug("Closing remote shell %s failed: %s", shell_id, e)
+
+    def ping(self) -> None:
+        """Cheap liveness probe on the live connection."""
+        if self._shell_id is not None:
+            # A warm shell is probed by running a trivial command in it.
+            self.run_cmd("echo", ("ok",))
+            return
+        shell_id = self._open_shell()
+        self.protocol.close_shell(shell_id, close_session=False)
+
+    def close(self) -> None:
+        self.close_shell()
+        try:
+            self.protocol.transport.close_session()
+        except Exception:
+            pass
+
+
+@dataclass
+class _Entry:
+    session: PooledSession
+    created: float = field(default_factory=time.monotonic)
+    last_used: float = field(default_factory=time.monotonic)
+
+
+@dataclass
+class _Bucket:
+    idle: list[_Entry] = field(default_factory=list)
+    total: int = 0
+
+
+def pool_key(endpoint: str, username: str, password: str, transport: str = "plaintext") -> tuple[str, str, str, str]:
+    # Never keep the plain password in the key (it shows up in stats/logs).
+    digest = hashlib.sha256(password.encode("utf-8")).hexdigest()[:16]
+    return (endpoint, username, digest, transport)
+
+
+class SessionPool:
+    def __init__(
+        self,
+        *,
+        max_size: int = 4,
+        idle_timeout: float = 300.0,
+        health_check_after: float = 60.0,
+        checkout_timeout: float = 30.0,
+        server_cert_validation: str = "ignore",
+        reuse_shell: bool = False,
+        shell_max_commands: int = 50,
+    ) -> None:
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_after = health_check_after
+        self.checkout_timeout = checkout_timeout
+        self.server_cert_validation = server_cert_validation
+        self.reuse_shell = reuse_shell
+        self.shell_max_commands = shell_max_commands
+
+        self._lock = threading.Condition()
+        self._buckets: dict[tuple[str, str, str, str], _Bucket] = {}
+        self._closed = False
+
+        self._hits = 0
+        self._misses = 0
+        self._created = 0
+        self._evicted = 0
+        self._failed_health_checks = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    # -------------------------------------------------------------------------
+    # Session lifecycle
+    # -------------------------------------------------------------------------
+    def _new_session(self, endpoint: str, username: str, password: str, transport: str) -> PooledSession:
+        return PooledSession(
+            endpoint,
+            auth=(username, password),
+            transport=transport,
+            server_cert_validation=self.server_cert_validation,
+            reuse_shell=self.reuse_shell,
+            max_commands=self.shell_max_commands,
+        )
+
+    def _evict_idle_locked(self, bucket: _Bucket, now: float) -> list[_Entry]:
+        stale = [e for e in bucket.idle if now - e.last_used > self.idle_timeout]
+        if stale:
+            bucket.idle = [e for e in bucket.idle if e not in stale]
+            bucket.total -= len(stale)
+            self._evicted += len(stale)
+        return stale
+
+    def _checkout(self, endpoint: str, username: str, password: str, transport: str) -> _Entry:
+        key = pool_key(endpoint, username, password, transport)
+        deadline = time.monotonic() + self.checkout_timeout
+        waited = False
+        wait_start = time.monotonic()
+
+        while True:
+            stale: list[_Entry] = []
+            entry: _Entry | None = None
+            create = False
+            with self._lock:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed")
+                bucket = self._buckets.setdefault(key, _Bucket())
+                stale = self._evict_idle_locked(bucket, time.monotonic())
+                if bucket.idle:
+                    # LIFO keeps the hottest connection in use.
+                    entry = bucket.idle.pop()
+                    self._hits += 1
+                elif bucket.total < self.max_size:
+                    bucket.total += 1
+                    self._misses += 1
+                    create = True
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeoutError(
+                            f"No WinRM session available for {endpoint} after {self.checkout_timeout}s"
+                        )
+                    if not waited:
+                        waited = True
+                        self._waits += 1
+                    self._lock.wait(remaining)
+
+                if waited and (entry is not None or create):
+                    elapsed = time.monotonic() - wait_start
+                    self._wait_seconds += elapsed
+                    self._max_wait_seconds = max(self._max_wait_seconds, elapsed)
+
+            for e in stale:
+                e.session.close()
+
+            if create:
+                try:
+                    session = self._new_session(endpoint, username, password, transport)
+                except Exception:
+                    self._release_slot(key)
+                    raise
+                with self._lock:
+                    self._created += 1
+                return _Entry(session)
+
+            if entry is not None:
+                if time.monotonic() - entry.last_used > self.health_check_after:
+                    try:
+                        entry.session.ping()
+                    except Exception as e:
+                        logger.warning("Discarding unhealthy WinRM session for %s: %s", endpoint, e)
+                        entry.session.close()
+                        with self._lock:
+                            self._failed_health_checks += 1
+                        self._release_slot(key)
+                        continue
+                return entry
+
+    def _release_slot(self, key: tuple[str, str, str, str]) -> None:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.total -= 1
+            self._lock.notify()
+
+    def _checkin(self, key: tuple[str, str, str, str], entry: _Entry, *, discard: bool) -> None:
+        if discard or self._closed:
+            entry.session.close()
+            self._release_slot(key)
+            return
+        entry.last_used = time.monotonic()
+        with self._lock:
+            self._buckets[key].idle.append(entry)
+            self._lock.notify()
+
+    @contextmanager
+    def session(
+        self,
+        endpoint: str,
+        username: str,
+        password: str,
+        transport: str = "plaintext",
+    ) -> Iterator[PooledSession]:
+        """Check out a session; it is returned to the pool when the block exits.
+
+        A session whose block raised is discarded rather than reused, since the
+        connection may be half-broken.
+        """
+        key = pool_key(endpoint, username, password, transport)
+        entry = self._checkout(endpoint, username, password, transport)
+        try:
+            yield entry.session
+        except BaseException:
+            # Includes GeneratorExit from an abandoned stream_ps() consumer.
+            self._checkin(key, entry, discard=True)
+            raise
+        else:
+            self._checkin(key, entry, discard=False)
+
+    # -------------------------------------------------------------------------
+    # Maintenance
+    # -------------------------------------------------------------------------
+    def prewarm(self, endpoint: str, username: str, password: str, transport: str = "plaintext", count: int = 1) -> int:
+        """Open up to `count` authenticated connections ahead of the first request."""
+        key = pool_key(endpoint, username, password, transport)
+        warmed = 0
+        entries: list[_Entry] = []
+        try:
+            for _ in range(min(count, self.max_size)):
+                with self._lock:
+                    bucket = self._buckets.setdefault(key, _Bucket())
+                    if bucket.total >= self.max_size:
+                        break
+                    bucket.total += 1
+                try:
+                    session = self._new_session(endpoint, username, password, transport)
+                    session.ping()
+                except Exception as e:
+                    logger.warning("Pre-warming WinRM session for %s failed: %s", endpoint, e)
+                    self._release_slot(key)
+                    break
+                with self._lock:
+                    self._created += 1
+                entries.append(_Entry(session))
+                warmed += 1
+        finally:
+            for entry in entries:
+                self._checkin(key, entry, discard=False)
+        return warmed
+
+    def start_reaper(self, interval: float = 60.0) -> threading.Thread:
+        """Evict idle sessions in the background every `interval` seconds."""
+
+        def _reap() -> None:
+            while not self._closed:
+                time.sleep(interval)
+                try:
+                    evicted = self.evict_idle()
+                    if evicted:
+                        logger.info("Evicted %d idle WinRM session(s)", evicted)
+                except Exception:
+                    logger.exception("Idle session eviction failed")
+
+        t = threading.Thread(target=_reap, name="winrm-pool-reaper", daemon=True)
+        t.start()
+        return t
+
+    def evict_idle(self) -> int:
+        """Drop sessions idle past `idle_timeout`; returns how many were closed."""
+        stale: list[_Entry] = []
+        with self._lock:
+            now = time.monotonic()
+            for bucket in self._buckets.values():
+                stale.extend(self._evict_idle_locked(bucket, now))
+        for e in stale:
+            e.session.close()
+        return len(stale)
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            entries = [e for b in self._buckets.values() for e in b.idle]
+            for b in self._buckets.values():
+                b.total -= len(b.idle)
+                b.idle = []
+            self._lock.notify_all()
+        for e in entries:
+            e.session.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            checkouts = self._hits + self._misses
+            return {
+                "max_size": self.max_size,
+                "reuse_shell": self.reuse_shell,
+                "checkouts": checkouts,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": round(self._hits / checkouts, 4) if checkouts else 0.0,
+                "created": self._created,
+                "evicted": self._evicted,
+                "failed_health_checks": self._failed_health_checks,
+                "waits": self._waits,
+                "wait_seconds_total": round(self._wait_seconds, 4),
+                "wait_seconds_avg": round(self._wait_seconds / self._waits, 4) if self._waits else 0.0,
+                "wait_seconds_max": round(self._max_wait_seconds, 4),
+                "endpoints": [
+                    {
+                        "endpoint": key[0],
+                        "username": key[1],
+                        "transport": key[3],
+                        "open": bucket.total,
+                        "idle": len(bucket.idle),
+                        "in_use": bucket.total - len(bucket.idle),
+                    }
+                    for key, bucket in self._buckets.items()
+                ],
+            }